@@ -0,0 +1,1215 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the Customer Logging System demo server
+Run one with: python benchmark.py <name> [options]
+"""
+
+import argparse
+import csv
+import html.parser
+import http.client
+import http.server
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+from urllib.parse import urlencode, urlsplit
+
+import demo_server
+
+
+class QuietHandler(demo_server.CustomerLoggingHandler):
+    """Request handler that does not log every request to stderr"""
+
+    def log_message(self, format, *args):
+        pass
+
+
+class BufferedHandler(QuietHandler):
+    """Handler that renders streamed pages into one string before sending"""
+
+    def _send_stream(self, chunks, content_type='text/html'):
+        self._send_page(list(chunks), content_type=content_type)
+
+
+class CopyingHandler(QuietHandler):
+    """Handler that reads static files into Python and writes them out, instead of sendfile"""
+
+    def _send_file_range(self, file, offset, count):
+        file.seek(offset)
+        self.wfile.write(file.read(count))
+
+
+class UninstrumentedHandler(QuietHandler):
+    """Handler that records no request metrics, for measuring what they cost"""
+
+    def setup(self):
+        http.server.BaseHTTPRequestHandler.setup(self)
+
+    def parse_request(self):
+        return http.server.BaseHTTPRequestHandler.parse_request(self)
+
+    def handle_one_request(self):
+        http.server.BaseHTTPRequestHandler.handle_one_request(self)
+
+
+def start_server(server_class=demo_server.ThreadPoolHTTPServer, handler_class=QuietHandler, **server_options):
+    """Start a demo server on a free local port in a background thread"""
+    httpd = server_class(('127.0.0.1', 0), handler_class, **server_options)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    return httpd
+
+
+def stop_server(httpd):
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def request(port, method, path, body=None, headers=None):
+    """Send one request on a fresh connection and return (status, seconds)"""
+    started = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.status, time.perf_counter() - started
+
+
+def login(port, username='admin', password='admin123'):
+    body = urlencode({'username': username, 'password': password})
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    return request(port, 'POST', '/login', body, headers)
+
+
+def session_headers(username='admin'):
+    """Cookie header for a new session, for requests to an in-process server"""
+    user = demo_server.USERS.find_by_username(username)
+    return {'Cookie': f'{demo_server.SESSION_COOKIE}={demo_server.SESSIONS.create(user["id"])}'}
+
+
+def unthrottled_logins():
+    """Lift the login limits for benchmarks that log in as fast as they can"""
+    demo_server.LOGIN_IP_BUCKETS = demo_server.TokenBuckets(rate=1e9, burst=1e9)
+    demo_server.LOGIN_USER_BUCKETS = demo_server.TokenBuckets(rate=1e9, burst=1e9)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report_latencies(label, samples):
+    print(f'  {label:<28} n={len(samples):<5} '
+          f'p50={percentile(samples, 0.50) * 1000:8.2f} ms  '
+          f'p95={percentile(samples, 0.95) * 1000:8.2f} ms  '
+          f'max={max(samples) * 1000:8.2f} ms')
+
+
+def bench_concurrency(args):
+    """Dashboard GET latency while other clients are busy logging in"""
+    unthrottled_logins()
+    modes = [('single', {}), ('pool', {'workers': args.workers, 'queue_size': args.queue_size})]
+    for mode, options in modes:
+        httpd = start_server(demo_server.SERVER_MODES[mode], **options)
+        port = httpd.server_address[1]
+        print(f'{mode} server')
+        headers = session_headers()
+        idle = [request(port, 'GET', '/', headers=headers)[1] for _ in range(args.requests)]
+        report_latencies('dashboard, idle', idle)
+
+        stop = threading.Event()
+        logins = []
+
+        def keep_logging_in():
+            while not stop.is_set():
+                logins.append(login(port)[1])
+
+        clients = [threading.Thread(target=keep_logging_in) for _ in range(args.login_clients)]
+        for client in clients:
+            client.start()
+        time.sleep(0.2)
+        busy = [request(port, 'GET', '/', headers=headers)[1] for _ in range(args.requests)]
+        stop.set()
+        for client in clients:
+            client.join()
+        report_latencies(f'dashboard, {args.login_clients} logging in', busy)
+        report_latencies('login', logins)
+        stop_server(httpd)
+
+
+def bench_login_rate(args):
+    """Login throughput with bcrypt on the request threads and in the process pool"""
+    unthrottled_logins()
+    for label in ('inline', 'process pool'):
+        if label == 'process pool':
+            demo_server.start_password_pool(args.bcrypt_workers)
+        httpd = start_server(workers=args.clients, queue_size=args.clients * 2)
+        port = httpd.server_address[1]
+        deadline = time.perf_counter() + args.seconds
+        latencies = []
+
+        def keep_logging_in():
+            while time.perf_counter() < deadline:
+                status, elapsed = login(port)
+                assert status == 302, status
+                latencies.append(elapsed)
+
+        started = time.perf_counter()
+        clients = [threading.Thread(target=keep_logging_in) for _ in range(args.clients)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - started
+        stop_server(httpd)
+        demo_server.stop_password_pool()
+        print(f'{label}: {len(latencies) / elapsed:7.1f} logins/s '
+              f'({args.clients} clients, {len(latencies)} logins)')
+        report_latencies('login', latencies)
+
+
+def bench_sessions(args):
+    """Per-request session check against checking the password with bcrypt on every request"""
+    sessions = demo_server.SessionStore(capacity=args.sessions)
+    previous, demo_server.SESSIONS = demo_server.SESSIONS, sessions
+    for user_id in range(args.sessions):
+        sessions.create(user_id)
+    cookie = sessions.create(1)
+    handler = QuietHandler.__new__(QuietHandler)
+    handler.headers = http.client.HTTPMessage()
+    handler.headers['Cookie'] = f'theme=dark; {demo_server.SESSION_COOKIE}={cookie}; lang=en'
+
+    def per_call(func):
+        loops, total = timeit.Timer(func).autorange()
+        return total / loops * 1e6
+
+    print(f'{len(sessions)} sessions in the table')
+    print(f'  signed-in check, _session_user    {per_call(handler._session_user):9.2f} us')
+    print(f'  SessionStore.user_id               {per_call(lambda: sessions.user_id(cookie)):9.2f} us')
+    forged = cookie[:-4] + 'AAAA'
+    print(f'  forged cookie refused              {per_call(lambda: sessions.user_id(forged)):9.2f} us')
+    print(f'  create, evicting the LRU session   {per_call(lambda: sessions.create(1)):9.2f} us')
+    print(f'  revoke_user, scanning the table    {per_call(lambda: sessions.revoke_user(-1)):9.2f} us')
+    hashed = demo_server.USERS.find_by_username('admin')['password']
+    started = time.perf_counter()
+    demo_server.verify_password('admin123', hashed)
+    print(f'  bcrypt verify_password             {(time.perf_counter() - started) * 1e6:9.0f} us')
+    demo_server.SESSIONS = previous
+
+
+def bench_login_flood(args):
+    """bcrypt work done while clients flood /login with wrong passwords"""
+    verifications = []
+    verify_password = demo_server.verify_password
+
+    def counted_verify(password, hashed):
+        started = time.perf_counter()
+        try:
+            return verify_password(password, hashed)
+        finally:
+            verifications.append(time.perf_counter() - started)
+
+    demo_server.verify_password = counted_verify
+    for label in ('unthrottled', 'throttled'):
+        if label == 'unthrottled':
+            unthrottled_logins()
+        else:
+            demo_server.LOGIN_IP_BUCKETS = demo_server.TokenBuckets(demo_server.LOGIN_IP_RATE,
+                                                                    demo_server.LOGIN_IP_BURST)
+            demo_server.LOGIN_USER_BUCKETS = demo_server.TokenBuckets(demo_server.LOGIN_USER_RATE,
+                                                                      demo_server.LOGIN_USER_BURST)
+        httpd = start_server(workers=args.attackers, queue_size=args.attackers * 2)
+        port = httpd.server_address[1]
+        verifications.clear()
+        statuses = []
+        stop = threading.Event()
+
+        def attack():
+            while not stop.is_set():
+                statuses.append(login(port, password='wrong')[0])
+
+        attackers = [threading.Thread(target=attack) for _ in range(args.attackers)]
+        started = time.perf_counter()
+        for attacker in attackers:
+            attacker.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for attacker in attackers:
+            attacker.join()
+        elapsed = time.perf_counter() - started
+        stop_server(httpd)
+        print(f'{label + ":":<13} {len(statuses) / elapsed:8.1f} attempts/s  '
+              f'{statuses.count(429) / max(len(statuses), 1):6.1%} answered 429  '
+              f'{len(verifications) / elapsed:6.1f} bcrypt checks/s  '
+              f'{sum(verifications) / elapsed:5.2f} s in bcrypt per second  ({args.attackers} clients)')
+    demo_server.verify_password = verify_password
+
+
+def bench_bcrypt_cost(args):
+    """Password check time per bcrypt cost, the calibrated cost, and login latency around a rehash"""
+    for cost in args.costs:
+        hashed = demo_server.hash_password('admin123', cost)
+        started = time.perf_counter()
+        demo_server.verify_password('admin123', hashed)
+        print(f'cost {cost:>2}  verify {(time.perf_counter() - started) * 1000:8.1f} ms')
+    for target in args.targets:
+        started = time.perf_counter()
+        cost = demo_server.calibrate_bcrypt_cost(target)
+        print(f'target {target * 1000:6.0f} ms  calibrated cost {cost:>2} '
+              f'(calibration took {(time.perf_counter() - started) * 1000:.0f} ms)')
+
+    unthrottled_logins()
+    cost = demo_server.configure_bcrypt_cost(target=args.targets[0])
+    httpd = start_server()
+    port = httpd.server_address[1]
+    user = demo_server.USERS.find_by_username('admin')
+    print(f'admin hash at cost {demo_server.bcrypt_cost(user["password"])}, configured cost {cost}')
+    for attempt in range(1, 4):
+        status, elapsed = login(port)
+        print(f'  login {attempt}  status {status}  {elapsed * 1000:8.1f} ms  '
+              f'stored cost {demo_server.bcrypt_cost(user["password"])}')
+        # Let the background rehash finish before the next attempt
+        while demo_server._REHASHING:
+            time.sleep(0.01)
+    stop_server(httpd)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def time_until_listening(command, port, timeout=30):
+    """Start a server process and return seconds until it accepts connections"""
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.002)
+        raise RuntimeError(f'server did not listen on port {port} within {timeout}s')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def bench_startup(args):
+    """Import time of demo_server and time until a fresh process is listening"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    import_code = ('import time; started = time.perf_counter(); import demo_server; '
+                   'print(time.perf_counter() - started)')
+    imports = []
+    for _ in range(args.runs):
+        output = subprocess.check_output([sys.executable, '-c', import_code], cwd=here)
+        imports.append(float(output))
+    print(f'import demo_server:           median {statistics.median(imports) * 1000:8.2f} ms '
+          f'over {args.runs} runs')
+
+    server = os.path.join(here, 'demo_server.py')
+    for label, extra in (('inline bcrypt', ['--bcrypt-workers', '0']), ('bcrypt process pool', [])):
+        samples = []
+        for _ in range(args.runs):
+            port = free_port()
+            samples.append(time_until_listening([sys.executable, server, '--port', str(port)] + extra, port))
+        print(f'listening, {label + ":":<22} median {statistics.median(samples) * 1000:8.2f} ms '
+              f'over {args.runs} runs')
+
+
+def fake_users(count):
+    return [{"username": f"user{n}", "password": "x", "full_name": f"User {n}",
+             "email": f"user{n}@example.com", "is_admin": False, "is_active": True}
+            for n in range(count)]
+
+
+def bench_user_lookup(args):
+    """Login lookup cost: linear scan of a user list vs the indexed UserStore"""
+    for size in args.sizes:
+        users = fake_users(size)
+        store = demo_server.UserStore(users)
+        wanted = users[-1]["username"]
+
+        def scan():
+            for user in users:
+                if user["username"] == wanted:
+                    return user
+
+        def indexed():
+            return store.find_by_username(wanted)
+
+        for label, func in (('list scan', scan), ('UserStore', indexed)):
+            loops, total = timeit.Timer(func).autorange()
+            print(f'{size:>8} users  {label:<10} {total / loops * 1e6:12.3f} us/lookup')
+
+
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda',
+               'David', 'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+              'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas']
+CITIES = ['New York', 'Chicago', 'Houston', 'Phoenix', 'Philadelphia', 'San Antonio', 'San Diego',
+          'Dallas', 'Austin', 'Jacksonville', 'Columbus', 'Charlotte', 'Denver', 'Seattle']
+VEHICLES = [('Toyota', 'Camry'), ('Honda', 'Civic'), ('Ford', 'F-150'), ('Chevrolet', 'Silverado'),
+            ('Nissan', 'Altima'), ('Jeep', 'Wrangler'), ('Hyundai', 'Elantra'), ('Kia', 'Sorento')]
+SALESPEOPLE = ['Jane Smith', 'Bob Johnson', 'Alice Brown', 'Carlos Diaz', 'Priya Patel', 'Tom Lee']
+
+
+def fake_customers(count, seed=1):
+    """Yield count customers with realistic looking fields, oldest first"""
+    rng = random.Random(seed)
+    started = time.mktime((2020, 1, 1, 0, 0, 0, 0, 0, -1))
+    span = time.time() - started
+    for number in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        make, model = rng.choice(VEHICLES)
+        moment = started + span * number / count
+        yield {
+            'user': 'admin',
+            'name': f'{first} {last}',
+            'phone': f'({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(0, 9999):04d}',
+            'email': f'{first.lower()}.{last.lower()}{number}@example.com',
+            'city': rng.choice(CITIES),
+            'stackno': f'{rng.choice("ABCDEFGH")}{rng.randint(100, 999)}',
+            'sales1': rng.choice(SALESPEOPLE),
+            'sales2': rng.choice(SALESPEOPLE + [''] * 4),
+            'closer': rng.choice(SALESPEOPLE),
+            'newused': rng.choice(['New', 'Used']),
+            'year': str(rng.randint(2010, 2024)),
+            'make': make,
+            'model': model,
+            'trade': rng.choice(['Yes', 'No']),
+            'demo': rng.choice(['Yes', 'No']),
+            'writeup': '',
+            'results': '',
+            'notes': '',
+            'datetime': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(moment)),
+        }
+
+
+def fill_store(store, count):
+    """Insert count fake customers in batches, filling the search table too"""
+    customers = fake_customers(count)
+    while store.add_many(itertools.islice(customers, 10000)):
+        pass
+
+
+def temporary_store(count):
+    """Create a CustomerStore in a temporary directory holding count customers"""
+    directory = tempfile.mkdtemp(prefix='customer-bench-')
+    store = demo_server.CustomerStore(os.path.join(directory, 'customers.db'))
+    started = time.perf_counter()
+    fill_store(store, count)
+    print(f'loaded {count} customers in {time.perf_counter() - started:.1f} s')
+    return store, directory
+
+
+def drop_store(store, directory):
+    store.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_search(args):
+    """Customer search: FTS5 trigram table vs the LIKE scans of Customer::search"""
+    store, directory = temporary_store(args.customers)
+    conn = store.connection()
+    for field, term in args.queries:
+        columns = demo_server.SEARCH_FIELDS.get(field, demo_server.SEARCH_FIELDS['all'])
+        token = demo_server.create_search_token(term)
+        where = ' OR '.join(f'{column} LIKE ?' for column in columns)
+        sql = f'SELECT id FROM customers WHERE {where} ORDER BY datetime DESC, id DESC'
+        params = [f'%{token}%'] * len(columns)
+
+        started = time.perf_counter()
+        scanned = [row['id'] for row in conn.execute(sql, params)]
+        scan_time = time.perf_counter() - started
+        started = time.perf_counter()
+        found = store.search([(token, columns)])
+        index_time = time.perf_counter() - started
+        assert found == scanned, (field, term)
+        print(f'  {field:<6} {term!r:<14} {len(found):>8} matches  '
+              f'scan {scan_time * 1000:9.2f} ms  index {index_time * 1000:9.2f} ms  '
+              f'speedup {scan_time / index_time:7.1f}x')
+    drop_store(store, directory)
+
+
+def bench_suggest(args):
+    """Typeahead latency of the prefix index for keystroke-sized prefixes"""
+    store, directory = temporary_store(args.customers)
+    started = time.perf_counter()
+    index = store.attach_index(demo_server.SuggestIndex())
+    print(f'built prefix index in {time.perf_counter() - started:.1f} s')
+
+    rng = random.Random(2)
+    samples = list(fake_customers(1000, seed=3))
+    for field in demo_server.SUGGEST_FIELDS:
+        latencies = []
+        for customer in rng.sample(samples, args.queries):
+            value = customer[field]
+            if field == 'phone':
+                value = demo_server.normalize_phone(value)
+            prefix = value[:rng.randint(1, min(6, len(value)))]
+            started = time.perf_counter()
+            index.suggest(prefix, field, args.limit)
+            latencies.append(time.perf_counter() - started)
+        report_latencies(f'{field} prefix', latencies)
+
+    adds = []
+    for customer in fake_customers(args.queries, seed=4):
+        started = time.perf_counter()
+        store.add(customer)
+        adds.append(time.perf_counter() - started)
+    report_latencies('add customer', adds)
+    drop_store(store, directory)
+
+
+def bench_phone_lookup(args):
+    """Phone lookups: PhoneIndex exact and suffix lookups vs LIKE on phone_token"""
+    store, directory = temporary_store(args.customers)
+    index = store.attach_index(demo_server.PhoneIndex())
+    conn = store.connection()
+    phones = [customer['phone'] for customer in fake_customers(args.customers)][::max(1, args.customers // 50)]
+    cases = [
+        ('exact', lambda phone: index.lookup(phone),
+         'SELECT id FROM customers WHERE phone_token = ?', lambda phone: phone),
+        ('last 7', lambda phone: index.lookup_suffix(demo_server.normalize_phone(phone)[-7:]),
+         'SELECT id FROM customers WHERE phone_token LIKE ?', lambda phone: f'%{phone[-8:]}'),
+        ('last 4', lambda phone: index.lookup_suffix(demo_server.normalize_phone(phone)[-4:]),
+         'SELECT id FROM customers WHERE phone_token LIKE ?', lambda phone: f'%{phone[-4:]}'),
+    ]
+    for label, lookup, sql, param in cases:
+        started = time.perf_counter()
+        for phone in phones:
+            lookup(phone)
+        index_time = (time.perf_counter() - started) / len(phones)
+        started = time.perf_counter()
+        for phone in phones:
+            conn.execute(sql, (param(phone),)).fetchall()
+        sql_time = (time.perf_counter() - started) / len(phones)
+        print(f'  {label:<7} PhoneIndex {index_time * 1e6:10.2f} us   SQL {sql_time * 1e6:10.2f} us')
+    drop_store(store, directory)
+
+
+def bench_pagination(args):
+    """Customer list pages at increasing depth: keyset cursors vs LIMIT/OFFSET"""
+    store, directory = temporary_store(args.customers)
+    conn = store.connection()
+    size = args.page_size
+    print(f'{"page":>8} {"OFFSET":>12} {"keyset":>12}')
+    for page in args.pages:
+        offset = page * size
+        if offset >= args.customers:
+            break
+        # The row before the page is what a "next" link would carry as its cursor
+        previous = conn.execute('SELECT datetime, id FROM customers ORDER BY datetime DESC, id DESC '
+                                'LIMIT 1 OFFSET ?', (offset - 1,)).fetchone() if offset else None
+        after = (previous['datetime'], previous['id']) if previous else None
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            by_offset = conn.execute('SELECT * FROM customers ORDER BY datetime DESC, id DESC '
+                                     'LIMIT ? OFFSET ?', (size, offset)).fetchall()
+        offset_time = (time.perf_counter() - started) / args.repeat
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            by_keyset, _ = store.get_page(size, after=after)
+        keyset_time = (time.perf_counter() - started) / args.repeat
+        assert [row['id'] for row in by_offset] == [row['id'] for row in by_keyset]
+        print(f'{page:>8} {offset_time * 1000:9.3f} ms {keyset_time * 1000:9.3f} ms')
+    drop_store(store, directory)
+
+
+def measure_download(port, path, trace_memory=True):
+    """Fetch path and return (seconds to first byte, total seconds, bytes, peak Python memory)
+
+    Tracing memory slows allocation-heavy code a lot; time throughput with
+    trace_memory=False, which reports a peak of None.
+    """
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+    conn.request('GET', path, headers=session_headers())
+    response = conn.getresponse()
+    response.read(1)
+    first_byte = time.perf_counter() - started
+    size = 1
+    # Read and drop the body so only the server's memory shows in the peak
+    while True:
+        data = response.read(64 * 1024)
+        if not data:
+            break
+        size += len(data)
+    total = time.perf_counter() - started
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    conn.close()
+    return first_byte, total, size, peak
+
+
+def bench_streaming(args):
+    """Time to first byte and server memory for /customers?page_size=all"""
+    store, directory = temporary_store(args.customers)
+    previous_store, demo_server.CUSTOMERS = demo_server.CUSTOMERS, store
+    for label, handler_class in (('buffered', BufferedHandler), ('streamed', QuietHandler)):
+        httpd = start_server(handler_class=handler_class)
+        first_byte, total, size, peak = measure_download(httpd.server_address[1], '/customers?page_size=all')
+        stop_server(httpd)
+        print(f'{label:<9} first byte {first_byte * 1000:9.1f} ms  total {total * 1000:9.1f} ms  '
+              f'{size / 1e6:7.1f} MB  peak Python memory {peak / 1e6:7.1f} MB')
+    demo_server.CUSTOMERS = previous_store
+    drop_store(store, directory)
+
+
+def bench_export(args):
+    """NDJSON export throughput and server memory against scraping the HTML customer list"""
+    for size in args.sizes:
+        store, directory = temporary_store(size)
+        previous_store, demo_server.CUSTOMERS = demo_server.CUSTOMERS, store
+        httpd = start_server()
+        port = httpd.server_address[1]
+        for label, path in (('NDJSON export', '/api/customers/export'),
+                            ('HTML list', '/customers?page_size=all')):
+            first_byte, total, length, _ = measure_download(port, path, trace_memory=False)
+            peak = measure_download(port, path)[3]
+            print(f'{size:>8} customers  {label:<14} {size / total:9.0f} rows/s  '
+                  f'{length / 1e6:7.1f} MB  first byte {first_byte * 1000:6.1f} ms  '
+                  f'peak Python memory {peak / 1e6:6.1f} MB')
+        stop_server(httpd)
+        demo_server.CUSTOMERS = previous_store
+        drop_store(store, directory)
+
+
+def bench_csv_export(args):
+    """CSV export throughput and server memory for every customer and for a search"""
+    for size in args.sizes:
+        store, directory = temporary_store(size)
+        previous_store, demo_server.CUSTOMERS = demo_server.CUSTOMERS, store
+        httpd = start_server()
+        port = httpd.server_address[1]
+        search = '/search.csv?' + urlencode({'search_term': LAST_NAMES[0], 'search_field': 'name'})
+        for label, path in (('all customers', '/customers.csv'), ('name search', search)):
+            first_byte, total, length, _ = measure_download(port, path, trace_memory=False)
+            peak = measure_download(port, path)[3]
+            rows = size if path == '/customers.csv' else len(demo_server.search_customer_ids(LAST_NAMES[0], 'name'))
+            print(f'{size:>8} customers  {label:<14} {rows:>8} rows {rows / total:9.0f} rows/s  '
+                  f'{length / 1e6:7.1f} MB  first byte {first_byte * 1000:6.1f} ms  '
+                  f'peak Python memory {peak / 1e6:6.1f} MB')
+        stop_server(httpd)
+        demo_server.CUSTOMERS = previous_store
+        drop_store(store, directory)
+
+
+def write_import_files(directory, count):
+    """Write count fake customers as CSV and NDJSON; returns {format: path}"""
+    paths = {'csv': os.path.join(directory, 'customers.csv'),
+             'ndjson': os.path.join(directory, 'customers.ndjson')}
+    with open(paths['csv'], 'w', newline='') as csv_file, open(paths['ndjson'], 'w') as ndjson_file:
+        writer = csv.DictWriter(csv_file, fieldnames=demo_server.IMPORT_FIELDS)
+        writer.writeheader()
+        for customer in fake_customers(count):
+            writer.writerow(customer)
+            ndjson_file.write(json.dumps(customer) + '\n')
+    return paths
+
+
+def bench_import(args):
+    """Bulk import from CSV and NDJSON against adding customers one at a time"""
+    directory = tempfile.mkdtemp(prefix='customer-bench-')
+    paths = write_import_files(directory, args.rows)
+
+    store = demo_server.CustomerStore(os.path.join(directory, 'one-by-one.db'))
+    customers = list(fake_customers(args.baseline_rows))
+    started = time.perf_counter()
+    for customer in customers:
+        store.add(customer)
+    elapsed = time.perf_counter() - started
+    print(f'{args.baseline_rows:>8} customers  {"CustomerStore.add one at a time":<36} {args.baseline_rows / elapsed:9.0f} rows/s')
+    store.close()
+
+    for import_format, path in paths.items():
+        store = demo_server.CustomerStore(os.path.join(directory, f'cli-{import_format}.db'))
+        store.connection().execute(f'PRAGMA cache_size=-{demo_server.IMPORT_CACHE_KIB}')
+        started = time.perf_counter()
+        report = demo_server.import_customer_file(store, path, import_format)
+        elapsed = time.perf_counter() - started
+        print(f'{report["imported"]:>8} customers  {"command line import, " + import_format:<36} '
+              f'{report["imported"] / elapsed:9.0f} rows/s')
+        store.close()
+
+    # The endpoint also keeps the server's in-memory indexes up to date
+    for import_format, path in paths.items():
+        store = demo_server.CustomerStore(os.path.join(directory, f'server-{import_format}.db'))
+        previous_store, demo_server.CUSTOMERS = demo_server.CUSTOMERS, store
+        for index in (demo_server.SuggestIndex(), demo_server.PhoneIndex(),
+                      demo_server.DashboardAggregates(), demo_server.DateIndex()):
+            store.attach_index(index)
+        httpd = start_server()
+        conn = http.client.HTTPConnection('localhost', httpd.server_address[1])
+        content_type = 'text/csv' if import_format == 'csv' else 'application/x-ndjson'
+        with open(path, 'rb') as body:
+            started = time.perf_counter()
+            conn.request('POST', '/api/customers/import', body=body,
+                         headers={**session_headers(), 'Content-Type': content_type,
+                                  'Content-Length': str(os.path.getsize(path))})
+            report = json.loads(conn.getresponse().read())
+            elapsed = time.perf_counter() - started
+        print(f'{report["imported"]:>8} customers  {"POST /api/customers/import, " + import_format:<36} '
+              f'{report["imported"] / elapsed:9.0f} rows/s')
+        conn.close()
+        stop_server(httpd)
+        demo_server.CUSTOMERS = previous_store
+        store.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_dashboard(args):
+    """Dashboard numbers from the aggregates vs the COUNT(*) queries of Customer.pm"""
+    for size in args.sizes:
+        store, directory = temporary_store(size)
+        aggregates = store.attach_index(demo_server.DashboardAggregates())
+        conn = store.connection()
+        today = time.strftime('%Y-%m-%d')
+
+        def with_sql():
+            conn.execute('SELECT COUNT(*) AS count FROM customers').fetchone()
+            conn.execute('SELECT COUNT(*) AS count FROM customers WHERE DATE(datetime) = ?', (today,)).fetchone()
+
+        loops, total = timeit.Timer(with_sql).autorange()
+        sql_time = total / loops
+        loops, total = timeit.Timer(aggregates.summary).autorange()
+        aggregate_time = total / loops
+        print(f'{size:>8} customers  SQL counts {sql_time * 1000:9.3f} ms   '
+              f'aggregates {aggregate_time * 1000:9.3f} ms')
+        drop_store(store, directory)
+
+
+def bench_calendar(args):
+    """Month view render time with many customers in the month"""
+    directory = tempfile.mkdtemp(prefix='customer-bench-')
+    store = demo_server.CustomerStore(os.path.join(directory, 'customers.db'))
+    year, month = 2023, 5
+    customers = []
+    for number, customer in enumerate(fake_customers(args.customers)):
+        day = 1 + number % 31
+        customer['datetime'] = f'{year}-{month:02d}-{day:02d} {number % 24:02d}:{number % 60:02d}:00'
+        customers.append(store._row_values(customer))
+    columns = demo_server.CUSTOMER_COLUMNS
+    with store.connection() as conn:
+        conn.executemany(f"INSERT INTO customers ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                         ([row[column] for column in columns] for row in customers))
+    print(f'loaded {args.customers} customers into {year}-{month:02d}')
+
+    previous = demo_server.CUSTOMERS, demo_server.CALENDAR_INDEX
+    demo_server.CUSTOMERS = store
+    demo_server.CALENDAR_INDEX = store.attach_index(demo_server.DateIndex())
+    selected = demo_server.datetime.date(year, month, 15)
+    loops, total = timeit.Timer(lambda: demo_server.render_calendar(year, month, selected)).autorange()
+    print(f'render month with day list:  {total / loops * 1000:8.3f} ms')
+    loops, total = timeit.Timer(lambda: demo_server.render_calendar(year, month)).autorange()
+    print(f'render month grid only:      {total / loops * 1000:8.3f} ms')
+
+    conn = store.connection()
+
+    def with_sql():
+        conn.execute("SELECT DATE(datetime) AS day, COUNT(*) AS count FROM customers "
+                     "WHERE datetime >= ? AND datetime < ? GROUP BY day", ('2023-05-01', '2023-06-01')).fetchall()
+
+    loops, total = timeit.Timer(with_sql).autorange()
+    print(f'SQL GROUP BY day counts:     {total / loops * 1000:8.3f} ms')
+    demo_server.CUSTOMERS, demo_server.CALENDAR_INDEX = previous
+    drop_store(store, directory)
+
+
+def concatenated_rows(rows):
+    """Customer rows the way pages were built before templates: f-strings, joined and encoded"""
+    escape = demo_server.html.escape
+    parts = []
+    for row in rows:
+        vehicle = ' '.join(value for value in (row['year'], row['make'], row['model']) if value)
+        parts.append(f"""
+                            <tr>
+                                <td>{escape(row["name"])}</td>
+                                <td>{escape(row["phone"])}</td>
+                                <td>{escape(row["email"] or "")}</td>
+                                <td>{escape(vehicle)}</td>
+                                <td>{escape(row["sales1"] or "")}</td>
+                                <td>{escape(row["datetime"][:10])}</td>
+                                <td>
+                                    <div class="btn-group btn-group-sm" role="group">
+                                        <a href="/edit-customer/{row["id"]}" class="btn btn-outline-primary" title="Edit">
+                                            <i class="fas fa-edit"></i>
+                                        </a>
+                                        <button type="button" class="btn btn-outline-danger" title="Delete">
+                                            <i class="fas fa-trash-alt"></i>
+                                        </button>
+                                    </div>
+                                </td>
+                            </tr>""")
+    return ''.join(parts)
+
+
+def bench_templates(args):
+    """Compiled template rendering against string concatenation, and vectored writes"""
+    def per_call(function):
+        loops, total = timeit.Timer(function).autorange()
+        return total / loops * 1e6
+
+    info_text = b''.join(demo_server.INFO_PAGE.render()).decode('utf-8')
+    print(f'static page ({len(info_text)} chars)')
+    print(f'  encode concatenated string   {per_call(lambda: info_text.encode("utf-8")):9.2f} us')
+    print(f'  render compiled template     {per_call(demo_server.INFO_PAGE.render):9.2f} us')
+
+    rows = []
+    for number, customer in enumerate(fake_customers(max(args.rows))):
+        customer.update(id=number + 1, datetime='2024-01-01 12:00:00')
+        rows.append(customer)
+    header = demo_server.HTML_HEADER + demo_server.SEARCH_TITLE
+    for count in args.rows:
+        page_rows = rows[:count]
+        old = per_call(lambda: (header + concatenated_rows(page_rows) + demo_server.HTML_FOOTER).encode('utf-8'))
+        new = per_call(lambda: demo_server.render_search_page(
+            'smith', 'all', demo_server.render_search_results('smith', 'all', count, page_rows)))
+        print(f'search page, {count:>4} rows  concatenated {old:9.1f} us   template {new:9.1f} us')
+
+    # Push a rendered page through a socket pair, drained by a reader thread
+    parts = demo_server.render_search_page('smith', 'all', demo_server.render_search_results(
+        'smith', 'all', max(args.rows), rows))
+    size = sum(map(len, parts))
+    writer, reader = socket.socketpair()
+
+    def drain():
+        while reader.recv(1 << 16):
+            pass
+
+    thread = threading.Thread(target=drain, daemon=True)
+    thread.start()
+
+    def vectored():
+        views = [memoryview(part) for part in parts]
+        start = 0
+        while start < len(views):
+            # At most IOV_MAX buffers per call
+            sent = writer.sendmsg(views[start:start + 1024])
+            while start < len(views) and sent >= views[start].nbytes:
+                sent -= views[start].nbytes
+                start += 1
+            if sent:
+                views[start] = views[start][sent:]
+
+    print(f'write {size} bytes in {len(parts)} parts')
+    print(f'  join + sendall               {per_call(lambda: writer.sendall(b"".join(parts))):9.1f} us')
+    print(f'  sendmsg                      {per_call(vectored):9.1f} us')
+    writer.close()
+    thread.join()
+    reader.close()
+
+
+def bench_static_pages(args):
+    """Bytes sent and latency for cached pages: identity, compressed and 304 revalidation"""
+    httpd = start_server()
+    port = httpd.server_address[1]
+    kbit = args.link_kbit
+    print(f'transfer times at {kbit} kbit/s')
+    for path, page in demo_server.STATIC_PAGES.items():
+        print(path)
+        cookie = session_headers()
+        runs = (('identity', cookie), ('gzip', {**cookie, 'Accept-Encoding': 'gzip, deflate'}),
+                ('304 revalidate', {**cookie, 'Accept-Encoding': 'gzip, deflate',
+                                    'If-None-Match': page.etags['gzip']}))
+        for label, headers in runs:
+            sizes = []
+            latencies = []
+            for _ in range(args.requests):
+                started = time.perf_counter()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                sizes.append(len(response.read()))
+                latencies.append(time.perf_counter() - started)
+                conn.close()
+            print(f'  {label:<16} status {response.status}  body {sizes[0]:6d} bytes  '
+                  f'{sizes[0] * 8 / kbit:7.1f} ms on the link  '
+                  f'p50 {percentile(latencies, 0.5) * 1000:6.2f} ms locally')
+    stop_server(httpd)
+
+
+def bench_static_assets(args):
+    """Static file throughput with sendfile against copying through Python, plus range and 304 costs"""
+    asset = demo_server.ASSETS[args.path]
+    for label, handler_class in (('read + write', CopyingHandler), ('sendfile', QuietHandler)):
+        httpd = start_server(handler_class=handler_class, workers=args.clients, queue_size=args.clients * 2)
+        port = httpd.server_address[1]
+        runs = ((f'{label}, whole file', {}),
+                (f'{label}, 64 KiB range', {'Range': 'bytes=65536-131071'}),
+                (f'{label}, 304', {'If-None-Match': asset.etag}))
+        for run, headers in runs:
+            deadline = time.perf_counter() + args.seconds
+            sizes = []
+            cpu_started = time.process_time()
+
+            def client():
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                while time.perf_counter() < deadline:
+                    conn.request('GET', asset.fingerprinted_url, headers=headers)
+                    sizes.append(len(conn.getresponse().read()))
+                conn.close()
+
+            started = time.perf_counter()
+            clients = [threading.Thread(target=client) for _ in range(args.clients)]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            cpu = time.process_time() - cpu_started
+            print(f'{run:<28} {len(sizes) / elapsed:8.0f} requests/s  {sum(sizes) / elapsed / 1e6:8.1f} MB/s  '
+                  f'{cpu / max(len(sizes), 1) * 1e6:7.0f} us CPU per request')
+        stop_server(httpd)
+
+
+class SubresourceParser(html.parser.HTMLParser):
+    """Collects the stylesheet, icon and script URLs a browser fetches with a page"""
+
+    def __init__(self):
+        super().__init__()
+        self.urls = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'link' and attrs.get('rel') in ('stylesheet', 'icon') and attrs.get('href'):
+            self.urls.append(attrs['href'])
+        elif tag == 'script' and attrs.get('src'):
+            self.urls.append(attrs['src'])
+
+
+def page_subresources(markup):
+    parser = SubresourceParser()
+    parser.feed(markup)
+    return parser.urls
+
+
+def report_page_requests(label, urls, rtt_ms):
+    """Print the requests and connections a cold load of a page needs"""
+    origins = {urlsplit(url).netloc for url in urls} - {''}
+    # DNS, TCP and TLS each cost about a round trip before a new origin sends anything
+    print(f'  {label:<22} {len(urls) + 1:2d} requests  {len(origins)} third-party origins  '
+          f'~{len(origins) * 3 * rtt_ms:4.0f} ms of connection setup at {rtt_ms:.0f} ms RTT')
+
+
+def bench_page_requests(args):
+    """Requests and origins a cold page load needs with the CDN links and with the built bundles"""
+    if demo_server.CSS_BUNDLE in demo_server.ASSETS and demo_server.JS_BUNDLE in demo_server.ASSETS:
+        bundled = demo_server.ASSETS
+        directory = None
+    else:
+        # Without a build, fingerprint stand-in files: only the markup is measured
+        directory = tempfile.mkdtemp()
+        bundled = {}
+        for url in (demo_server.CSS_BUNDLE, demo_server.JS_BUNDLE):
+            path = os.path.join(directory, os.path.basename(url))
+            with open(path, 'w') as file:
+                file.write(url)
+            bundled[url] = demo_server.StaticAsset(path, url)
+    login_scripts = demo_server.CDN_SCRIPTS[:1]
+    for path, cdn_scripts in (('/', demo_server.CDN_SCRIPTS), ('/login', login_scripts)):
+        print(path)
+        for label, assets in (('CDN links', {}), ('bundled', bundled)):
+            markup = (demo_server.ICON_LINK + demo_server.stylesheet_links(assets)
+                      + demo_server.script_tags(assets, cdn_scripts))
+            report_page_requests(label, page_subresources(markup), args.rtt_ms)
+
+    # What the server sends now, which is one of the two above
+    httpd = start_server()
+    port = httpd.server_address[1]
+    print('served now')
+    for path in ('/', '/login'):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.request('GET', path, headers=session_headers())
+        markup = conn.getresponse().read().decode('utf-8')
+        conn.close()
+        report_page_requests(path, page_subresources(markup), args.rtt_ms)
+    stop_server(httpd)
+    if directory is not None:
+        shutil.rmtree(directory)
+
+
+def synthetic_routes(count):
+    """Route patterns shaped like a REST app's: half fixed paths, half with parameters"""
+    routes = []
+    for section in range(count // 4):
+        routes += [f'/section{section}', f'/section{section}/new',
+                   f'/api/section{section}/<int:item_id>', f'/api/section{section}/<int:item_id>/notes/<slug>']
+    return routes
+
+
+def bench_routing(args):
+    """Cost of matching a request path against a table of routes, against trying each pattern in turn"""
+    patterns = synthetic_routes(args.routes)
+    router = demo_server.Router()
+    for pattern in patterns:
+        router.add(pattern, 'GET', None)
+    routes = [route for bucket in router.patterns.values() for route in bucket]
+    print(f'{len(patterns)} routes: {len(router.static)} fixed paths, {len(routes)} patterns')
+
+    # The same patterns tried one after another, as an if/elif chain would
+    def scan(path):
+        handlers = router.static.get(path)
+        if handlers is not None:
+            return handlers, {}
+        for regex, names, converters, handlers, _ in routes:
+            match = regex.fullmatch(path)
+            if match is not None:
+                return handlers, {name: convert(value)
+                                  for name, convert, value in zip(names, converters, match.groups())}
+        return None, None
+
+    last = args.routes // 4 - 1
+    paths = (('fixed path', '/section0/new'),
+             ('first pattern', '/api/section0/42'),
+             ('last pattern', f'/api/section{last}/42/notes/first-visit'),
+             ('no match', '/no/such/page'))
+    for label, path in paths:
+        routed = timeit.repeat(lambda: router.match(path), number=args.lookups, repeat=3)
+        linear = timeit.repeat(lambda: scan(path), number=args.lookups, repeat=3)
+        print(f'  {label:<14} {path:<36} router {min(routed) / args.lookups * 1e6:6.2f} us  '
+              f'one pattern at a time {min(linear) / args.lookups * 1e6:7.2f} us')
+
+
+def bench_metrics(args):
+    """Per-request cost of the request metrics, and of rendering /metrics"""
+    metrics = demo_server.RequestMetrics()
+
+    def record():
+        metrics.request_started()
+        metrics.request_finished('GET', '/info', 200, 0.0004, 11264)
+
+    seconds = min(timeit.repeat(record, number=100000, repeat=3)) / 100000
+    print(f'recording one request          {seconds * 1e6:6.2f} us')
+
+    # Whole requests on a kept-alive connection, with and without metrics
+    headers = session_headers()
+    rates = {}
+    for _ in range(args.rounds):
+        for label, handler_class in (('with metrics', QuietHandler), ('without metrics', UninstrumentedHandler)):
+            httpd = start_server(handler_class=handler_class)
+            conn = http.client.HTTPConnection('127.0.0.1', httpd.server_address[1], timeout=30)
+            count = 0
+            started = time.perf_counter()
+            deadline = started + args.seconds
+            while time.perf_counter() < deadline:
+                conn.request('GET', args.path, headers=headers)
+                conn.getresponse().read()
+                count += 1
+            rates.setdefault(label, []).append(count / (time.perf_counter() - started))
+            conn.close()
+            stop_server(httpd)
+    for label, samples in rates.items():
+        print(f'GET {args.path:<10} {label:<16} {max(samples):8.0f} requests/s  '
+              f'{1e6 / max(samples):6.1f} us per request (best of {args.rounds})')
+
+    # A scrape after traffic on every route, method and a few statuses
+    for route in demo_server.ROUTES.static:
+        for status in (200, 302, 404):
+            metrics.request_started()
+            metrics.request_finished('GET', route, status, 0.002, 4096)
+    metrics.observe_bcrypt('verify', 0.25)
+    seconds = min(timeit.repeat(lambda: metrics.render(lambda: 0), number=100, repeat=3)) / 100
+    print(f'rendering /metrics ({len(metrics.render().splitlines())} lines) {seconds * 1000:6.2f} ms')
+
+
+def bench_keep_alive(args):
+    """Requests per second with a new connection per request and with reused connections"""
+    httpd = start_server(workers=args.clients, queue_size=args.clients * 2)
+    port = httpd.server_address[1]
+    headers = session_headers()
+    for path in args.paths:
+        for label in ('new connection', 'keep-alive'):
+            deadline = time.perf_counter() + args.seconds
+            latencies = []
+
+            def client():
+                conn = None
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    if conn is None:
+                        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                    conn.request('GET', path, headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                    if label == 'new connection' or response.will_close:
+                        conn.close()
+                        conn = None
+                    latencies.append(time.perf_counter() - started)
+                if conn is not None:
+                    conn.close()
+
+            started = time.perf_counter()
+            clients = [threading.Thread(target=client) for _ in range(args.clients)]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            print(f'{path:<20} {label:<15} {len(latencies) / elapsed:8.1f} requests/s  '
+                  f'p50 {percentile(latencies, 0.5) * 1000:6.2f} ms  '
+                  f'p95 {percentile(latencies, 0.95) * 1000:6.2f} ms')
+    stop_server(httpd)
+
+
+BENCHMARKS = {
+    'concurrency': bench_concurrency,
+    'login-rate': bench_login_rate,
+    'startup': bench_startup,
+    'user-lookup': bench_user_lookup,
+    'search': bench_search,
+    'suggest': bench_suggest,
+    'phone-lookup': bench_phone_lookup,
+    'pagination': bench_pagination,
+    'streaming': bench_streaming,
+    'dashboard': bench_dashboard,
+    'calendar': bench_calendar,
+    'templates': bench_templates,
+    'static-pages': bench_static_pages,
+    'keep-alive': bench_keep_alive,
+    'export': bench_export,
+    'static-assets': bench_static_assets,
+    'page-requests': bench_page_requests,
+    'routing': bench_routing,
+    'metrics': bench_metrics,
+    'import': bench_import,
+    'csv-export': bench_csv_export,
+    'sessions': bench_sessions,
+    'login-flood': bench_login_flood,
+    'bcrypt-cost': bench_bcrypt_cost,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    concurrency = subparsers.add_parser('concurrency', help=bench_concurrency.__doc__)
+    concurrency.add_argument('--requests', type=int, default=50, help='dashboard GETs per phase')
+    concurrency.add_argument('--login-clients', type=int, default=4, help='clients posting /login in a loop')
+    concurrency.add_argument('--workers', type=int, default=8)
+    concurrency.add_argument('--queue-size', type=int, default=64)
+
+    login_rate = subparsers.add_parser('login-rate', help=bench_login_rate.__doc__)
+    login_rate.add_argument('--clients', type=int, default=8, help='concurrent login clients')
+    login_rate.add_argument('--seconds', type=float, default=5.0, help='duration of each run')
+    login_rate.add_argument('--bcrypt-workers', type=int, default=None,
+                            help='process pool size (default: one per core)')
+
+    startup = subparsers.add_parser('startup', help=bench_startup.__doc__)
+    startup.add_argument('--runs', type=int, default=5, help='process starts per measurement')
+
+    user_lookup = subparsers.add_parser('user-lookup', help=bench_user_lookup.__doc__)
+    user_lookup.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+
+    search = subparsers.add_parser('search', help=bench_search.__doc__)
+    search.add_argument('--customers', type=int, default=200000, help='rows to search (try 1000000)')
+    search.add_argument('--query', dest='queries', nargs=2, action='append', metavar=('FIELD', 'TERM'),
+                        help='search field and term, repeatable')
+
+    suggest = subparsers.add_parser('suggest', help=bench_suggest.__doc__)
+    suggest.add_argument('--customers', type=int, default=200000)
+    suggest.add_argument('--queries', type=int, default=500, help='prefixes looked up per field')
+    suggest.add_argument('--limit', type=int, default=10, help='suggestions per lookup')
+
+    phone_lookup = subparsers.add_parser('phone-lookup', help=bench_phone_lookup.__doc__)
+    phone_lookup.add_argument('--customers', type=int, default=200000)
+
+    pagination = subparsers.add_parser('pagination', help=bench_pagination.__doc__)
+    pagination.add_argument('--customers', type=int, default=200000)
+    pagination.add_argument('--page-size', type=int, default=25)
+    pagination.add_argument('--pages', type=int, nargs='+', default=[0, 10, 100, 1000, 5000, 7999])
+    pagination.add_argument('--repeat', type=int, default=20, help='fetches per measurement')
+
+    streaming = subparsers.add_parser('streaming', help=bench_streaming.__doc__)
+    streaming.add_argument('--customers', type=int, default=50000)
+
+    dashboard = subparsers.add_parser('dashboard', help=bench_dashboard.__doc__)
+    dashboard.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 300000])
+
+    calendar = subparsers.add_parser('calendar', help=bench_calendar.__doc__)
+    calendar.add_argument('--customers', type=int, default=100000, help='customers in the rendered month')
+
+    templates = subparsers.add_parser('templates', help=bench_templates.__doc__)
+    templates.add_argument('--rows', type=int, nargs='+', default=[0, 25, 100, 500], help='result rows per page')
+
+    static_pages = subparsers.add_parser('static-pages', help=bench_static_pages.__doc__)
+    static_pages.add_argument('--requests', type=int, default=50, help='requests per page and variant')
+    static_pages.add_argument('--link-kbit', type=int, default=1000, help='link speed for transfer estimates')
+
+    keep_alive = subparsers.add_parser('keep-alive', help=bench_keep_alive.__doc__)
+    keep_alive.add_argument('--clients', type=int, default=4, help='concurrent clients')
+    keep_alive.add_argument('--seconds', type=float, default=3.0, help='duration of each run')
+    keep_alive.add_argument('--paths', nargs='+', default=['/info', '/api/suggest?q=smi', '/logout'])
+
+    static_assets = subparsers.add_parser('static-assets', help=bench_static_assets.__doc__)
+    static_assets.add_argument('--path', default='/generated-icon.png', choices=sorted(
+        url for url, asset in demo_server.ASSETS.items() if url == asset.url))
+    static_assets.add_argument('--clients', type=int, default=4)
+    static_assets.add_argument('--seconds', type=float, default=3.0, help='duration of each run')
+
+    page_requests = subparsers.add_parser('page-requests', help=bench_page_requests.__doc__)
+    page_requests.add_argument('--rtt-ms', type=float, default=50.0, help='round trip time for setup estimates')
+
+    routing = subparsers.add_parser('routing', help=bench_routing.__doc__)
+    routing.add_argument('--routes', type=int, default=200)
+    routing.add_argument('--lookups', type=int, default=100000, help='matches per measurement')
+
+    metrics = subparsers.add_parser('metrics', help=bench_metrics.__doc__)
+    metrics.add_argument('--path', default='/info', help='page requested in the end-to-end runs')
+    metrics.add_argument('--seconds', type=float, default=2.0, help='duration of each run')
+    metrics.add_argument('--rounds', type=int, default=3)
+
+    export = subparsers.add_parser('export', help=bench_export.__doc__)
+    export.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 300000])
+
+    bulk_import = subparsers.add_parser('import', help=bench_import.__doc__)
+    bulk_import.add_argument('--rows', type=int, default=100000, help='customers in each import file')
+    bulk_import.add_argument('--baseline-rows', type=int, default=5000,
+                             help='customers added one at a time for comparison')
+
+    csv_export = subparsers.add_parser('csv-export', help=bench_csv_export.__doc__)
+    csv_export.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+
+    sessions = subparsers.add_parser('sessions', help=bench_sessions.__doc__)
+    sessions.add_argument('--sessions', type=int, default=demo_server.MAX_SESSIONS,
+                          help='sessions in the table, which is also its capacity')
+
+    login_flood = subparsers.add_parser('login-flood', help=bench_login_flood.__doc__)
+    login_flood.add_argument('--attackers', type=int, default=4, help='clients sending wrong passwords')
+    login_flood.add_argument('--seconds', type=float, default=5.0, help='duration of each run')
+
+    bcrypt_cost = subparsers.add_parser('bcrypt-cost', help=bench_bcrypt_cost.__doc__)
+    bcrypt_cost.add_argument('--costs', type=int, nargs='+', default=[10, 11, 12, 13])
+    bcrypt_cost.add_argument('--targets', type=float, nargs='+', default=[0.25, 0.1, 0.5, 1.0],
+                             help='check times to calibrate for, in seconds; the first is used for the logins')
+
+    args = parser.parse_args(argv)
+    if args.benchmark == 'search' and not args.queries:
+        args.queries = [('name', 'rodriguez'), ('name', 'mary gar'), ('phone', '555-01'),
+                        ('email', 'thomas12'), ('city', 'antonio'), ('all', 'silverado'),
+                        ('all', 'patel'), ('all', 'zz')]
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Front-end build for the Customer Logging System demo server
+Vendors Bootstrap, Font Awesome and jQuery into static/vendor/ and bundles
+them as static/dist/app.css and static/dist/app.js, which the server then
+serves under fingerprinted URLs in place of the CDN links.
+Run with: python build_assets.py [--offline]
+"""
+
+import argparse
+import gzip
+import os
+import posixpath
+import re
+import sys
+import urllib.request
+from urllib.parse import urlsplit
+
+import demo_server
+
+FONT_AWESOME_WEBFONTS = "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/webfonts/"
+FONT_AWESOME_FONTS = tuple(
+    f"{family}.{extension}"
+    for family in ("fa-brands-400", "fa-regular-400", "fa-solid-900")
+    for extension in ("eot", "svg", "ttf", "woff", "woff2")
+)
+
+VENDOR_DIR = os.path.join(demo_server.APP_ROOT, demo_server.STATIC_DIR, "vendor")
+DIST_DIR = os.path.join(demo_server.APP_ROOT, demo_server.STATIC_DIR, "dist")
+
+CSS_URL = re.compile(r"""url\(\s*(['"]?)(.*?)\1\s*\)""")
+SOURCE_MAP = re.compile(rb"\n?/[/*][#@] sourceMappingURL=[^\n]*")
+
+
+def vendor_path(url):
+    """Where a downloaded library file is kept, by the last part of its URL"""
+    return os.path.join(VENDOR_DIR, posixpath.basename(urlsplit(url).path))
+
+
+def fetch(url, offline):
+    """Download url into static/vendor/ unless it is already there"""
+    path = vendor_path(url)
+    if os.path.exists(path):
+        return path
+    if offline:
+        raise SystemExit(f"{path} is missing; run without --offline to download it")
+    print(f"downloading {url}")
+    with urllib.request.urlopen(url, timeout=30) as response:
+        data = response.read()
+    with open(path + ".part", "wb") as file:
+        file.write(data)
+    os.replace(path + ".part", path)
+    return path
+
+
+def read_minified(path):
+    """Contents of an upstream .min build, without its source map comment"""
+    with open(path, "rb") as file:
+        return SOURCE_MAP.sub(b"", file.read()).strip()
+
+
+def rewrite_font_urls(css, fonts):
+    """Point the url()s of a stylesheet at the fingerprinted copies of fonts"""
+    def replace(match):
+        url = match.group(2)
+        name, suffix = re.match(r"([^?#]*)(.*)", url).groups()
+        asset = fonts.get(posixpath.basename(name))
+        if url.startswith("data:") or asset is None:
+            return match.group(0)
+        return f'url("{asset.fingerprinted_url}{suffix}")'
+    return CSS_URL.sub(replace, css)
+
+
+def write_bundle(url, data):
+    """Write a bundle and its gzip copy; return its size and compressed size"""
+    path = os.path.join(demo_server.APP_ROOT, url.lstrip("/"))
+    compressed = gzip.compress(data, 9, mtime=0)
+    for name, contents in ((path, data), (path + ".gz", compressed)):
+        with open(name, "wb") as file:
+            file.write(contents)
+    return len(data), len(compressed)
+
+
+def build(offline=False):
+    """Vendor the libraries and write the stylesheet and script bundles"""
+    os.makedirs(VENDOR_DIR, exist_ok=True)
+    os.makedirs(DIST_DIR, exist_ok=True)
+    stylesheets = [fetch(url, offline) for url in demo_server.CDN_STYLESHEETS]
+    scripts = [fetch(url, offline) for url in demo_server.CDN_SCRIPTS]
+    fonts = {}
+    for name in FONT_AWESOME_FONTS:
+        path = fetch(FONT_AWESOME_WEBFONTS + name, offline)
+        fonts[name] = demo_server.StaticAsset(path, "/" + os.path.relpath(path, demo_server.APP_ROOT)
+                                              .replace(os.sep, "/"))
+
+    # The upstream .min builds are already minified; bundling only joins them
+    css = "\n".join(rewrite_font_urls(read_minified(path).decode("utf-8"), fonts)
+                    for path in stylesheets)
+    js = b";\n".join(read_minified(path) for path in scripts)
+    for url, data in ((demo_server.CSS_BUNDLE, css.encode("utf-8")), (demo_server.JS_BUNDLE, js)):
+        size, compressed = write_bundle(url, data + b"\n")
+        print(f"{url}: {size / 1024:.1f} KiB, {compressed / 1024:.1f} KiB gzipped")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--offline', action='store_true',
+                        help='bundle the files already in static/vendor/ without downloading')
+    args = parser.parse_args(argv)
+    try:
+        build(args.offline)
+    except OSError as e:
+        sys.exit(f"build failed: {e}")
+
+
+if __name__ == '__main__':
+    main()
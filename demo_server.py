@@ -4,17 +4,47 @@ Simple Python server to demonstrate the Customer Logging System
 This serves as a demo of the Perl application structure
 """
 
+import argparse
+import base64
+import binascii
+import bisect
+import calendar
+import collections
+import concurrent.futures
+import csv
+import datetime
+import gzip
+import hashlib
+import hmac
+import html
 import http.server
+import io
+import itertools
+import math
+import mimetypes
+import multiprocessing
+import queue
+import re
+import secrets
+import select
+import selectors
+import socket
 import socketserver
+import operator
 import os
 import json
+import sqlite3
+import sys
+import threading
+import time
+import zlib
 import bcrypt
-from urllib.parse import parse_qs, urlparse
+from urllib.parse import parse_qs, urlencode, urlparse
 
-# Sample data to mock the customer database
-CUSTOMERS = [
+# Sample customers used to seed an empty customer database
+SAMPLE_CUSTOMERS = [
     {
-        "id": 1,
+        "user": "admin",
         "name": "John Doe",
         "phone": "(555) 123-4567",
         "email": "john@example.com",
@@ -35,7 +65,7 @@ CUSTOMERS = [
         "datetime": "2023-05-15 14:30:00"
     },
     {
-        "id": 2,
+        "user": "admin",
         "name": "Jane Smith",
         "phone": "(555) 987-6543",
         "email": "jane@example.com",
@@ -57,24 +87,359 @@ CUSTOMERS = [
     }
 ]
 
+# bcrypt work factor. 10 is the Perl code's and the lowest we use; at startup
+# configure_bcrypt_cost() raises it until a check takes about BCRYPT_TARGET_SECONDS
+BCRYPT_COST = 10
+BCRYPT_MIN_COST = 10
+BCRYPT_MAX_COST = 16
+BCRYPT_TARGET_SECONDS = 0.25
+
 # Password utility functions using bcrypt (similar to Crypt::BCrypt in Perl)
-def hash_password(password):
-    """Create a bcrypt hash of the password"""
-    # Using work factor 10 as in the Perl code
-    salt = bcrypt.gensalt(rounds=10)
+def hash_password(password, cost=None):
+    """Create a bcrypt hash of the password, at BCRYPT_COST unless cost is given"""
+    salt = bcrypt.gensalt(rounds=BCRYPT_COST if cost is None else cost)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
+def bcrypt_cost(hashed):
+    """Work factor of a bcrypt hash ("$2b$12$..." is 12), or None if it isn't one"""
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+def calibrate_bcrypt_cost(target=BCRYPT_TARGET_SECONDS, minimum=BCRYPT_MIN_COST, maximum=BCRYPT_MAX_COST):
+    """Highest cost whose hash takes no longer than target on this machine, but at least minimum.
+
+    Times one hash at the minimum cost; each step up doubles the work.
+    """
+    started = time.perf_counter()
+    bcrypt.hashpw(b'calibration', bcrypt.gensalt(rounds=minimum))
+    seconds = time.perf_counter() - started
+    cost = minimum
+    while cost < maximum and seconds * 2 <= target:
+        cost += 1
+        seconds *= 2
+    return cost
+
+def configure_bcrypt_cost(cost=None, target=BCRYPT_TARGET_SECONDS):
+    """Set the cost for new hashes, calibrating against target if none is given"""
+    global BCRYPT_COST
+    BCRYPT_COST = calibrate_bcrypt_cost(target) if cost is None else cost
+    return BCRYPT_COST
+
 def verify_password(password, hashed):
     """Check if the password matches the hash"""
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
-# Sample users for the system with bcrypt hashed passwords
-USERS = [
+# Request metrics, served on /metrics in the Prometheus text format. Each
+# request updates its counters and histogram under one lock acquisition
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Methods counted under their own name; anything else a client sends is "other"
+METRIC_METHODS = frozenset(('GET', 'POST', 'HEAD'))
+
+def prometheus_labels(*pairs):
+    """Label set such as {method="GET",route="/"} for (name, value) pairs"""
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs) + '}'
+
+class Histogram:
+    """Counts of observations in fixed buckets, with their sum"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name, labels=()):
+        """Exposition lines for the histogram, with cumulative buckets"""
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            lines.append(f'{name}_bucket{prometheus_labels(*labels, ("le", bound))} {total}')
+        lines.append(f'{name}_sum{prometheus_labels(*labels)} {self.sum}')
+        lines.append(f'{name}_count{prometheus_labels(*labels)} {total}')
+        return lines
+
+class RequestMetrics:
+    """Request counters, latency and bcrypt histograms, response bytes and in-flight requests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = collections.Counter()
+        self.latency = {}
+        self.response_bytes = collections.Counter()
+        self.bcrypt = {}
+        self.aborted = 0
+        self._started = 0
+        self._finished = 0
+
+    def request_started(self):
+        with self._lock:
+            self._started += 1
+
+    def request_aborted(self):
+        """Count a request the client closed or let time out before it could be answered"""
+        with self._lock:
+            self._finished += 1
+            self.aborted += 1
+
+    def request_finished(self, method, route, status, seconds, sent):
+        """Count a request by method, route pattern and status, with its time and bytes sent"""
+        if method not in METRIC_METHODS:
+            method = 'other'
+        key = (method, route)
+        with self._lock:
+            self._finished += 1
+            self.requests[method, route, status] += 1
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram()
+            histogram.observe(seconds)
+            self.response_bytes[key] += sent
+
+    def observe_bcrypt(self, operation, seconds):
+        with self._lock:
+            histogram = self.bcrypt.get(operation)
+            if histogram is None:
+                histogram = self.bcrypt[operation] = Histogram()
+            histogram.observe(seconds)
+
+    def render(self, queue_depth=None):
+        """Every metric in the Prometheus text format; queue_depth is the server's method, if any"""
+        lines = []
+
+        def header(name, kind, text):
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            header('http_requests_total', 'counter', 'Requests handled, by method, route and status code')
+            for (method, route, status), count in sorted(self.requests.items()):
+                labels = prometheus_labels(('method', method), ('route', route), ('status', status))
+                lines.append(f'http_requests_total{labels} {count}')
+            header('http_request_duration_seconds', 'histogram',
+                   'Time from reading a request to sending the end of its response')
+            for (method, route), histogram in sorted(self.latency.items()):
+                lines += histogram.render('http_request_duration_seconds',
+                                          (('method', method), ('route', route)))
+            header('http_response_bytes_total', 'counter', 'Bytes sent in responses, headers included')
+            for (method, route), sent in sorted(self.response_bytes.items()):
+                labels = prometheus_labels(('method', method), ('route', route))
+                lines.append(f'http_response_bytes_total{labels} {sent}')
+            header('bcrypt_duration_seconds', 'histogram',
+                   'Time requests waited for password hashing and checks, by operation')
+            for operation, histogram in sorted(self.bcrypt.items()):
+                lines += histogram.render('bcrypt_duration_seconds', (('operation', operation),))
+            header('http_requests_aborted_total', 'counter',
+                   'Requests the client closed or let time out before they could be answered')
+            lines.append(f'http_requests_aborted_total {self.aborted}')
+            header('http_requests_in_flight', 'gauge', 'Requests being handled')
+            lines.append(f'http_requests_in_flight {self._started - self._finished}')
+        if queue_depth is not None:
+            header('http_connection_queue_depth', 'gauge', 'Accepted connections waiting for a worker')
+            lines.append(f'http_connection_queue_depth {queue_depth()}')
+        return '\n'.join(lines) + '\n'
+
+METRICS = RequestMetrics()
+
+class CountingWriter:
+    """Wrapper around a handler's output stream that counts the bytes written"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.written = 0
+        self._held = None
+
+    def write(self, data):
+        self.written += len(data)
+        if self._held is not None:
+            self._held.append(data)
+            return len(data)
+        return self.raw.write(data)
+
+    def hold(self):
+        """Keep what is written from now on until release()"""
+        self._held = []
+
+    def release(self, parts=()):
+        """Write what was held followed by parts, all in one write"""
+        held, self._held = self._held, None
+        parts = list(parts)
+        self.written += sum(map(len, parts))
+        self.raw.write(b''.join(held + parts))
+
+    def flush(self):
+        self.raw.flush()
+
+    @property
+    def closed(self):
+        return self.raw.closed
+
+    def close(self):
+        self.raw.close()
+
+# Process pool for bcrypt work. When it is running, request threads only wait
+# on the result while the hashing itself runs on every core of the machine
+PASSWORD_POOL = None
+
+def start_password_pool(workers=None):
+    """Start the bcrypt process pool, one worker per core by default"""
+    global PASSWORD_POOL
+    if PASSWORD_POOL is None:
+        # Fork every worker now, before the server starts its threads
+        PASSWORD_POOL = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context('fork'))
+        PASSWORD_POOL.submit(os.getpid).result()
+    return PASSWORD_POOL
+
+def stop_password_pool():
+    """Shut down the bcrypt process pool and go back to hashing inline"""
+    global PASSWORD_POOL
+    if PASSWORD_POOL is not None:
+        PASSWORD_POOL.shutdown()
+        PASSWORD_POOL = None
+
+def _run_password_task(func, *args):
+    pool = PASSWORD_POOL
+    if pool is None:
+        return func(*args)
+    return pool.submit(func, *args).result()
+
+def offload_hash_password(password):
+    """Hash the password in the process pool, or inline if it is not running"""
+    started = time.perf_counter()
+    # Pass the cost along: the pool's processes may predate configure_bcrypt_cost()
+    hashed = _run_password_task(hash_password, password, BCRYPT_COST)
+    METRICS.observe_bcrypt('hash', time.perf_counter() - started)
+    return hashed
+
+def offload_verify_password(password, hashed):
+    """Verify the password in the process pool, or inline if it is not running"""
+    started = time.perf_counter()
+    matched = _run_password_task(verify_password, password, hashed)
+    METRICS.observe_bcrypt('verify', time.perf_counter() - started)
+    return matched
+
+# User store with hash indexes on username and email, so login and
+# registration never scan the user list
+class UserStore:
+    """In-memory users indexed by id, username and email"""
+
+    def __init__(self, users=()):
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_username = {}
+        self._by_email = {}
+        self._next_id = 1
+        for user in users:
+            self.add(user)
+
+    def __iter__(self):
+        return iter(list(self._by_id.values()))
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def get(self, user_id):
+        return self._by_id.get(user_id)
+
+    def find_by_username(self, username):
+        return self._by_username.get(username)
+
+    def find_by_email(self, email):
+        return self._by_email.get(email.lower()) if email else None
+
+    def add(self, user):
+        """Store a user, allocating the next id if it has none"""
+        email = (user.get("email") or "").lower()
+        with self._lock:
+            # Check again under the lock: two registrations can race past register_user
+            if user["username"] in self._by_username:
+                return False, "Username already exists"
+            if email and email in self._by_email:
+                return False, "Email already registered"
+            if user.get("id") is None:
+                user["id"] = self._next_id
+            elif user["id"] in self._by_id:
+                return False, "User id already exists"
+            # Ids only ever move forward, so a deleted user's id is never reused
+            self._next_id = max(self._next_id, user["id"] + 1)
+            self._by_id[user["id"]] = user
+            self._by_username[user["username"]] = user
+            if email:
+                self._by_email[email] = user
+        return True, "User registered successfully"
+
+    def replace_password(self, user_id, old_hash, new_hash):
+        """Swap a user's password hash if it is still old_hash; returns whether it was"""
+        with self._lock:
+            user = self._by_id.get(user_id)
+            if user is None or user["password"] != old_hash:
+                return False
+            user["password"] = new_hash
+        return True
+
+    def remove(self, user_id):
+        """Delete a user by id; returns False if there is no such user"""
+        with self._lock:
+            user = self._by_id.pop(user_id, None)
+            if user is None:
+                return False
+            del self._by_username[user["username"]]
+            email = (user.get("email") or "").lower()
+            if self._by_email.get(email) is user:
+                del self._by_email[email]
+        return True
+
+# Users whose password is being rehashed at the current cost
+_REHASHING = set()
+_REHASHING_LOCK = threading.Lock()
+
+def rehash_in_background(user, password):
+    """Replace a user's hash with one at BCRYPT_COST without making the login wait.
+
+    Called after a successful login, while the plain password is at hand.
+    The new hash is only stored if the old one is still current.
+    """
+    old_hash = user["password"]
+    with _REHASHING_LOCK:
+        if user["id"] in _REHASHING:
+            return
+        _REHASHING.add(user["id"])
+
+    def store(new_hash):
+        with _REHASHING_LOCK:
+            _REHASHING.discard(user["id"])
+        if new_hash is not None:
+            USERS.replace_password(user["id"], old_hash, new_hash)
+
+    pool = PASSWORD_POOL
+    if pool is None:
+        threading.Thread(target=lambda: store(hash_password(password, BCRYPT_COST)),
+                         name='bcrypt-rehash', daemon=True).start()
+    else:
+        future = pool.submit(hash_password, password, BCRYPT_COST)
+        future.add_done_callback(lambda done: store(None if done.exception() else done.result()))
+
+# Sample users for the system with bcrypt hashed passwords. The hashes are
+# precomputed with hash_password() so importing the module does no bcrypt work
+USERS = UserStore([
     {
         "id": 1,
         "username": "admin",
-        "password": hash_password("admin123"),  # Properly hashed with bcrypt
+        "password": "$2b$10$tB89PgF4KprZqVzMAUaHyOTzQo3UzlpQtH0F9Mi0g4SxzkIaAUDse",  # admin123
         "full_name": "Administrator",
         "email": "admin@example.com",
         "is_admin": True,
@@ -83,35 +448,1404 @@ USERS = [
     {
         "id": 2,
         "username": "user",
-        "password": hash_password("password"),  # Properly hashed with bcrypt
+        "password": "$2b$10$.BrZHdxSHhpIOkotnt.Cq.7QWFBWSVDK4yOdlOFuf4McQs9liBQS2",  # password
         "full_name": "Regular User",
         "email": "user@example.com",
         "is_admin": False,
         "is_active": True
     }
-]
+])
 
 # Function to register a new user
 def register_user(username, password, full_name, email):
-    # Check if username already exists
-    for user in USERS:
-        if user["username"] == username:
-            return False, "Username already exists"
+    # Check if username or email is taken before paying for a bcrypt hash
+    if USERS.find_by_username(username):
+        return False, "Username already exists"
+    if USERS.find_by_email(email):
+        return False, "Email already registered"
     
-    # Create new user with hashed password
+    # Create new user with hashed password; the store allocates the id
     new_user = {
-        "id": len(USERS) + 1,
         "username": username,
-        "password": hash_password(password),  # Properly hashed with bcrypt
+        "password": offload_hash_password(password),  # Properly hashed with bcrypt
         "full_name": full_name,
         "email": email,
         "is_admin": False,
         "is_active": True
     }
     
-    # Add to users list
-    USERS.append(new_user)
-    return True, "User registered successfully"
+    # Add to the user store
+    return USERS.add(new_user)
+
+# Sessions. The cookie is "<session id>.<expiry>.<signature>", signed with a
+# key made at startup, so forged and expired cookies are refused before the
+# session table is consulted; the table is what logout and deactivation revoke
+SESSION_COOKIE = "session"
+SESSION_TTL = 8 * 3600
+MAX_SESSIONS = 10000
+
+class SessionStore:
+    """Signed session cookies backed by an in-memory table with TTL expiry and LRU eviction"""
+
+    def __init__(self, ttl=SESSION_TTL, capacity=MAX_SESSIONS, key=None):
+        self.ttl = ttl
+        self.capacity = capacity
+        self._key = key or secrets.token_bytes(32)
+        self._lock = threading.Lock()
+        # Session id -> (user id, expiry), least recently used first
+        self._sessions = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _sign(self, payload):
+        digest = hmac.digest(self._key, payload.encode("ascii"), "sha256")
+        return base64.urlsafe_b64encode(digest[:18])
+
+    def create(self, user_id):
+        """Start a session for user_id and return its cookie value"""
+        session_id = secrets.token_urlsafe(18)
+        now = int(time.time())
+        expires = now + self.ttl
+        with self._lock:
+            sessions = self._sessions
+            sessions[session_id] = (user_id, expires)
+            # Drop expired sessions from the cold end, then the least recently used
+            while sessions and next(iter(sessions.values()))[1] <= now:
+                sessions.popitem(last=False)
+            while len(sessions) > self.capacity:
+                sessions.popitem(last=False)
+        payload = f"{session_id}.{expires}"
+        return f"{payload}.{self._sign(payload).decode('ascii')}"
+
+    def _session_id(self, cookie):
+        """Session id from a cookie with a valid signature, or None"""
+        payload, _, signature = cookie.rpartition(".")
+        session_id, _, expires = payload.partition(".")
+        if not payload.isascii() or not hmac.compare_digest(signature.encode(), self._sign(payload)):
+            return None
+        return session_id, int(expires)
+
+    def user_id(self, cookie):
+        """User id of a live session cookie, or None"""
+        checked = self._session_id(cookie)
+        if checked is None:
+            return None
+        session_id, expires = checked
+        with self._lock:
+            if expires <= time.time():
+                self._sessions.pop(session_id, None)
+                return None
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions.move_to_end(session_id)
+        return entry[0]
+
+    def revoke(self, cookie):
+        """End the session a cookie belongs to"""
+        checked = self._session_id(cookie)
+        if checked is not None:
+            with self._lock:
+                self._sessions.pop(checked[0], None)
+
+    def revoke_user(self, user_id):
+        """End every session of a user; returns how many there were"""
+        with self._lock:
+            ended = [session_id for session_id, entry in self._sessions.items() if entry[0] == user_id]
+            for session_id in ended:
+                del self._sessions[session_id]
+        return len(ended)
+
+SESSIONS = SessionStore()
+
+# Paths served without a session. Scrapers have no session, so /metrics is one
+PUBLIC_PATHS = frozenset(("/login", "/register", "/logout", "/metrics"))
+
+def session_cookie(value, max_age=SESSION_TTL):
+    """Set-Cookie value for a session cookie; an empty value with max_age 0 clears it"""
+    return f"{SESSION_COOKIE}={value}; Max-Age={max_age}; Path=/; HttpOnly; SameSite=Lax"
+
+# Login throttling. Every password check costs a bcrypt run, so attempts draw
+# on token buckets per client address and per user before any hashing is done
+LOGIN_IP_RATE = 0.5      # attempts per second once the burst is spent
+LOGIN_IP_BURST = 20
+LOGIN_USER_RATE = 0.1
+LOGIN_USER_BURST = 5
+MAX_BUCKETS = 65536
+
+class TokenBuckets:
+    """Token buckets per key, each kept as one float: the time it is full again.
+
+    This is the GCRA form of a token bucket. A bucket holding burst tokens
+    is the same as no entry, so buckets are dropped once they refill.
+    """
+
+    def __init__(self, rate, burst, max_keys=MAX_BUCKETS):
+        self.interval = 1.0 / rate
+        # How far past now a bucket's refill time may be while a token is left
+        self.tolerance = (burst - 1) * self.interval
+        self.max_keys = max_keys
+        self._full_at = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def __len__(self):
+        return len(self._full_at)
+
+    def take(self, key, now=None):
+        """Take a token for key; returns 0 if there was one, else seconds until there is"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            full_at = self._full_at.get(key, now)
+            if full_at < now:
+                full_at = now
+            wait = full_at - now - self.tolerance
+            if wait > 0:
+                return wait
+            self._full_at[key] = full_at + self.interval
+            if now >= self._next_sweep or len(self._full_at) > self.max_keys:
+                self._sweep(now)
+        return 0.0
+
+    def _sweep(self, now):
+        full_at = self._full_at
+        for key in [key for key, moment in full_at.items() if moment <= now]:
+            del full_at[key]
+        if len(full_at) > self.max_keys:
+            # Still too many live buckets: forget the oldest quarter rather
+            # than sweeping again on every call
+            for key in list(itertools.islice(full_at, len(full_at) - self.max_keys * 3 // 4)):
+                del full_at[key]
+        # Every bucket refills within tolerance + interval of its last use
+        self._next_sweep = now + self.tolerance + self.interval
+
+LOGIN_IP_BUCKETS = TokenBuckets(LOGIN_IP_RATE, LOGIN_IP_BURST)
+LOGIN_USER_BUCKETS = TokenBuckets(LOGIN_USER_RATE, LOGIN_USER_BURST)
+
+# Customer fields entered on the customer form, in sql/schema.sql order
+CUSTOMER_FIELDS = (
+    "user", "name", "phone", "email", "city", "stackno", "sales1", "sales2",
+    "closer", "newused", "year", "make", "model", "trade", "demo", "writeup",
+    "results", "notes"
+)
+
+# Columns written on insert: the form fields plus search tokens and timestamp
+CUSTOMER_COLUMNS = (
+    "user", "name", "name_token", "phone", "phone_token", "email", "city",
+    "stackno", "sales1", "sales2", "closer", "newused", "year", "make", "model",
+    "trade", "demo", "writeup", "results", "notes", "datetime"
+)
+
+# Customer fields exposed by the JSON API, leaving out the search tokens
+API_CUSTOMER_FIELDS = ("id",) + CUSTOMER_FIELDS + ("datetime",)
+
+# Select list for exports: the API fields as one JSON object built by SQLite
+# in a "record" column, beside the id and datetime that batching needs
+CUSTOMER_JSON_COLUMNS = "id, datetime, json_object({}) AS record".format(
+    ", ".join(f"'{field}', {field}" for field in API_CUSTOMER_FIELDS))
+
+# Select list for CSV exports, leaving the search tokens in the table
+CUSTOMER_CSV_COLUMNS = ", ".join(API_CUSTOMER_FIELDS)
+
+# SQLite version of the customers table and indexes from sql/schema.sql.
+# Name and phone are stored in plain text in the demo (the Perl app encrypts them)
+CUSTOMER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS customers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    name TEXT NOT NULL,
+    name_token TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    phone_token TEXT NOT NULL,
+    email TEXT,
+    city TEXT,
+    stackno TEXT,
+    sales1 TEXT,
+    sales2 TEXT,
+    closer TEXT,
+    newused TEXT DEFAULT 'New' CHECK (newused IN ('New', 'Used')),
+    year TEXT,
+    make TEXT,
+    model TEXT,
+    trade TEXT,
+    demo TEXT DEFAULT 'No' CHECK (demo IN ('Yes', 'No')),
+    writeup TEXT,
+    results TEXT,
+    notes TEXT,
+    datetime TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+CREATE INDEX IF NOT EXISTS idx_customers_name_token ON customers (name_token);
+CREATE INDEX IF NOT EXISTS idx_customers_phone_token ON customers (phone_token);
+CREATE INDEX IF NOT EXISTS idx_customers_email ON customers (email);
+CREATE INDEX IF NOT EXISTS idx_customers_city ON customers (city);
+CREATE INDEX IF NOT EXISTS idx_customers_sales1 ON customers (sales1);
+CREATE INDEX IF NOT EXISTS idx_customers_datetime ON customers (datetime);
+"""
+
+def create_search_token(text):
+    """Create a search token (same as Encryption::create_search_token in Perl)"""
+    return (text or "").lower()
+
+def normalize_phone(phone):
+    """Digits of a phone number without formatting or a leading US country code"""
+    digits = "".join(character for character in phone or "" if character.isdigit())
+    if len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]
+    return digits
+
+def _dict_row(cursor, row):
+    return dict(zip([column[0] for column in cursor.description], row))
+
+# Persistent customer store on SQLite, used in place of MariaDB for the demo
+class CustomerStore:
+    """Customer records in SQLite with one connection per thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._schema_ready = False
+        # Writes and index maintenance happen together under this lock so
+        # attached indexes see changes in the order SQLite applied them
+        self._write_lock = threading.RLock()
+        self._indexes = []
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Each connection is only used by the thread that opened it; the
+            # flag just lets close() shut every thread's connection down
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.row_factory = _dict_row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._lock:
+                if not self._schema_ready:
+                    conn.executescript(CUSTOMER_SCHEMA)
+                    self._create_search_table(conn)
+                    self._schema_ready = True
+                self._connections.append(conn)
+            self._local.conn = conn
+        return conn
+
+    def _create_search_table(self, conn):
+        """Create the full-text search table, filling it from the customers already stored"""
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'customers_search'").fetchone():
+            return
+        conn.create_function("normalize_phone", 1, normalize_phone, deterministic=True)
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute(CUSTOMER_SEARCH_SCHEMA)
+            conn.execute(f"INSERT INTO customers_search (rowid, {', '.join(SEARCH_COLUMNS)}) "
+                         f"SELECT id, {', '.join(SEARCH_FIELDS['all'])}, normalize_phone(phone) FROM customers")
+
+    def close(self):
+        """Close the connections of every thread"""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def _row_values(self, data):
+        values = {field: data.get(field) or "" for field in CUSTOMER_FIELDS}
+        values["newused"] = values["newused"] or "New"
+        values["demo"] = values["demo"] or "No"
+        values["name_token"] = create_search_token(values["name"])
+        values["phone_token"] = create_search_token(values["phone"])
+        values["datetime"] = data.get("datetime") or time.strftime("%Y-%m-%d %H:%M:%S")
+        return values
+
+    def add(self, data):
+        """Insert a customer and return its id"""
+        values = self._row_values(data)
+        conn = self.connection()
+        with self._write_lock:
+            with conn:
+                cursor = conn.execute(
+                    f"INSERT INTO customers ({', '.join(CUSTOMER_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(CUSTOMER_COLUMNS))})",
+                    [values[column] for column in CUSTOMER_COLUMNS])
+                values["id"] = cursor.lastrowid
+                conn.execute(SEARCH_INSERT, search_values(values))
+            for index in self._indexes:
+                index.add(values)
+        return values["id"]
+
+    def add_many(self, records):
+        """Insert customers in one transaction and hand them to the indexes as a batch.
+
+        Returns the number inserted. AUTOINCREMENT ids given out inside a
+        single write transaction are consecutive, so the new ids follow
+        from the last one.
+        """
+        rows = [self._row_values(data) for data in records]
+        if not rows:
+            return 0
+        conn = self.connection()
+        with self._write_lock:
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO customers ({', '.join(CUSTOMER_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(CUSTOMER_COLUMNS))})",
+                    map(operator.itemgetter(*CUSTOMER_COLUMNS), rows))
+                last_id = conn.execute("SELECT last_insert_rowid() AS id").fetchone()["id"]
+                for customer_id, row in enumerate(rows, last_id - len(rows) + 1):
+                    row["id"] = customer_id
+                conn.executemany(SEARCH_INSERT, map(search_values, rows))
+            for index in self._indexes:
+                index.add_many(rows)
+        return len(rows)
+
+    def update(self, customer_id, data):
+        """Update a customer's fields; returns False if it does not exist"""
+        values = self._row_values(data)
+        columns = [column for column in CUSTOMER_COLUMNS if column != "datetime"]
+        conn = self.connection()
+        with self._write_lock:
+            current = self.get_by_id(customer_id)
+            if current is None:
+                return False
+            # Like Customer::update, the original timestamp is kept
+            values["id"] = customer_id
+            values["datetime"] = current["datetime"]
+            with conn:
+                conn.execute(
+                    f"UPDATE customers SET {', '.join(column + ' = ?' for column in columns)} WHERE id = ?",
+                    [values[column] for column in columns] + [customer_id])
+                conn.execute("DELETE FROM customers_search WHERE rowid = ?", (customer_id,))
+                conn.execute(SEARCH_INSERT, search_values(values))
+            for index in self._indexes:
+                index.remove(current)
+                index.add(values)
+        return True
+
+    def delete(self, customer_id):
+        """Delete a customer; returns False if it does not exist"""
+        conn = self.connection()
+        with self._write_lock:
+            current = self.get_by_id(customer_id)
+            if current is None:
+                return False
+            with conn:
+                conn.execute("DELETE FROM customers WHERE id = ?", (customer_id,))
+                conn.execute("DELETE FROM customers_search WHERE rowid = ?", (customer_id,))
+            for index in self._indexes:
+                index.remove(current)
+        return True
+
+    def attach_index(self, index):
+        """Load every customer into index and keep it updated on each write"""
+        with self._write_lock:
+            rows = self.iter_all()
+            batch = list(itertools.islice(rows, 5000))
+            while batch:
+                index.add_many(batch)
+                batch = list(itertools.islice(rows, 5000))
+            self._indexes.append(index)
+        return index
+
+    def iter_all(self, batch_size=5000):
+        """Yield every customer in id order without loading them all at once"""
+        cursor = self.connection().execute("SELECT * FROM customers ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def get_many(self, customer_ids, columns="*"):
+        """Fetch customers by id, in the order the ids are given; columns must include id"""
+        found = {}
+        conn = self.connection()
+        customer_ids = list(customer_ids)
+        for start in range(0, len(customer_ids), 500):
+            chunk = customer_ids[start:start + 500]
+            for row in conn.execute(
+                    f"SELECT {columns} FROM customers WHERE id IN ({', '.join('?' * len(chunk))})", chunk):
+                found[row["id"]] = row
+        return [found[customer_id] for customer_id in customer_ids if customer_id in found]
+
+    def iter_search(self, criteria, batch_size=1000, columns="*"):
+        """Yield customers with a term in one of its columns, for any (term, columns) pair.
+
+        Rows come newest first, fetched a batch at a time from one query, so
+        memory does not grow with the number of matches.
+        """
+        # FTS5 rejects a NUL in a query and SQLite compares text only up to
+        # one, so a term holding a NUL matches nothing
+        criteria = [(term, columns) for term, columns in criteria if "\0" not in term]
+        if not criteria:
+            return
+        if all(len(term) >= 3 for term, _ in criteria):
+            # Each term is a phrase of its trigrams, limited to its columns
+            where = "customers_search MATCH ?"
+            params = [" OR ".join('{%s} : "%s"' % (" ".join(columns), term.replace('"', '""'))
+                                  for term, columns in criteria)]
+        else:
+            # A shorter term has no trigram to look up, so every row is checked
+            where = " OR ".join(f"customers_search.{column} LIKE ? ESCAPE '\\'"
+                                for _, columns in criteria for column in columns)
+            params = ["%" + re.sub(r"([\\%_])", r"\\\1", term) + "%"
+                      for term, columns in criteria for _ in columns]
+        cursor = self.connection().execute(
+            f"SELECT {columns} FROM customers WHERE id IN (SELECT rowid FROM customers_search WHERE {where}) "
+            "ORDER BY datetime DESC, id DESC", params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def search(self, criteria):
+        """Ids of the customers iter_search yields, newest first"""
+        return [row["id"] for row in self.iter_search(criteria, columns="id")]
+
+    def newest_first(self, customer_ids):
+        """Sort customer ids by datetime and id, newest first"""
+        rows = self.get_many(customer_ids, "id, datetime")
+        rows.sort(key=operator.itemgetter("datetime", "id"), reverse=True)
+        return [row["id"] for row in rows]
+
+    def get_by_id(self, customer_id):
+        return self.connection().execute(
+            "SELECT * FROM customers WHERE id = ?", (customer_id,)).fetchone()
+
+    def get_recent(self, limit=10):
+        return self.connection().execute(
+            "SELECT * FROM customers ORDER BY datetime DESC LIMIT ?", (limit,)).fetchall()
+
+    def get_page(self, limit, after=None, before=None, columns="*"):
+        """One page of customers, newest first, as in Customer::get_all.
+
+        Pages are addressed by keyset cursors, (datetime, id) of the row
+        just outside the page, so every page costs the same index range scan
+        however deep it is. Returns (rows, has_more) where has_more tells
+        whether rows exist beyond the page in the direction of travel.
+        A narrower select list must still include datetime and id.
+        """
+        conn = self.connection()
+        if before is not None:
+            rows = conn.execute(
+                f"SELECT {columns} FROM customers WHERE (datetime, id) > (?, ?) "
+                "ORDER BY datetime ASC, id ASC LIMIT ?", (*before, limit + 1)).fetchall()
+            has_more = len(rows) > limit
+            return rows[:limit][::-1], has_more
+        if after is not None:
+            rows = conn.execute(
+                f"SELECT {columns} FROM customers WHERE (datetime, id) < (?, ?) "
+                "ORDER BY datetime DESC, id DESC LIMIT ?", (*after, limit + 1)).fetchall()
+        else:
+            rows = conn.execute(
+                f"SELECT {columns} FROM customers ORDER BY datetime DESC, id DESC LIMIT ?", (limit + 1,)).fetchall()
+        return rows[:limit], len(rows) > limit
+
+    def iter_newest(self, batch_size=1000, columns="*"):
+        """Yield every customer newest first, fetching one keyset page per query"""
+        after = None
+        while True:
+            rows, has_more = self.get_page(batch_size, after=after, columns=columns)
+            yield from rows
+            if not has_more:
+                return
+            after = (rows[-1]["datetime"], rows[-1]["id"])
+
+    def get_for_date(self, day, limit=None):
+        """Customers on a YYYY-MM-DD day, newest first, like Customer::get_for_date.
+
+        Uses a datetime range instead of DATE(datetime) = ? so SQLite can
+        answer it from the datetime index.
+        """
+        following = (datetime.date.fromisoformat(day) + datetime.timedelta(days=1)).isoformat()
+        return self.connection().execute(
+            "SELECT * FROM customers WHERE datetime >= ? AND datetime < ? "
+            "ORDER BY datetime DESC, id DESC LIMIT ?", (day, following, -1 if limit is None else limit)).fetchall()
+
+    def get_total_count(self):
+        return self.connection().execute("SELECT COUNT(*) AS count FROM customers").fetchone()["count"]
+
+    def seed(self, customers):
+        """Insert the given customers if the table is empty"""
+        if self.connection().execute("SELECT 1 FROM customers LIMIT 1").fetchone() is None:
+            for customer in customers:
+                self.add(customer)
+
+# Columns each search field looks in, as in Customer::search
+SEARCH_FIELDS = {
+    "name": ("name_token",),
+    "phone": ("phone_token",),
+    "email": ("email",),
+    "city": ("city",),
+    "all": ("name_token", "phone_token", "email", "city", "stackno",
+            "sales1", "sales2", "closer", "make", "model"),
+}
+
+# Columns of the search table: the searchable ones plus phone digits
+SEARCH_COLUMNS = SEARCH_FIELDS["all"] + ("phone_digits",)
+
+# Phone searches written with digits and punctuation only, like "123-45"
+PHONE_QUERY = re.compile(r"[\d\s()+.-]*\d[\d\s()+.-]*")
+
+# Full-text search table: SQLite's trigram tokenizer indexes every three
+# characters, so substring searches are index lookups instead of LIKE
+# '%term%' scans, and the index lives on disk rather than being rebuilt in
+# memory at startup. The store writes it in the same transaction as the row
+CUSTOMER_SEARCH_SCHEMA = (f"CREATE VIRTUAL TABLE IF NOT EXISTS customers_search "
+                          f"USING fts5({', '.join(SEARCH_COLUMNS)}, tokenize='trigram')")
+SEARCH_INSERT = (f"INSERT INTO customers_search (rowid, {', '.join(SEARCH_COLUMNS)}) "
+                 f"VALUES ({', '.join('?' * (len(SEARCH_COLUMNS) + 1))})")
+
+def search_values(row):
+    """Parameters of SEARCH_INSERT for a customer row; phone_digits comes from phone"""
+    return (row["id"], *(row[column] for column in SEARCH_FIELDS["all"]), normalize_phone(row["phone"]))
+
+# Phone index on digits-only numbers: exact matches and the last 4 or 7
+# digits are single dictionary lookups instead of a scan of phone_token
+class PhoneIndex:
+    """Maps normalized phone numbers and their suffixes to customer ids"""
+
+    SUFFIX_LENGTHS = (4, 7)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._exact = {}
+        self._suffixes = {length: {} for length in self.SUFFIX_LENGTHS}
+
+    # Most keys belong to one customer, so a key maps to a bare id until a
+    # second customer shares it, which keeps a million entries compact
+    @staticmethod
+    def _put(mapping, key, customer_id):
+        current = mapping.get(key)
+        if current is None:
+            mapping[key] = customer_id
+        elif isinstance(current, set):
+            current.add(customer_id)
+        elif current != customer_id:
+            mapping[key] = {current, customer_id}
+
+    @staticmethod
+    def _drop(mapping, key, customer_id):
+        current = mapping.get(key)
+        if isinstance(current, set):
+            current.discard(customer_id)
+            if len(current) == 1:
+                mapping[key] = current.pop()
+        elif current == customer_id:
+            del mapping[key]
+
+    @staticmethod
+    def _ids(current):
+        if current is None:
+            return set()
+        return set(current) if isinstance(current, set) else {current}
+
+    def _keys(self, row):
+        digits = normalize_phone(row.get("phone"))
+        if not digits:
+            return []
+        keys = [(self._exact, digits)]
+        keys.extend((self._suffixes[length], digits[-length:])
+                    for length in self.SUFFIX_LENGTHS if len(digits) >= length)
+        return keys
+
+    def add(self, row):
+        self.add_many((row,))
+
+    def add_many(self, rows):
+        with self._lock:
+            for row in rows:
+                for mapping, key in self._keys(row):
+                    self._put(mapping, key, row["id"])
+
+    def remove(self, row):
+        with self._lock:
+            for mapping, key in self._keys(row):
+                self._drop(mapping, key, row["id"])
+
+    def lookup(self, phone):
+        """Ids of customers with exactly this phone number, however formatted"""
+        with self._lock:
+            return self._ids(self._exact.get(normalize_phone(phone)))
+
+    def lookup_suffix(self, digits):
+        """Ids of customers whose phone ends in these 4 or 7 digits"""
+        digits = normalize_phone(digits)
+        if len(digits) not in self._suffixes:
+            raise ValueError(f"suffix lookups take {' or '.join(map(str, self.SUFFIX_LENGTHS))} digits")
+        with self._lock:
+            return self._ids(self._suffixes[len(digits)].get(digits))
+
+# Fields offered as typeahead suggestions
+SUGGEST_FIELDS = ("name", "phone", "email", "city")
+
+class _TrieNode:
+    __slots__ = ("children", "bucket")
+
+    def __init__(self):
+        # Leaf nodes have no children and keep key suffix -> ids in bucket;
+        # inner nodes only keep the keys that end exactly at the node
+        self.children = None
+        self.bucket = {}
+
+# Burst trie: keys are kept in small leaf buckets that split into child nodes
+# once they grow, so millions of keys do not cost one node per character
+class PrefixTrie:
+    """Maps string keys to sets of ids and lists ids of keys with a prefix"""
+
+    BURST_SIZE = 64
+
+    def __init__(self):
+        self._root = _TrieNode()
+
+    def insert(self, key, item):
+        node = self._root
+        while node.children is not None and key:
+            child = node.children.get(key[0])
+            if child is None:
+                child = node.children[key[0]] = _TrieNode()
+            node, key = child, key[1:]
+        node.bucket.setdefault(key, set()).add(item)
+        if node.children is None and len(node.bucket) > self.BURST_SIZE:
+            self._burst(node)
+
+    def _burst(self, node):
+        bucket, node.bucket, node.children = node.bucket, {}, {}
+        for suffix, items in bucket.items():
+            if not suffix:
+                node.bucket[suffix] = items
+                continue
+            child = node.children.get(suffix[0])
+            if child is None:
+                child = node.children[suffix[0]] = _TrieNode()
+            child.bucket[suffix[1:]] = items
+
+    def discard(self, key, item):
+        node = self._root
+        while node.children is not None and key:
+            node = node.children.get(key[0])
+            if node is None:
+                return
+            key = key[1:]
+        items = node.bucket.get(key)
+        if items is not None:
+            items.discard(item)
+            if not items:
+                del node.bucket[key]
+
+    def complete(self, prefix, limit):
+        """Return up to limit ids whose keys start with prefix, in key order"""
+        node = self._root
+        while node.children is not None and prefix:
+            node = node.children.get(prefix[0])
+            if node is None:
+                return []
+            prefix = prefix[1:]
+        found = []
+        seen = set()
+        # Depth-first in key order; stops as soon as limit ids are found
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for suffix in sorted(node.bucket):
+                if suffix.startswith(prefix):
+                    for item in node.bucket[suffix]:
+                        if item not in seen:
+                            seen.add(item)
+                            found.append(item)
+                            if len(found) == limit:
+                                return found
+            if node.children:
+                stack.extend(node.children[character] for character in sorted(node.children, reverse=True))
+        return found
+
+# Typeahead index: one prefix trie per suggested field, kept up to date as
+# customers are added, changed or deleted
+class SuggestIndex:
+    """Prefix index over customer name, phone, email and city"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tries = {field: PrefixTrie() for field in SUGGEST_FIELDS}
+
+    def _keys(self, field, value):
+        if field == "phone":
+            digits = normalize_phone(value)
+            return {digits} if digits else set()
+        value = (value or "").lower()
+        # The whole value and each word in it, so "smi" finds "John Smith"
+        return {value, *value.split()} if value else set()
+
+    def add(self, row):
+        self.add_many((row,))
+
+    def add_many(self, rows):
+        with self._lock:
+            for field, trie in self._tries.items():
+                for row in rows:
+                    for key in self._keys(field, row.get(field)):
+                        trie.insert(key, row["id"])
+
+    def remove(self, row):
+        with self._lock:
+            for field, trie in self._tries.items():
+                for key in self._keys(field, row.get(field)):
+                    trie.discard(key, row["id"])
+
+    def suggest(self, query, field="all", limit=10):
+        """Return up to limit (field, customer id) pairs whose field starts with query"""
+        fields = SUGGEST_FIELDS if field == "all" else (field,)
+        results = []
+        seen = set()
+        with self._lock:
+            for name in fields:
+                prefix = normalize_phone(query) if name == "phone" else query.lower().strip()
+                if not prefix or name not in self._tries:
+                    continue
+                for customer_id in self._tries[name].complete(prefix, limit):
+                    if customer_id not in seen:
+                        seen.add(customer_id)
+                        results.append((name, customer_id))
+                        if len(results) == limit:
+                            return results
+        return results
+
+# Counts shown in the dashboard analytics table for each period
+DASHBOARD_STATS = ("new", "used", "writeup", "demo", "results")
+
+# Running dashboard totals, kept current on every insert, update and delete,
+# so the dashboard never runs COUNT(*) or DATE(datetime) = ? queries
+class DashboardAggregates:
+    """Customer counts in total, per day, per month and per sales person"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+        # (day or month, stat) -> count, where stat is "count" or a DASHBOARD_STATS name
+        self._days = {}
+        self._months = {}
+        self._salespeople = {}
+
+    def _stats(self, row):
+        stats = ["count"]
+        stats.append("new" if row.get("newused") == "New" else "used")
+        if row.get("writeup"):
+            stats.append("writeup")
+        if row.get("demo") == "Yes":
+            stats.append("demo")
+        if row.get("results"):
+            stats.append("results")
+        return stats
+
+    def _apply(self, rows, delta):
+        with self._lock:
+            for row in rows:
+                day = row["datetime"][:10]
+                month = day[:7]
+                self.total += delta
+                for stat in self._stats(row):
+                    self._days[day, stat] = self._days.get((day, stat), 0) + delta
+                    self._months[month, stat] = self._months.get((month, stat), 0) + delta
+                salesperson = row.get("sales1")
+                if salesperson:
+                    count = self._salespeople.get(salesperson, 0) + delta
+                    if count:
+                        self._salespeople[salesperson] = count
+                    else:
+                        del self._salespeople[salesperson]
+
+    def add(self, row):
+        self._apply((row,), 1)
+
+    def add_many(self, rows):
+        self._apply(rows, 1)
+
+    def remove(self, row):
+        self._apply((row,), -1)
+
+    def count_for_date(self, day):
+        """Customers on a YYYY-MM-DD date, like Customer::get_count_for_date"""
+        return self._days.get((day, "count"), 0)
+
+    def summary(self, today=None):
+        """Totals for today, this week (from Monday), this month and last month"""
+        today = today or datetime.date.today()
+        week = [today - datetime.timedelta(days=offset) for offset in range(today.weekday() + 1)]
+        last_month = (today.replace(day=1) - datetime.timedelta(days=1)).strftime("%Y-%m")
+        stats = ("count",) + DASHBOARD_STATS
+        with self._lock:
+            days, months = self._days, self._months
+            return {
+                "total": self.total,
+                "today": {stat: days.get((today.isoformat(), stat), 0) for stat in stats},
+                "week": {stat: sum(days.get((day.isoformat(), stat), 0) for day in week) for stat in stats},
+                "month": {stat: months.get((today.strftime("%Y-%m"), stat), 0) for stat in stats},
+                "last_month": {stat: months.get((last_month, stat), 0) for stat in stats},
+                "salespeople": sorted(self._salespeople.items(), key=lambda item: (-item[1], item[0])),
+            }
+
+# Day buckets for the calendar: a sorted list of days with customers and the
+# ids on each, so a month's counts are one bisect range over the list
+class DateIndex:
+    """Customer ids grouped by YYYY-MM-DD day, with the days kept sorted"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days = []
+        self._buckets = {}
+
+    def add(self, row):
+        self.add_many((row,))
+
+    def add_many(self, rows):
+        with self._lock:
+            for row in rows:
+                day = row["datetime"][:10]
+                ids = self._buckets.get(day)
+                if ids is None:
+                    ids = self._buckets[day] = set()
+                    bisect.insort(self._days, day)
+                ids.add(row["id"])
+
+    def remove(self, row):
+        day = row["datetime"][:10]
+        with self._lock:
+            ids = self._buckets.get(day)
+            if ids is None:
+                return
+            ids.discard(row["id"])
+            if not ids:
+                del self._buckets[day]
+                del self._days[bisect.bisect_left(self._days, day)]
+
+    def counts(self, start, end):
+        """Customer count for each day with customers from start up to (not including) end"""
+        with self._lock:
+            days = self._days[bisect.bisect_left(self._days, start):bisect.bisect_left(self._days, end)]
+            return {day: len(self._buckets[day]) for day in days}
+
+    def count_for_date(self, day):
+        with self._lock:
+            return len(self._buckets.get(day, ()))
+
+    def ids_for_date(self, day):
+        with self._lock:
+            return set(self._buckets.get(day, ()))
+
+# Default location of the demo customer database (same name start.sh uses)
+DEFAULT_CUSTOMER_DB = "customer_log.db"
+
+# Placeholders until open_customer_store(), which run() calls, loads the
+# database into the indexes; opening it here would create it on import
+CUSTOMERS = CustomerStore(DEFAULT_CUSTOMER_DB)
+SUGGEST_INDEX = SuggestIndex()
+PHONE_INDEX = PhoneIndex()
+DASHBOARD_AGGREGATES = DashboardAggregates()
+CALENDAR_INDEX = DateIndex()
+
+def open_customer_store(path):
+    """Switch the server to the customer database at path, seeding it if empty"""
+    global CUSTOMERS, SUGGEST_INDEX, PHONE_INDEX, DASHBOARD_AGGREGATES, CALENDAR_INDEX
+    CUSTOMERS.close()
+    CUSTOMERS = CustomerStore(path)
+    CUSTOMERS.seed(SAMPLE_CUSTOMERS)
+    SUGGEST_INDEX = CUSTOMERS.attach_index(SuggestIndex())
+    PHONE_INDEX = CUSTOMERS.attach_index(PhoneIndex())
+    DASHBOARD_AGGREGATES = CUSTOMERS.attach_index(DashboardAggregates())
+    CALENDAR_INDEX = CUSTOMERS.attach_index(DateIndex())
+    return CUSTOMERS
+
+def iter_search_results(term, field="all", batch_size=1000, columns="*"):
+    """Yield the customers matching a search, newest first and a batch at a time"""
+    digits = normalize_phone(term) if PHONE_QUERY.fullmatch(term) else ""
+    if field == "phone" and len(digits) == 10:
+        # A complete number is one lookup in the phone index
+        ids = CUSTOMERS.newest_first(PHONE_INDEX.lookup(digits))
+        for start in range(0, len(ids), batch_size):
+            yield from CUSTOMERS.get_many(ids[start:start + batch_size], columns)
+        return
+    searched = SEARCH_FIELDS.get(field, SEARCH_FIELDS["all"])
+    token = create_search_token(term)
+    if field == "phone" and digits:
+        # Match digits whatever the formatting, so "123-45" finds (555) 123-4567
+        criteria = [(digits, ("phone_digits",))]
+    elif digits and "phone_token" in searched:
+        criteria = [(token, searched), (digits, ("phone_digits",))]
+    else:
+        criteria = [(token, searched)]
+    yield from CUSTOMERS.iter_search(criteria, batch_size, columns)
+
+def search_customer_ids(term, field="all"):
+    """Ids of the customers matching a search, newest first"""
+    return [row["id"] for row in iter_search_results(term, field, columns="id")]
+
+def search_customers(term, field="all", limit=None):
+    """Search like Customer::search; returns (match count, rows newest first)"""
+    ids = search_customer_ids(term, field)
+    return len(ids), CUSTOMERS.get_many(ids[:limit])
+
+def encode_cursor(row):
+    """Opaque page cursor for the (datetime, id) position of a customer row"""
+    return base64.urlsafe_b64encode(f'{row["datetime"]}|{row["id"]}'.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """(datetime, id) from a page cursor, or None if it is missing or malformed"""
+    try:
+        moment, customer_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        return moment, int(customer_id)
+    except (ValueError, UnicodeError, binascii.Error):
+        return None
+
+# Page sizes for the customer list
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 500
+
+def list_customers(page_size=DEFAULT_PAGE_SIZE, after=None, before=None):
+    """A page of customers with cursors; returns (rows, next cursor, previous cursor)"""
+    after, before = decode_cursor(after or ''), decode_cursor(before or '')
+    rows, has_more = CUSTOMERS.get_page(page_size, after=after, before=before)
+    if not rows:
+        return rows, None, None
+    if before is not None:
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, after is not None
+    return (rows,
+            encode_cursor(rows[-1]) if has_next else None,
+            encode_cursor(rows[0]) if has_prev else None)
+
+# Most suggestions /api/suggest returns
+SUGGEST_LIMIT = 10
+
+def suggest_customers(query, field="all", limit=SUGGEST_LIMIT):
+    """Typeahead suggestions as JSON-ready dicts, best matches first"""
+    pairs = []
+    digits = normalize_phone(query) if PHONE_QUERY.fullmatch(query) else ""
+    if field in ("all", "phone") and len(digits) in PhoneIndex.SUFFIX_LENGTHS:
+        # Staff often type the last 4 or 7 digits; list those customers first
+        pairs = [("phone", customer_id) for customer_id in sorted(PHONE_INDEX.lookup_suffix(digits))[:limit]]
+    listed = {customer_id for _, customer_id in pairs}
+    pairs += [pair for pair in SUGGEST_INDEX.suggest(query, field, limit) if pair[1] not in listed]
+    pairs = pairs[:limit]
+    rows = {row["id"]: row for row in CUSTOMERS.get_many(customer_id for _, customer_id in pairs)}
+    return [
+        {"id": customer_id, "field": name, "value": rows[customer_id][name],
+         "name": rows[customer_id]["name"], "phone": rows[customer_id]["phone"],
+         "email": rows[customer_id]["email"], "city": rows[customer_id]["city"]}
+        for name, customer_id in pairs if customer_id in rows
+    ]
+
+def customer_record(row):
+    """A customer row as a plain dict for JSON"""
+    return {field: row[field] for field in API_CUSTOMER_FIELDS}
+
+def iter_customers(search_term="", search_field="all", batch_size=1000, columns="*"):
+    """Yield every customer, or those matching a search, newest first and a batch at a time"""
+    if not search_term:
+        yield from CUSTOMERS.iter_newest(batch_size, columns)
+        return
+    yield from iter_search_results(search_term, search_field, batch_size, columns)
+
+def render_ndjson(rows):
+    """NDJSON lines for rows selected with CUSTOMER_JSON_COLUMNS"""
+    for row in rows:
+        yield row["record"] + "\n"
+
+# Rows written per piece of a CSV export
+CSV_EXPORT_BATCH = 500
+
+# Cells a spreadsheet would run as a formula. A leading + or - is left alone
+# only when the whole cell is a phone number or amount
+FORMULA_CELL = re.compile(r"[=+\-@\t\r]")
+PLAIN_NUMBER = re.compile(r"[+-]?[\d ().-]+")
+# Cells in csv.writer output that may be formulas, where values holding \r
+# are quoted; the batches they turn up in are checked cell by cell
+FORMULA_IN_CSV = re.compile(r'(?:^|,)"?[=+\-@\t]|"\r', re.MULTILINE)
+
+def _spreadsheet_safe(value):
+    value = str(value)
+    if FORMULA_CELL.match(value) and not PLAIN_NUMBER.fullmatch(value):
+        return "'" + value
+    return value
+
+def render_csv(rows):
+    """CSV text for customer rows, a batch of rows per piece.
+
+    Starts with a byte order mark so Excel reads the file as UTF-8. Cells
+    that look like formulas get a leading apostrophe; a regex over each
+    batch finds the rare batches that need it.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(API_CUSTOMER_FIELDS)
+    values = operator.itemgetter(*API_CUSTOMER_FIELDS)
+    rows = iter(rows)
+    while True:
+        batch = list(map(values, itertools.islice(rows, CSV_EXPORT_BATCH)))
+        if not batch:
+            break
+        mark = buffer.tell()
+        writer.writerows(batch)
+        if FORMULA_IN_CSV.search(buffer.getvalue(), mark):
+            buffer.seek(mark)
+            buffer.truncate()
+            writer.writerows([map(_spreadsheet_safe, row) for row in batch])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_filename(prefix):
+    """Download name for an export made today"""
+    return f"{prefix}-{time.strftime('%Y-%m-%d')}.csv"
+
+# Bulk import: records are parsed as the input is read and inserted a batch
+# per transaction, so memory depends on the batch size, not the file size
+IMPORT_BATCH_SIZE = 5000
+
+# Most rejected records listed in an import report
+IMPORT_ERROR_LIMIT = 20
+
+# Longest line accepted by the import endpoint
+IMPORT_LINE_LIMIT = 1 << 20
+
+# SQLite page cache for command line imports, in KiB
+IMPORT_CACHE_KIB = 65536
+
+# Fields an import may set; ids and search tokens are always generated
+IMPORT_FIELDS = CUSTOMER_FIELDS + ("datetime",)
+
+DATETIME_PATTERN = re.compile(r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d")
+
+def read_csv_records(lines):
+    """Yield (line number, record) for CSV lines with a header row of column names"""
+    reader = csv.reader(lines)
+    header = next(reader, [])
+    for row in reader:
+        # Blank lines are skipped, as csv.DictReader does
+        if row:
+            yield reader.line_num, dict(zip(header, row))
+
+def read_ndjson_records(lines):
+    """Yield (line number, record) for NDJSON lines; bad lines give an error string"""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            yield number, f"Invalid JSON: {error}"
+            continue
+        yield number, record if isinstance(record, dict) else "Expected a JSON object"
+
+IMPORT_FORMATS = {
+    "csv": read_csv_records,
+    "ndjson": read_ndjson_records,
+}
+
+# File extensions recognised by the command line import
+IMPORT_EXTENSIONS = {
+    ".csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+}
+
+# Content types accepted by the import endpoint
+IMPORT_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+def customer_error(data):
+    """Why stripped customer fields can't be stored (the schema would refuse them), or None"""
+    if not data["name"] or not data["phone"]:
+        return "Name and Phone are required fields"
+    if data["newused"] not in ("", "New", "Used"):
+        return "newused must be New or Used"
+    if data["demo"] not in ("", "Yes", "No"):
+        return "demo must be Yes or No"
+    if data.get("datetime") and not DATETIME_PATTERN.fullmatch(data["datetime"]):
+        return "datetime must look like 2024-01-31 13:45:00"
+    return None
+
+def clean_customer(record):
+    """Import record as customer data, or a string saying why it was rejected"""
+    if not isinstance(record, dict):
+        return record
+    values = list(map(record.get, IMPORT_FIELDS))
+    if not set(map(type, values)) <= {str}:
+        # Missing columns, numbers and nested JSON; CSV records never get here
+        for position, value in enumerate(values):
+            if isinstance(value, (dict, list)):
+                return f"{IMPORT_FIELDS[position]} must be text"
+            values[position] = "" if value is None else str(value)
+    data = dict(zip(IMPORT_FIELDS, map(str.strip, values)))
+    return customer_error(data) or data
+
+def import_customers(store, records, batch_size=IMPORT_BATCH_SIZE):
+    """Store (line number, record) pairs in batches; returns a report dict.
+
+    Invalid records are skipped and listed. Input that can't be read at
+    all stops the import with an "error" entry; batches stored before it
+    are kept.
+    """
+    report = {"imported": 0, "rejected": 0, "errors": []}
+    batch = []
+    try:
+        for number, record in records:
+            data = clean_customer(record)
+            if isinstance(data, str):
+                report["rejected"] += 1
+                if len(report["errors"]) < IMPORT_ERROR_LIMIT:
+                    report["errors"].append({"line": number, "error": data})
+                continue
+            batch.append(data)
+            if len(batch) >= batch_size:
+                report["imported"] += store.add_many(batch)
+                batch = []
+    except (csv.Error, ValueError) as error:
+        report["error"] = str(error)
+    report["imported"] += store.add_many(batch)
+    return report
+
+def import_customer_file(store, path, import_format=None):
+    """Import a CSV or NDJSON file ("-" for stdin) into store; returns the report"""
+    if import_format is None:
+        import_format = IMPORT_EXTENSIONS.get(os.path.splitext(path)[1].lower(), "csv")
+    if path == "-":
+        lines = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+    else:
+        lines = open(path, encoding="utf-8-sig", newline="")
+    with lines:
+        return import_customers(store, IMPORT_FORMATS[import_format](lines))
+
+# Static assets: the files under static/ and the icon at the top of the tree,
+# sent straight from disk with sendfile. Each also has a URL carrying a hash
+# of its content (/static/css/custom.1a2b3c4d5e6f.css) that browsers may keep
+# for good, since changed content gets a new URL. A file changed on disk
+# while the server runs is hashed again on its next request
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = "static"
+ROOT_ASSETS = ("generated-icon.png",)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+class StaticAsset:
+    """A file served from disk, fingerprinted by a hash of its content"""
+
+    def __init__(self, path, url):
+        self.path = path
+        self.url = url
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self._lock = threading.Lock()
+        self._fingerprint()
+
+    def _stamp(self):
+        """Inode, size and mtime of the file and of its gzip copy, None where missing"""
+        stamps = []
+        for path in (self.path, self.path + ".gz"):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stamps.append(None)
+            else:
+                stamps.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        return tuple(stamps)
+
+    def _fingerprint(self):
+        # Stamped before hashing, so a change made meanwhile is caught next time
+        self.stamp = self._stamp()
+        digest = hashlib.sha256()
+        with open(self.path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 16), b""):
+                digest.update(block)
+        digest = digest.hexdigest()
+        self.etag = f'"{digest[:24]}"'
+        stem, extension = os.path.splitext(self.url)
+        self.fingerprinted_url = f"{stem}.{digest[:12]}{extension}"
+        # A precompressed copy beside the file (build_assets.py writes them)
+        self.gzip_path = self.path + ".gz" if self.stamp[1] is not None else None
+        self.gzip_etag = f'"{digest[:24]}-gzip"'
+
+    def refresh(self):
+        """Hash the file again if it changed on disk since it was hashed; returns whether it did"""
+        if self._stamp() == self.stamp:
+            return False
+        with self._lock:
+            stamp = self._stamp()
+            if stamp == self.stamp or stamp[0] is None:
+                # Another request got here first, or the file is gone and can't be sent
+                return False
+            self._fingerprint()
+            return True
+
+def load_assets(root=APP_ROOT):
+    """Assets by URL, under both their plain and fingerprinted URLs"""
+    found = [(os.path.join(root, name), "/" + name) for name in ROOT_ASSETS]
+    for directory, _, names in os.walk(os.path.join(root, STATIC_DIR)):
+        for name in sorted(names):
+            if name.endswith(".gz"):
+                # Served as the gzip variant of the file it was made from
+                continue
+            path = os.path.join(directory, name)
+            found.append((path, "/" + os.path.relpath(path, root).replace(os.sep, "/")))
+    assets = {}
+    for path, url in found:
+        if os.path.isfile(path):
+            asset = StaticAsset(path, url)
+            assets[url] = assets[asset.fingerprinted_url] = asset
+    return assets
+
+ASSETS = load_assets()
+
+def refresh_asset(asset):
+    """Fingerprint an asset again if its file changed, serving it under its new URL too"""
+    if asset.refresh():
+        ASSETS[asset.fingerprinted_url] = asset
+
+def asset_url(url):
+    """Fingerprinted URL of an asset, or url itself if there is no such file"""
+    asset = ASSETS.get(url)
+    return url if asset is None else asset.fingerprinted_url
+
+ICON_LINK = f'<link rel="icon" type="image/png" href="{asset_url("/generated-icon.png")}">'
+
+# Front-end libraries. build_assets.py vendors them into static/ and bundles
+# them as one stylesheet and one script; until it has been run, the pages
+# load them from the CDNs
+CDN_STYLESHEETS = (
+    "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css",
+    "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css",
+)
+CDN_SCRIPTS = (
+    "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js",
+    "https://code.jquery.com/jquery-3.6.0.min.js",
+)
+CSS_BUNDLE = "/static/dist/app.css"
+JS_BUNDLE = "/static/dist/app.js"
+
+def stylesheet_links(assets=ASSETS, cdn_urls=CDN_STYLESHEETS):
+    """<link> tags for the stylesheet bundle, or for the CDN stylesheets without one"""
+    urls = [assets[CSS_BUNDLE].fingerprinted_url] if CSS_BUNDLE in assets else cdn_urls
+    return "\n    ".join(f'<link href="{url}" rel="stylesheet">' for url in urls)
+
+def script_tags(assets=ASSETS, cdn_urls=CDN_SCRIPTS):
+    """<script> tags for the script bundle, or for the CDN scripts without one"""
+    urls = [assets[JS_BUNDLE].fingerprinted_url] if JS_BUNDLE in assets else cdn_urls
+    return "\n    ".join(f'<script src="{url}"></script>' for url in urls)
+
+BYTE_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+def parse_byte_range(header, size):
+    """(first, last) byte of a single Range header for a file of size bytes.
+
+    Returns None when the whole file should be sent instead (several or
+    malformed ranges), and False when the range can't be satisfied.
+    """
+    match = BYTE_RANGE.fullmatch(header.strip())
+    if match is None or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        # A suffix range: the last so many bytes
+        suffix = int(last)
+        return (max(size - suffix, 0), size - 1) if suffix and size else False
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        return False
+    return first, min(int(last), size - 1) if last else size - 1
+
+# Compiled templates: each template becomes a small render function once at
+# import, with long static runs encoded to bytes up front so a render only
+# escapes and encodes the text around its slots
+def _markup(value):
+    """Parts for a |safe slot: the list from another render, or a markup string"""
+    if value.__class__ is list:
+        return value
+    return (value.encode("utf-8") if isinstance(value, str) else value,)
+
+class Template:
+    """HTML with {{ name }} slots, rendered to a list of byte strings
+
+    {{ name }} inserts str(value) HTML-escaped. {{ name|safe }} inserts
+    markup as is, either a string or the list returned by another render.
+    """
+
+    SLOT = re.compile(r"\{\{\s*(\w+)(\|safe)?\s*\}\}")
+
+    # Static runs at least this long are kept as their own pre-encoded part;
+    # shorter ones are folded into an f-string with the neighbouring slots
+    FOLD_LIMIT = 256
+
+    def __init__(self, source):
+        self.source = source
+        self.slots = []
+        pieces = []
+        position = 0
+        for match in self.SLOT.finditer(source):
+            pieces.append((source[position:match.start()], None))
+            name = match.group(1)
+            if name not in self.slots:
+                self.slots.append(name)
+            pieces.append((name, bool(match.group(2))))
+            position = match.end()
+        pieces.append((source[position:], None))
+        self.render = self._compile(pieces)
+
+    def _compile(self, pieces):
+        """Build render(**slots) from (static text, None) and (slot name, safe) pieces"""
+        namespace = {"_escape": html.escape, "_markup": _markup}
+        items = []
+        run = []
+
+        def flush():
+            if run:
+                items.append("f" + repr("".join(run)) + ".encode()")
+                run.clear()
+
+        for value, safe in pieces:
+            if safe is None:
+                if len(value) >= self.FOLD_LIMIT:
+                    flush()
+                    name = f"_static{len(namespace)}"
+                    namespace[name] = value.encode("utf-8")
+                    items.append(name)
+                elif value:
+                    run.append(value.replace("{", "{{").replace("}", "}}"))
+            elif safe:
+                flush()
+                items.append(f"*_markup({value})")
+            else:
+                run.append(f"{{_escape(str({value}))}}")
+        flush()
+
+        arguments = "*, " + ", ".join(self.slots) + ", " if self.slots else ""
+        exec(f"def render({arguments}**_):\n    return [{', '.join(items)}]\n", namespace)
+        return namespace["render"]
+
+ALERT_SCRIPT = Template("""
+<script>
+    document.addEventListener('DOMContentLoaded', function() {
+        {{ before|safe }}alert({{ message|safe }});
+    });
+</script>
+""")
+
+def script_string(value):
+    """JavaScript string literal for value that is safe inside a <script> block"""
+    return json.dumps(value).replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026")
+
+def render_alert(message, register_tab=False):
+    """Script showing message in an alert once the page loads"""
+    before = "document.getElementById('register-tab').click();\n        " if register_tab else ""
+    return ALERT_SCRIPT.render(before=before, message=script_string(message))
 
 # HTML templates for the demo
 HTML_HEADER = """<!DOCTYPE html>
@@ -120,8 +1854,8 @@ HTML_HEADER = """<!DOCTYPE html>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1">
     <title>Customer Logging System Demo</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-    <link href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css" rel="stylesheet">
+    """ + ICON_LINK + """
+    """ + stylesheet_links() + """
     <style>
         :root {
             --bs-primary-rgb: 13, 110, 253;
@@ -301,10 +2035,8 @@ HTML_FOOTER = """
         </div>
     </footer>
 
-    <!-- Bootstrap 5 JS Bundle with Popper -->
-    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
-    <!-- jQuery -->
-    <script src="https://code.jquery.com/jquery-3.6.0.min.js"></script>
+    <!-- Bootstrap 5 JS Bundle with Popper, and jQuery -->
+    """ + script_tags() + """
     
     <!-- Dark Mode Toggle Script -->
     <script>
@@ -344,14 +2076,15 @@ HTML_FOOTER = """
 </html>
 """
 
-LOGIN_PAGE = """<!DOCTYPE html>
+# Login page; the alert slot takes a render_alert() script or an empty list
+LOGIN_PAGE = Template("""<!DOCTYPE html>
 <html lang="en" data-bs-theme="light">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1">
     <title>Login - Customer Logging System</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-    <link href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css" rel="stylesheet">
+    """ + ICON_LINK + """
+    """ + stylesheet_links() + """
     <style>
         :root {
             --bs-body-bg-dark: #212529;
@@ -563,7 +2296,7 @@ LOGIN_PAGE = """<!DOCTYPE html>
         </main>
     </div>
 
-    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
+    """ + script_tags(cdn_urls=CDN_SCRIPTS[:1]) + """
     
     <!-- Dark Mode Toggle Script -->
     <script>
@@ -599,11 +2332,11 @@ LOGIN_PAGE = """<!DOCTYPE html>
             });
         });
     </script>
-</body>
+{{ alert|safe }}</body>
 </html>
-"""
+""")
 
-DASHBOARD_PAGE = HTML_HEADER + """
+DASHBOARD_PAGE = Template(HTML_HEADER + """
 <div class="row mb-4">
     <div class="col-12">
         <div class="card shadow-sm">
@@ -627,7 +2360,7 @@ DASHBOARD_PAGE = HTML_HEADER + """
                         <div class="d-flex justify-content-between align-items-center">
                             <div>
                                 <h5 class="card-title">Total Customers</h5>
-                                <h2 class="display-4">2</h2>
+                                <h2 class="display-4">{{ total }}</h2>
                             </div>
                             <div class="display-4 text-primary">
                                 <i class="fas fa-users"></i>
@@ -645,7 +2378,7 @@ DASHBOARD_PAGE = HTML_HEADER + """
                         <div class="d-flex justify-content-between align-items-center">
                             <div>
                                 <h5 class="card-title">Today's Customers</h5>
-                                <h2 class="display-4">1</h2>
+                                <h2 class="display-4">{{ today }}</h2>
                             </div>
                             <div class="display-4 text-success">
                                 <i class="fas fa-user-plus"></i>
@@ -683,31 +2416,7 @@ DASHBOARD_PAGE = HTML_HEADER + """
                                         <th>Results</th>
                                     </tr>
                                 </thead>
-                                <tbody>
-                                    <tr>
-                                        <td>Today</td>
-                                        <td>1</td>
-                                        <td>0</td>
-                                        <td>1</td>
-                                        <td>1</td>
-                                        <td>1</td>
-                                    </tr>
-                                    <tr>
-                                        <td>This Month</td>
-                                        <td>3</td>
-                                        <td>2</td>
-                                        <td>4</td>
-                                        <td>2</td>
-                                        <td>5</td>
-                                    </tr>
-                                    <tr>
-                                        <td>Last Month</td>
-                                        <td>5</td>
-                                        <td>7</td>
-                                        <td>8</td>
-                                        <td>3</td>
-                                        <td>10</td>
-                                    </tr>
+                                <tbody>{{ analytics_rows|safe }}
                                 </tbody>
                             </table>
                         </div>
@@ -715,20 +2424,34 @@ DASHBOARD_PAGE = HTML_HEADER + """
                 </div>
             </div>
         </div>
-    </div>
-    
-    <!-- Calendar and Recent Customers -->
-    <div class="col-md-4">
-        <div class="card shadow-sm mb-4">
-            <div class="card-header bg-light">
-                <div class="d-flex justify-content-between align-items-center">
-                    <h5 class="mb-0"><i class="fas fa-calendar-alt"></i> Calendar</h5>
-                    <a href="/calendar" class="btn btn-sm btn-primary">Full Calendar</a>
+        
+        <div class="row">
+            <div class="col-12 mb-4">
+                <div class="card shadow-sm">
+                    <div class="card-header bg-light">
+                        <h5 class="mb-0"><i class="fas fa-user-tie"></i> Customers by Sales Person</h5>
+                    </div>
+                    <div class="card-body p-0">
+                        <ul class="list-group list-group-flush">{{ salespeople|safe }}
+                        </ul>
+                    </div>
+                </div>
+            </div>
+        </div>
+    </div>
+    
+    <!-- Calendar and Recent Customers -->
+    <div class="col-md-4">
+        <div class="card shadow-sm mb-4">
+            <div class="card-header bg-light">
+                <div class="d-flex justify-content-between align-items-center">
+                    <h5 class="mb-0"><i class="fas fa-calendar-alt"></i> Calendar</h5>
+                    <a href="/calendar" class="btn btn-sm btn-primary">Full Calendar</a>
                 </div>
             </div>
             <div class="card-body">
                 <div class="text-center mb-3">
-                    <h6 class="text-center">May 2023</h6>
+                    <h6 class="text-center">{{ month_name }}</h6>
                     <p>Calendar functionality shows customer activity by date</p>
                 </div>
                 <div class="text-center">
@@ -747,31 +2470,74 @@ DASHBOARD_PAGE = HTML_HEADER + """
                 </div>
             </div>
             <div class="card-body p-0">
-                <div class="list-group list-group-flush">
-                    <div class="list-group-item">
-                        <div class="d-flex w-100 justify-content-between">
-                            <h6 class="mb-1">John Doe</h6>
-                            <small class="text-muted">2023-05-15</small>
-                        </div>
-                        <p class="mb-1">Toyota Camry</p>
-                        <small class="text-muted">Sales: Jane Smith</small>
-                    </div>
-                    <div class="list-group-item">
-                        <div class="d-flex w-100 justify-content-between">
-                            <h6 class="mb-1">Jane Smith</h6>
-                            <small class="text-muted">2023-05-14</small>
-                        </div>
-                        <p class="mb-1">Honda Civic</p>
-                        <small class="text-muted">Sales: John Doe</small>
-                    </div>
+                <div class="list-group list-group-flush">{{ recent_customers|safe }}
                 </div>
             </div>
         </div>
     </div>
 </div>
-""" + HTML_FOOTER
+""" + HTML_FOOTER)
+
+# Rows of the dashboard analytics table, as (label, aggregate period)
+DASHBOARD_PERIODS = (
+    ("Today", "today"),
+    ("This Week", "week"),
+    ("This Month", "month"),
+    ("Last Month", "last_month"),
+)
+
+# Sales people listed on the dashboard
+DASHBOARD_SALESPEOPLE = 5
+
+DASHBOARD_ANALYTICS_ROW = Template("""
+                                    <tr>
+                                        <td>{{ label }}</td>
+                                        <td>{{ new }}</td>
+                                        <td>{{ used }}</td>
+                                        <td>{{ writeup }}</td>
+                                        <td>{{ demo }}</td>
+                                        <td>{{ results }}</td>
+                                    </tr>""")
 
-CUSTOMERS_PAGE = HTML_HEADER + """
+DASHBOARD_RECENT_CUSTOMER = Template("""
+                    <div class="list-group-item">
+                        <div class="d-flex w-100 justify-content-between">
+                            <h6 class="mb-1">{{ name }}</h6>
+                            <small class="text-muted">{{ date }}</small>
+                        </div>
+                        <p class="mb-1">{{ vehicle }}</p>
+                        <small class="text-muted">Sales: {{ sales }}</small>
+                    </div>""")
+
+DASHBOARD_SALESPERSON = Template("""
+                            <li class="list-group-item d-flex justify-content-between align-items-center">
+                                {{ name }}
+                                <span class="badge bg-primary rounded-pill">{{ count }}</span>
+                            </li>""")
+
+DASHBOARD_NO_SALESPEOPLE = Template("""
+                            <li class="list-group-item text-muted">No customers yet</li>""")
+
+def render_dashboard():
+    summary = DASHBOARD_AGGREGATES.summary()
+    analytics_rows = []
+    for label, period in DASHBOARD_PERIODS:
+        analytics_rows += DASHBOARD_ANALYTICS_ROW.render(label=label, **summary[period])
+    recent_customers = []
+    for row in CUSTOMERS.get_recent(5):
+        recent_customers += DASHBOARD_RECENT_CUSTOMER.render(
+            name=row["name"], date=row["datetime"][:10],
+            vehicle=" ".join(value for value in (row["make"], row["model"]) if value),
+            sales=row["sales1"] or "")
+    salespeople = []
+    for name, count in summary["salespeople"][:DASHBOARD_SALESPEOPLE]:
+        salespeople += DASHBOARD_SALESPERSON.render(name=name, count=count)
+    return DASHBOARD_PAGE.render(
+        total=summary["total"], today=summary["today"]["count"],
+        analytics_rows=analytics_rows, month_name=time.strftime("%B %Y"),
+        recent_customers=recent_customers, salespeople=salespeople or DASHBOARD_NO_SALESPEOPLE.render())
+
+CUSTOMERS_HEAD = Template(HTML_HEADER + """
 <div class="row mb-4">
     <div class="col-12">
         <div class="card shadow-sm">
@@ -784,6 +2550,9 @@ CUSTOMERS_PAGE = HTML_HEADER + """
                         <a href="/search" class="btn btn-primary me-2">
                             <i class="fas fa-search"></i> Search
                         </a>
+                        <a href="/customers.csv" class="btn btn-outline-secondary me-2">
+                            <i class="fas fa-file-csv"></i> Export CSV
+                        </a>
                         <a href="/add-customer" class="btn btn-success">
                             <i class="fas fa-user-plus"></i> Add Customer
                         </a>
@@ -811,53 +2580,49 @@ CUSTOMERS_PAGE = HTML_HEADER + """
                                 <th>Actions</th>
                             </tr>
                         </thead>
-                        <tbody>
-                            <tr>
-                                <td>John Doe</td>
-                                <td>(555) 123-4567</td>
-                                <td>john@example.com</td>
-                                <td>2023 Toyota Camry</td>
-                                <td>Jane Smith</td>
-                                <td>2023-05-15</td>
-                                <td>
-                                    <div class="btn-group btn-group-sm" role="group">
-                                        <a href="/edit-customer/1" class="btn btn-outline-primary" title="Edit">
-                                            <i class="fas fa-edit"></i>
-                                        </a>
-                                        <button type="button" class="btn btn-outline-danger" title="Delete">
-                                            <i class="fas fa-trash-alt"></i>
-                                        </button>
-                                    </div>
-                                </td>
-                            </tr>
-                            <tr>
-                                <td>Jane Smith</td>
-                                <td>(555) 987-6543</td>
-                                <td>jane@example.com</td>
-                                <td>2020 Honda Civic</td>
-                                <td>John Doe</td>
-                                <td>2023-05-14</td>
-                                <td>
-                                    <div class="btn-group btn-group-sm" role="group">
-                                        <a href="/edit-customer/2" class="btn btn-outline-primary" title="Edit">
-                                            <i class="fas fa-edit"></i>
-                                        </a>
-                                        <button type="button" class="btn btn-outline-danger" title="Delete">
-                                            <i class="fas fa-trash-alt"></i>
-                                        </button>
-                                    </div>
-                                </td>
-                            </tr>
+                        <tbody>""")
+
+CUSTOMERS_TAIL = Template("""
                         </tbody>
                     </table>
                 </div>
-            </div>
+{{ pager|safe }}            </div>
         </div>
     </div>
 </div>
-""" + HTML_FOOTER
+""" + HTML_FOOTER)
+
+def render_pager(page_size, next_cursor, prev_cursor):
+    """Newer/older links for the customer list; page_size None means all rows"""
+    if page_size is None:
+        return f"""
+                <div class="text-center mt-3">
+                    <small class="text-muted">Showing all customers &middot;
+                        <a href="/customers?page_size={DEFAULT_PAGE_SIZE}">Show {DEFAULT_PAGE_SIZE} per page</a></small>
+                </div>
+"""
+    def link(label, direction, cursor):
+        if cursor is None:
+            return f'<span class="btn btn-outline-secondary disabled">{label}</span>'
+        return (f'<a href="/customers?{direction}={cursor}&amp;page_size={page_size}" '
+                f'class="btn btn-outline-primary">{label}</a>')
+    return f"""
+                <div class="d-flex justify-content-between align-items-center mt-3">
+                    {link('<i class="fas fa-chevron-left"></i> Newer', 'before', prev_cursor)}
+                    <small class="text-muted">{page_size} per page &middot;
+                        <a href="/customers?page_size=all">Show all</a></small>
+                    {link('Older <i class="fas fa-chevron-right"></i>', 'after', next_cursor)}
+                </div>
+"""
+
+def render_customers_page(rows, page_size, next_cursor=None, prev_cursor=None):
+    """Customer list page as a stream of byte strings, rendered row by row"""
+    yield from CUSTOMERS_HEAD.render()
+    for row in rows:
+        yield from render_customer_rows((row,))
+    yield from CUSTOMERS_TAIL.render(pager=render_pager(page_size, next_cursor, prev_cursor))
 
-SEARCH_PAGE = HTML_HEADER + """
+SEARCH_TITLE = """
 <div class="row mb-4">
     <div class="col-12">
         <div class="card shadow-sm">
@@ -871,7 +2636,9 @@ SEARCH_PAGE = HTML_HEADER + """
     </div>
 </div>
 
-<div class="row mb-4">
+"""
+
+SEARCH_FORM = """<div class="row mb-4">
     <div class="col-12">
         <div class="card shadow-sm">
             <div class="card-body">
@@ -879,16 +2646,12 @@ SEARCH_PAGE = HTML_HEADER + """
                     <div class="col-md-6 col-lg-8">
                         <div class="input-group">
                             <span class="input-group-text"><i class="fas fa-search"></i></span>
-                            <input type="text" class="form-control form-control-lg" placeholder="Search..." name="search_term" required>
+                            <input type="text" class="form-control form-control-lg" placeholder="Search..." name="search_term" value="{{ search_term }}" list="search-suggestions" autocomplete="off" required>
+                            <datalist id="search-suggestions"></datalist>
                         </div>
                     </div>
                     <div class="col-md-4 col-lg-2">
-                        <select class="form-select form-select-lg" name="search_field">
-                            <option value="all" selected>All Fields</option>
-                            <option value="name">Name</option>
-                            <option value="phone">Phone</option>
-                            <option value="email">Email</option>
-                            <option value="city">City</option>
+                        <select class="form-select form-select-lg" name="search_field">{{ field_options|safe }}
                         </select>
                     </div>
                     <div class="col-md-2 col-lg-2">
@@ -900,7 +2663,51 @@ SEARCH_PAGE = HTML_HEADER + """
     </div>
 </div>
 
-<div class="row">
+"""
+
+# Fills the search box suggestions from /api/suggest as the user types
+SEARCH_SUGGEST_SCRIPT = """
+<script>
+    document.addEventListener('DOMContentLoaded', function() {
+        const input = document.querySelector('input[name="search_term"]');
+        const field = document.querySelector('select[name="search_field"]');
+        const list = document.getElementById('search-suggestions');
+        let timer = null;
+        let controller = null;
+        
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            const term = input.value.trim();
+            if (term.length < 2) {
+                list.innerHTML = '';
+                return;
+            }
+            // Wait for a pause in typing and drop answers to older keystrokes
+            timer = setTimeout(function() {
+                if (controller) {
+                    controller.abort();
+                }
+                controller = new AbortController();
+                const params = new URLSearchParams({q: term, field: field.value, limit: 10});
+                fetch('/api/suggest?' + params, {signal: controller.signal})
+                    .then(function(response) { return response.json(); })
+                    .then(function(data) {
+                        list.innerHTML = '';
+                        data.suggestions.forEach(function(suggestion) {
+                            const option = document.createElement('option');
+                            option.value = suggestion.value;
+                            option.label = suggestion.name + (suggestion.field === 'name' ? '' : ' - ' + suggestion.value);
+                            list.appendChild(option);
+                        });
+                    })
+                    .catch(function() {});
+            }, 150);
+        });
+    });
+</script>
+"""
+
+SEARCH_INFO = Template("""<div class="row">
     <div class="col-12">
         <div class="card shadow-sm">
             <div class="card-header bg-light">
@@ -918,9 +2725,125 @@ SEARCH_PAGE = HTML_HEADER + """
         </div>
     </div>
 </div>
-""" + HTML_FOOTER
+""")
+
+# Options of the search field select, as (value, label)
+SEARCH_FIELD_OPTIONS = (
+    ("all", "All Fields"),
+    ("name", "Name"),
+    ("phone", "Phone"),
+    ("email", "Email"),
+    ("city", "City"),
+)
+
+# Most rows a search results page shows
+SEARCH_RESULT_LIMIT = 100
+
+SEARCH_PAGE = Template(HTML_HEADER + SEARCH_TITLE + SEARCH_FORM + "{{ results|safe }}"
+                       + SEARCH_SUGGEST_SCRIPT + HTML_FOOTER)
+
+SEARCH_FIELD_OPTION = Template("""
+                            <option value="{{ value }}"{{ selected }}>{{ label }}</option>""")
+
+CUSTOMER_ROW = Template("""
+                            <tr>
+                                <td>{{ name }}</td>
+                                <td>{{ phone }}</td>
+                                <td>{{ email }}</td>
+                                <td>{{ vehicle }}</td>
+                                <td>{{ sales }}</td>
+                                <td>{{ date }}</td>
+                                <td>
+                                    <div class="btn-group btn-group-sm" role="group">
+                                        <a href="/edit-customer/{{ id }}" class="btn btn-outline-primary" title="Edit">
+                                            <i class="fas fa-edit"></i>
+                                        </a>
+                                        <button type="button" class="btn btn-outline-danger" title="Delete">
+                                            <i class="fas fa-trash-alt"></i>
+                                        </button>
+                                    </div>
+                                </td>
+                            </tr>""")
+
+SEARCH_RESULTS = Template("""
+<div class="row">
+    <div class="col-12">
+        <div class="card shadow-sm">
+            <div class="card-header bg-light d-flex justify-content-between align-items-center">
+                <h5 class="mb-0">
+                    <i class="fas fa-list"></i> Results for &quot;{{ search_term }}&quot;
+                    <small class="text-muted">({{ shown }})</small>
+                </h5>
+                <a href="{{ export_url }}" class="btn btn-sm btn-outline-secondary">
+                    <i class="fas fa-file-csv"></i> Export CSV
+                </a>
+            </div>{{ body|safe }}
+        </div>
+    </div>
+</div>
+""")
+
+SEARCH_RESULTS_TABLE = Template("""
+            <div class="card-body">
+                <div class="table-responsive">
+                    <table class="table table-hover table-striped">
+                        <thead class="table-light">
+                            <tr>
+                                <th>Name</th>
+                                <th>Phone</th>
+                                <th>Email</th>
+                                <th>Vehicle</th>
+                                <th>Sales Person</th>
+                                <th>Date</th>
+                                <th>Actions</th>
+                            </tr>
+                        </thead>
+                        <tbody>{{ rows|safe }}
+                        </tbody>
+                    </table>
+                </div>
+            </div>""")
+
+SEARCH_NO_RESULTS = Template("""
+            <div class="card-body text-center py-5">
+                <div class="text-muted">
+                    <i class="fas fa-search fa-3x mb-3"></i>
+                    <p>No customers match your search</p>
+                </div>
+            </div>""")
+
+# Rendered options of the search field select, by selected field
+SEARCH_FIELD_CHOICES = {
+    selected: [part for value, label in SEARCH_FIELD_OPTIONS for part in SEARCH_FIELD_OPTION.render(
+        value=value, label=label, selected=" selected" if value == selected else "")]
+    for selected, _ in SEARCH_FIELD_OPTIONS
+}
+
+def render_search_page(search_term="", search_field="all", results=None):
+    """Search page with the form filled in; results None shows the search help"""
+    return SEARCH_PAGE.render(
+        search_term=search_term,
+        field_options=SEARCH_FIELD_CHOICES.get(search_field, SEARCH_FIELD_CHOICES["all"]),
+        results=SEARCH_INFO.render() if results is None else results)
 
-ADD_CUSTOMER_PAGE = HTML_HEADER + """
+def render_customer_rows(rows):
+    """Table rows in the layout of the customer list"""
+    parts = []
+    for row in rows:
+        parts += CUSTOMER_ROW.render(
+            name=row["name"], phone=row["phone"], email=row["email"] or "",
+            vehicle=" ".join(value for value in (row["year"], row["make"], row["model"]) if value),
+            sales=row["sales1"] or "", date=row["datetime"][:10], id=row["id"])
+    return parts
+
+def render_search_results(search_term, search_field, total, rows):
+    body = SEARCH_RESULTS_TABLE.render(rows=render_customer_rows(rows)) if rows else SEARCH_NO_RESULTS.render()
+    shown = f"{total} found" if len(rows) == total else f"{total} found, showing the newest {len(rows)}"
+    export_url = "/search.csv?" + urlencode({"search_term": search_term, "search_field": search_field})
+    return SEARCH_RESULTS.render(search_term=search_term, shown=shown, body=body, export_url=export_url)
+
+# Add customer form; the alert slot takes a render_alert() script or an empty list
+ADD_CUSTOMER_PAGE = Template(HTML_HEADER + """
 <div class="row mb-4">
     <div class="col-12">
         <div class="card shadow-sm">
@@ -1064,9 +2987,9 @@ ADD_CUSTOMER_PAGE = HTML_HEADER + """
         </div>
     </div>
 </div>
-""" + HTML_FOOTER
+{{ alert|safe }}""" + HTML_FOOTER)
 
-CALENDAR_PAGE = HTML_HEADER + """
+CALENDAR_TITLE = """
 <div class="row mb-4">
     <div class="col-12">
         <div class="card shadow-sm">
@@ -1080,27 +3003,9 @@ CALENDAR_PAGE = HTML_HEADER + """
     </div>
 </div>
 
-<div class="row mb-4">
-    <div class="col-md-8">
-        <div class="card shadow-sm">
-            <div class="card-header bg-light">
-                <div class="d-flex justify-content-between align-items-center">
-                    <div>
-                        <h5 class="mb-0">May 2023</h5>
-                    </div>
-                    <div class="btn-group">
-                        <a href="/calendar?month=4&year=2023" class="btn btn-outline-primary">
-                            <i class="fas fa-chevron-left"></i>
-                        </a>
-                        <a href="/calendar" class="btn btn-outline-primary">Today</a>
-                        <a href="/calendar?month=6&year=2023" class="btn btn-outline-primary">
-                            <i class="fas fa-chevron-right"></i>
-                        </a>
-                    </div>
-                </div>
-            </div>
-            <div class="card-body">
-                <style>
+"""
+
+CALENDAR_GRID_HEAD = """                <style>
                     .calendar-table td {
                         height: 60px;
                         vertical-align: top;
@@ -1148,6 +3053,12 @@ CALENDAR_PAGE = HTML_HEADER + """
                     .has-records {
                         font-weight: 500;
                     }
+                    .date-count {
+                        position: absolute;
+                        bottom: 12px;
+                        left: 5px;
+                        font-size: 0.7rem;
+                    }
                 </style>
                 <table class="table table-bordered calendar-table">
                     <thead>
@@ -1161,314 +3072,9 @@ CALENDAR_PAGE = HTML_HEADER + """
                             <th>Sat</th>
                         </tr>
                     </thead>
-                    <tbody>
-                        <tr>
-                            <td></td>
-                            <td>
-                                <a href="/calendar?day=1&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">1</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=2&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">2</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=3&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">3</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=4&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">4</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=5&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">5</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=6&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">6</span>
-                                </a>
-                            </td>
-                        </tr>
-                        <tr>
-                            <td>
-                                <a href="/calendar?day=7&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">7</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=8&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">8</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=9&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">9</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=10&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">10</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=11&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">11</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=12&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">12</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=13&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">13</span>
-                                </a>
-                            </td>
-                        </tr>
-                        <tr>
-                            <td>
-                                <a href="/calendar?day=14&month=5&year=2023" class="date-cell has-records">
-                                    <span class="date-number">14</span>
-                                    <span class="date-dot"></span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=15&month=5&year=2023" class="date-cell selected-date has-records">
-                                    <span class="date-number">15</span>
-                                    <span class="date-dot"></span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=16&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">16</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=17&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">17</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=18&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">18</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=19&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">19</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=20&month=5&year=2023" class="date-cell current-date">
-                                    <span class="date-number">20</span>
-                                </a>
-                            </td>
-                        </tr>
-                        <tr>
-                            <td>
-                                <a href="/calendar?day=21&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">21</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=22&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">22</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=23&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">23</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=24&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">24</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=25&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">25</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=26&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">26</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=27&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">27</span>
-                                </a>
-                            </td>
-                        </tr>
-                        <tr>
-                            <td>
-                                <a href="/calendar?day=28&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">28</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=29&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">29</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=30&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">30</span>
-                                </a>
-                            </td>
-                            <td>
-                                <a href="/calendar?day=31&month=5&year=2023" class="date-cell">
-                                    <span class="date-number">31</span>
-                                </a>
-                            </td>
-                            <td></td>
-                            <td></td>
-                            <td></td>
-                        </tr>
-                    </tbody>
-                </table>
-            </div>
-        </div>
-    </div>
-    
-    <div class="col-md-4">
-        <div class="card shadow-sm">
-            <div class="card-header bg-light">
-                <h5 class="mb-0">
-                    <i class="fas fa-list"></i> Customers for May 15, 2023
-                </h5>
-            </div>
-            <div class="card-body">
-                <div class="list-group list-group-flush">
-                    <div class="list-group-item px-0">
-                        <div class="d-flex w-100 justify-content-between">
-                            <h6 class="mb-1">John Doe</h6>
-                            <small class="text-muted">14:30</small>
-                        </div>
-                        <p class="mb-1 small">
-                            <i class="fas fa-map-marker-alt text-secondary"></i> New York<br>
-                            <i class="fas fa-car text-secondary"></i> Toyota Camry<br>
-                            <i class="fas fa-user text-secondary"></i> Jane Smith
-                        </p>
-                        <div class="mt-2">
-                            <button type="button" class="btn btn-sm btn-outline-primary" data-bs-toggle="modal" data-bs-target="#customerDetailModal">
-                                <i class="fas fa-eye"></i> View
-                            </button>
-                            <a href="/edit-customer/1" class="btn btn-sm btn-outline-secondary">
-                                <i class="fas fa-edit"></i> Edit
-                            </a>
-                        </div>
-                    </div>
-                </div>
-                
-                <!-- Customer Detail Modal -->
-                <div class="modal fade" id="customerDetailModal" tabindex="-1" aria-labelledby="customerDetailModalLabel" aria-hidden="true">
-                    <div class="modal-dialog modal-lg">
-                        <div class="modal-content">
-                            <div class="modal-header">
-                                <h5 class="modal-title" id="customerDetailModalLabel">John Doe - Customer Details</h5>
-                                <button type="button" class="btn-close" data-bs-dismiss="modal" aria-label="Close"></button>
-                            </div>
-                            <div class="modal-body">
-                                <div class="row">
-                                    <div class="col-md-6">
-                                        <h6>Customer Information</h6>
-                                        <dl class="row mb-0">
-                                            <dt class="col-sm-4">Name:</dt>
-                                            <dd class="col-sm-8">John Doe</dd>
-                                            
-                                            <dt class="col-sm-4">Phone:</dt>
-                                            <dd class="col-sm-8">(555) 123-4567</dd>
-                                            
-                                            <dt class="col-sm-4">Email:</dt>
-                                            <dd class="col-sm-8">john@example.com</dd>
-                                            
-                                            <dt class="col-sm-4">City:</dt>
-                                            <dd class="col-sm-8">New York</dd>
-                                        </dl>
-                                    </div>
-                                    <div class="col-md-6">
-                                        <h6>Vehicle Information</h6>
-                                        <dl class="row mb-0">
-                                            <dt class="col-sm-4">Year:</dt>
-                                            <dd class="col-sm-8">2023</dd>
-                                            
-                                            <dt class="col-sm-4">Make:</dt>
-                                            <dd class="col-sm-8">Toyota</dd>
-                                            
-                                            <dt class="col-sm-4">Model:</dt>
-                                            <dd class="col-sm-8">Camry</dd>
-                                            
-                                            <dt class="col-sm-4">Type:</dt>
-                                            <dd class="col-sm-8">New</dd>
-                                        </dl>
-                                    </div>
-                                </div>
-                                <hr>
-                                <div class="row">
-                                    <div class="col-md-6">
-                                        <h6>Sales Information</h6>
-                                        <dl class="row mb-0">
-                                            <dt class="col-sm-4">Sales 1:</dt>
-                                            <dd class="col-sm-8">Jane Smith</dd>
-                                            
-                                            <dt class="col-sm-4">Sales 2:</dt>
-                                            <dd class="col-sm-8">Bob Johnson</dd>
-                                            
-                                            <dt class="col-sm-4">Closer:</dt>
-                                            <dd class="col-sm-8">Alice Brown</dd>
-                                            
-                                            <dt class="col-sm-4">Stack #:</dt>
-                                            <dd class="col-sm-8">A123</dd>
-                                        </dl>
-                                    </div>
-                                    <div class="col-md-6">
-                                        <h6>Additional Information</h6>
-                                        <dl class="row mb-0">
-                                            <dt class="col-sm-4">Trade:</dt>
-                                            <dd class="col-sm-8">Yes</dd>
-                                            
-                                            <dt class="col-sm-4">Demo:</dt>
-                                            <dd class="col-sm-8">No</dd>
-                                            
-                                            <dt class="col-sm-4">Date/Time:</dt>
-                                            <dd class="col-sm-8">2023-05-15 14:30:00</dd>
-                                        </dl>
-                                    </div>
-                                </div>
-                                <hr>
-                                <div class="row">
-                                    <div class="col-12">
-                                        <h6>Notes</h6>
-                                        <p>Customer is interested in financing options</p>
-                                        
-                                        <h6>Results</h6>
-                                        <p>Pending final approval</p>
-                                        
-                                        <h6>Write-up</h6>
-                                        <p>Follow up next week</p>
-                                    </div>
-                                </div>
-                            </div>
-                            <div class="modal-footer">
-                                <button type="button" class="btn btn-secondary" data-bs-dismiss="modal">Close</button>
-                                <a href="/edit-customer/1" class="btn btn-primary">Edit Customer</a>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-        
-        <div class="card shadow-sm mt-4">
+"""
+
+CALENDAR_LEGEND = """        <div class="card shadow-sm mt-4">
             <div class="card-header bg-light">
                 <h5 class="mb-0">
                     <i class="fas fa-info-circle"></i> Calendar Legend
@@ -1478,11 +3084,11 @@ CALENDAR_PAGE = HTML_HEADER + """
                 <div class="mb-3">
                     <div class="d-flex align-items-center mb-2">
                         <div class="me-2 p-2" style="background-color: #e2f0ff; border: 2px solid #007bff; width: 30px; height: 30px; border-radius: 5px;"></div>
-                        <div>Current day (May 20)</div>
+                        <div>Current day ({{ today_label }})</div>
                     </div>
                     <div class="d-flex align-items-center mb-2">
                         <div class="me-2 p-2" style="background-color: #e9ecef; border: 2px solid #6c757d; width: 30px; height: 30px; border-radius: 5px;"></div>
-                        <div>Selected day (May 15)</div>
+                        <div>Selected day ({{ selected_label }})</div>
                     </div>
                     <div class="d-flex align-items-center">
                         <div class="me-2 p-2 position-relative" style="width: 30px; height: 30px; border-radius: 5px; border: 1px solid #dee2e6;">
@@ -1500,9 +3106,160 @@ CALENDAR_PAGE = HTML_HEADER + """
         </div>
     </div>
 </div>
-""" + HTML_FOOTER
+"""
 
-USERS_PAGE = HTML_HEADER + """
+# Most customers listed for the selected calendar day
+CALENDAR_DAY_LIMIT = 50
+
+CALENDAR_PAGE = Template(HTML_HEADER + CALENDAR_TITLE + """<div class="row mb-4">
+    <div class="col-md-8">
+        <div class="card shadow-sm">
+            <div class="card-header bg-light">
+                <div class="d-flex justify-content-between align-items-center">
+                    <div>
+                        <h5 class="mb-0">{{ month_name }} {{ year }}</h5>
+                    </div>
+                    <div class="btn-group">
+                        <a href="{{ previous_link }}" class="btn btn-outline-primary">
+                            <i class="fas fa-chevron-left"></i>
+                        </a>
+                        <a href="/calendar" class="btn btn-outline-primary">Today</a>
+                        <a href="{{ next_link }}" class="btn btn-outline-primary">
+                            <i class="fas fa-chevron-right"></i>
+                        </a>
+                    </div>
+                </div>
+            </div>
+            <div class="card-body">
+""" + CALENDAR_GRID_HEAD + """                    <tbody>{{ weeks|safe }}
+                    </tbody>
+                </table>
+            </div>
+        </div>
+    </div>
+    
+    <div class="col-md-4">
+        <div class="card shadow-sm">
+            <div class="card-header bg-light">
+                <h5 class="mb-0">
+                    <i class="fas fa-list"></i> {{ day_title }}
+                </h5>
+            </div>
+            <div class="card-body">{{ day_list|safe }}
+            </div>
+        </div>
+        
+""" + CALENDAR_LEGEND + HTML_FOOTER)
+
+CALENDAR_WEEK = Template("""
+                        <tr>{{ cells|safe }}
+                        </tr>""")
+
+CALENDAR_BLANK_CELL = Template("""
+                            <td></td>""")
+
+CALENDAR_CELL = Template("""
+                            <td>
+                                <a href="{{ link }}" class="{{ classes }}">
+                                    <span class="date-number">{{ day }}</span>{{ marks|safe }}
+                                </a>
+                            </td>""")
+
+CALENDAR_CELL_MARKS = Template("""
+                                    <span class="badge bg-primary date-count">{{ count }}</span>
+                                    <span class="date-dot"></span>""")
+
+CALENDAR_DAY_PROMPT = Template("""
+                <p class="text-muted mb-0">Choose a date to see its customers</p>""")
+
+CALENDAR_DAY_LIST = Template("""
+                <div class="list-group list-group-flush">{{ items|safe }}
+                </div>""")
+
+CALENDAR_DAY_CUSTOMER = Template("""
+                    <div class="list-group-item px-0">
+                        <div class="d-flex w-100 justify-content-between">
+                            <h6 class="mb-1">{{ name }}</h6>
+                            <small class="text-muted">{{ time }}</small>
+                        </div>
+                        <p class="mb-1 small">
+                            <i class="fas fa-map-marker-alt text-secondary"></i> {{ city }}<br>
+                            <i class="fas fa-car text-secondary"></i> {{ vehicle }}<br>
+                            <i class="fas fa-user text-secondary"></i> {{ sales }}
+                        </p>
+                        <div class="mt-2">
+                            <a href="/edit-customer/{{ id }}" class="btn btn-sm btn-outline-secondary">
+                                <i class="fas fa-edit"></i> Edit
+                            </a>
+                        </div>
+                    </div>""")
+
+CALENDAR_DAY_EMPTY = Template("""
+                    <p class="text-muted mb-0">No customers on this day</p>""")
+
+CALENDAR_DAY_MORE = Template("""
+                    <p class="text-muted small mt-2 mb-0">and {{ count }} more</p>""")
+
+def _calendar_link(year, month, day=None):
+    link = f"/calendar?month={month}&year={year}"
+    return link if day is None else f"/calendar?day={day}&{link[len('/calendar?'):]}"
+
+def render_calendar(year, month, selected=None, today=None):
+    """Month grid with daily customer counts and the customers of the selected day"""
+    today = today or datetime.date.today()
+    first = datetime.date(year, month, 1)
+    following = (first + datetime.timedelta(days=31)).replace(day=1)
+    previous = first - datetime.timedelta(days=1)
+    counts = CALENDAR_INDEX.counts(first.isoformat(), following.isoformat())
+
+    weeks = []
+    for week in calendar.Calendar(firstweekday=6).monthdatescalendar(year, month):
+        cells = []
+        for day in week:
+            if day.month != month:
+                cells += CALENDAR_BLANK_CELL.render()
+                continue
+            count = counts.get(day.isoformat(), 0)
+            classes = ["date-cell"]
+            if day == today:
+                classes.append("current-date")
+            if day == selected:
+                classes.append("selected-date")
+            if count:
+                classes.append("has-records")
+            cells += CALENDAR_CELL.render(
+                link=_calendar_link(year, month, day.day), classes=" ".join(classes), day=day.day,
+                marks=CALENDAR_CELL_MARKS.render(count=count) if count else [])
+        weeks += CALENDAR_WEEK.render(cells=cells)
+
+    if selected is None:
+        day_title = "Select a day"
+        day_list = CALENDAR_DAY_PROMPT.render()
+    else:
+        total = CALENDAR_INDEX.count_for_date(selected.isoformat())
+        rows = CUSTOMERS.get_for_date(selected.isoformat(), CALENDAR_DAY_LIMIT) if total else []
+        day_title = f"Customers for {selected.strftime('%B')} {selected.day}, {selected.year}"
+        items = []
+        for row in rows:
+            items += CALENDAR_DAY_CUSTOMER.render(
+                name=row["name"], time=row["datetime"][11:16], city=row["city"] or "",
+                vehicle=" ".join(value for value in (row["make"], row["model"]) if value),
+                sales=row["sales1"] or "", id=row["id"])
+        if not items:
+            items = CALENDAR_DAY_EMPTY.render()
+        elif total > len(rows):
+            items += CALENDAR_DAY_MORE.render(count=total - len(rows))
+        day_list = CALENDAR_DAY_LIST.render(items=items)
+
+    return CALENDAR_PAGE.render(
+        month_name=first.strftime('%B'), year=year,
+        previous_link=_calendar_link(previous.year, previous.month),
+        next_link=_calendar_link(following.year, following.month),
+        weeks=weeks, day_title=day_title, day_list=day_list,
+        today_label=f"{today.strftime('%b')} {today.day}",
+        selected_label=f"{selected.strftime('%b')} {selected.day}" if selected else "none")
+
+USERS_PAGE = Template(HTML_HEADER + """
 <div class="row mb-4">
     <div class="col-12">
         <div class="card shadow-sm">
@@ -1586,10 +3343,10 @@ USERS_PAGE = HTML_HEADER + """
         </div>
     </div>
 </div>
-""" + HTML_FOOTER
+""" + HTML_FOOTER)
 
 # Demo information page
-INFO_PAGE = HTML_HEADER + """
+INFO_PAGE = Template(HTML_HEADER + """
 <div class="row mb-4">
     <div class="col-12">
         <div class="card shadow-sm">
@@ -1655,167 +3412,1048 @@ INFO_PAGE = HTML_HEADER + """
         </div>
     </div>
 </div>
-""" + HTML_FOOTER
+""" + HTML_FOOTER)
+
+# Pages that never change are compressed and tagged once at startup instead
+# of on every request
+def parse_accept_encoding(header):
+    """Map each content coding of an Accept-Encoding header to its q-value"""
+    accepted = {}
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header lists etag, using weak comparison"""
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+class StaticPage:
+    """A fixed page held as identity, gzip and deflate bytes, each with a strong ETag"""
+
+    CODINGS = ("gzip", "deflate")
+
+    def __init__(self, body, content_type="text/html"):
+        self.content_type = content_type
+        self.bodies = {"identity": body}
+        for coding, compressed in (("gzip", gzip.compress(body, 9, mtime=0)),
+                                   ("deflate", zlib.compress(body, 9))):
+            if len(compressed) < len(body):
+                self.bodies[coding] = compressed
+        digest = hashlib.sha256(body).hexdigest()[:24]
+        # Each coding is a different representation, so each needs its own tag
+        self.etags = {coding: f'"{digest}"' if coding == "identity" else f'"{digest}-{coding}"'
+                      for coding in self.bodies}
+
+    def choose_coding(self, accept_encoding):
+        """Compressed variant with the client's highest q-value, gzip first on ties"""
+        accepted = parse_accept_encoding(accept_encoding or "")
+        qualities = {coding: accepted.get(coding, accepted.get("*", 0)) for coding in self.CODINGS
+                     if coding in self.bodies}
+        best = max(qualities, key=qualities.get, default=None)
+        return best if best is not None and qualities[best] > 0 else "identity"
+
+# Answer for paths no route matches
+NOT_FOUND_PAGE = Template(HTML_HEADER + """
+<div class="row mb-4">
+    <div class="col-12">
+        <div class="card shadow-sm">
+            <div class="card-body">
+                <h1 class="card-title">
+                    <i class="fas fa-question-circle"></i> Page not found
+                </h1>
+                <p class="text-muted">There is no page at this address.</p>
+                <a href="/" class="btn btn-primary">
+                    <i class="fas fa-tachometer-alt"></i> Back to the dashboard
+                </a>
+            </div>
+        </div>
+    </div>
+</div>
+""" + HTML_FOOTER)
+
+# Fixed pages by path, built once at startup
+STATIC_PAGES = {
+    path: StaticPage(b"".join(parts))
+    for path, parts in (
+        ("/login", LOGIN_PAGE.render(alert=[])),
+        ("/search", render_search_page()),
+        ("/add-customer", ADD_CUSTOMER_PAGE.render(alert=[])),
+        ("/users", USERS_PAGE.render()),
+        ("/info", INFO_PAGE.render()),
+    )
+}
+
+# Streamed responses are written in chunks of about this many bytes
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# Seconds a kept-alive connection may sit idle before it is closed
+KEEP_ALIVE_TIMEOUT = 5
+
+# Seconds a worker waits for the next request on a connection before
+# leaving it to the idle watcher
+IDLE_GRACE = 0.002
+
+# Seconds a started request may take to arrive, or a response to be sent,
+# before the connection is dropped
+REQUEST_TIMEOUT = 30
+
+# Requests served on one connection before it is closed
+MAX_KEEP_ALIVE_REQUESTS = 100
+
+# Routing. Paths without parameters are looked up in a dict. Patterns with
+# parameters are compiled once and filed under their literal prefix up to
+# the last slash before the first parameter, so a request only tries the
+# patterns under the prefixes of its own path, longest prefix first
+ROUTE_PARAMETER = re.compile(r"<(?:(\w+):)?(\w+)>")
+
+# Path parameter types: what a parameter matches and how its value is converted
+ROUTE_CONVERTERS = {
+    "str": (r"[^/]+", str),
+    "int": (r"[0-9]+", int),
+    "path": (r".+", str),
+}
+
+class Router:
+    """Dispatch table from request paths to handlers by method, with typed path parameters"""
+
+    def __init__(self):
+        self.static = {}
+        self.patterns = {}
+        # (method, pattern) of routes whose handler reads the request body itself
+        self.streamed = set()
+
+    def add(self, pattern, method, handler, streams_body=False):
+        """Route requests for paths like /api/customers/<int:customer_id> to handler"""
+        regex = []
+        names = []
+        converters = []
+        position = 0
+        for parameter in ROUTE_PARAMETER.finditer(pattern):
+            kind = parameter.group(1) or "str"
+            if kind not in ROUTE_CONVERTERS:
+                raise ValueError(f"Unknown parameter type {kind!r} in route {pattern}")
+            regex.append(re.escape(pattern[position:parameter.start()]))
+            regex.append(f"({ROUTE_CONVERTERS[kind][0]})")
+            names.append(parameter.group(2))
+            converters.append(ROUTE_CONVERTERS[kind][1])
+            position = parameter.end()
+        if not names:
+            handlers = self.static.setdefault(pattern, {})
+        else:
+            regex = re.compile("".join(regex) + re.escape(pattern[position:]))
+            prefix = pattern[:pattern.rfind("/", 0, ROUTE_PARAMETER.search(pattern).start()) + 1]
+            routes = self.patterns.setdefault(prefix, [])
+            for route in routes:
+                if route[0].pattern == regex.pattern:
+                    handlers = route[3]
+                    break
+            else:
+                handlers = {}
+                routes.append((regex, names, converters, handlers, pattern))
+        if method in handlers:
+            raise ValueError(f"{method} {pattern} is already routed")
+        handlers[method] = handler
+        if streams_body:
+            self.streamed.add((method, pattern))
+
+    def route(self, pattern, *methods, streams_body=False):
+        """Decorator adding a handler for the given methods, GET by default"""
+        def register(handler):
+            for method in methods or ("GET",):
+                self.add(pattern, method, handler, streams_body)
+            return handler
+        return register
+
+    def match(self, path):
+        """(handlers by method, path parameters, route pattern) for a path, or (None, None, None)"""
+        handlers = self.static.get(path)
+        if handlers is not None:
+            return handlers, {}, path
+        slash = path.rfind("/")
+        while slash >= 0:
+            for regex, names, converters, handlers, pattern in self.patterns.get(path[:slash + 1], ()):
+                match = regex.fullmatch(path)
+                if match is not None:
+                    return handlers, {name: convert(value)
+                                      for name, convert, value in zip(names, converters, match.groups())}, pattern
+            slash = path.rfind("/", 0, slash)
+        return None, None, None
+
+ROUTES = Router()
 
 class CustomerLoggingHandler(http.server.SimpleHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests; main() can set
+    # HTTP/1.0 to close after every response instead
+    protocol_version = 'HTTP/1.1'
+    # The socket timeout covers reading a request and sending its response;
+    # waiting for the next request uses keep_alive_timeout instead
+    timeout = REQUEST_TIMEOUT
+    keep_alive_timeout = KEEP_ALIVE_TIMEOUT
+    max_keep_alive_requests = MAX_KEEP_ALIVE_REQUESTS
+    # Responses go out in whole writes, so don't hold small ones back for ACKs
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        """Serve the requests that have arrived, then leave an idle connection to the server"""
+        # A connection the server watched while idle keeps its request count
+        self.requests_handled = getattr(self.server, 'requests_served', {}).pop(self.request, 0)
+        self.close_connection = True
+        self.idle = False
+        while True:
+            if not self._request_buffered():
+                watched = hasattr(self.server, 'requests_served')
+                # A client sending its next request straight away is served without
+                # a trip through the server's watcher, which otherwise hands the
+                # connection to a worker once a request arrives. A server without
+                # a watcher waits here, but only up to the keep-alive timeout
+                wait = IDLE_GRACE if watched else self.keep_alive_timeout
+                if not select.select([self.connection], [], [], wait)[0]:
+                    self.idle = watched
+                    return
+                try:
+                    # Readable with nothing to read means the client closed
+                    if not self.rfile.peek(1):
+                        return
+                except (TimeoutError, ConnectionError):
+                    return
+            self.requests_handled += 1
+            self.handle_one_request()
+            if self.close_connection:
+                return
+
+    def _request_buffered(self):
+        """Whether the next request has started to arrive, without waiting for it"""
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except ConnectionError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def setup(self):
+        super().setup()
+        self.wfile = CountingWriter(self.wfile)
+
+    def parse_request(self):
+        # A request's time starts once its request line has arrived
+        self.started = time.perf_counter()
+        self.route = 'unmatched'
+        self.status = None
+        self.written_before = self.wfile.written
+        METRICS.request_started()
+        return super().parse_request()
+
+    def handle_one_request(self):
+        """Handle a request and record it in METRICS"""
+        self.started = None
+        failed = False
+        try:
+            super().handle_one_request()
+        except (ConnectionError, TimeoutError):
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            if self.started is not None and self.status is None and not failed:
+                # The client went away or stalled before there was anything to answer
+                METRICS.request_aborted()
+            elif self.started is not None:
+                # No status means the handler raised before responding
+                status = 500 if self.status is None else self.status
+                METRICS.request_finished(self.command, self.route, status,
+                                         time.perf_counter() - self.started,
+                                         self.wfile.written - self.written_before)
+
+    def send_response(self, code, message=None):
+        self.status = code
+        super().send_response(code, message)
+        if not self.close_connection and self._last_on_connection():
+            self.send_header('Connection', 'close')
+
+    def _last_on_connection(self):
+        """Whether to close after this response rather than keep the connection"""
+        # A server that doesn't watch idle connections would have to wait on them
+        return (not hasattr(self.server, 'requests_served')
+                or self.requests_handled >= self.max_keep_alive_requests)
+
     def do_GET(self):
         parsed_path = urlparse(self.path)
         path = parsed_path.path
-        
-        # Default to root path
-        if path == '/':
-            self._send_response(DASHBOARD_PAGE)
-            return
-            
-        # Handle login page
-        elif path == '/login':
-            self._send_response(LOGIN_PAGE)
+        # Static files are public: the login page uses them too
+        asset = ASSETS.get(path)
+        if asset is not None:
+            self.route = 'static-asset'
+            refresh_asset(asset)
+            # Only the URL of the content now on disk may be kept for good
+            self._send_asset(asset, immutable=path == asset.fingerprinted_url, head=self.command == 'HEAD')
             return
-            
-        # Handle dashboard
-        elif path == '/dashboard':
-            self._send_response(DASHBOARD_PAGE)
-            return
-            
-        # Handle customers list
-        elif path == '/customers':
-            self._send_response(CUSTOMERS_PAGE)
+        handlers, params = self._match_route(path)
+        if path not in PUBLIC_PATHS and self._session_user() is None:
+            self._send_login_required(path)
             return
-            
-        # Handle search page
-        elif path == '/search':
-            self._send_response(SEARCH_PAGE)
+        handler = self._route_handler(handlers, path)
+        if handler is not None:
+            handler(self, parse_qs(parsed_path.query), **params)
+
+    def do_POST(self):
+        parsed_path = urlparse(self.path)
+        path = parsed_path.path
+        handlers, params = self._match_route(path)
+        if (self.command, self.route) in ROUTES.streamed:
+            # The handler reads the body as it arrives, so check the session before any of it
+            if path not in PUBLIC_PATHS and self._session_user() is None:
+                # Refuse the body unread; send_error closes the connection
+                self.send_error(401, 'Login required')
+                return
+            handlers[self.command](self, parse_qs(parsed_path.query), **params)
             return
-            
-        # Handle add customer page
-        elif path == '/add-customer':
-            self._send_response(ADD_CUSTOMER_PAGE)
+
+        # Read the whole body first, whatever its type, so a kept-alive
+        # connection is left at the next request
+        form = self._read_form()
+        if form is None:
             return
-            
-        # Handle calendar page
-        elif path == '/calendar':
-            self._send_response(CALENDAR_PAGE)
+        if path not in PUBLIC_PATHS and self._session_user() is None:
+            self._send_login_required(path)
             return
-            
-        # Handle users page
-        elif path == '/users':
-            self._send_response(USERS_PAGE)
+        handler = self._route_handler(handlers, path)
+        if handler is not None:
+            handler(self, form, parse_qs(parsed_path.query), **params)
+
+    def do_HEAD(self):
+        # The GET response, status and headers included; the _send_ methods leave out the body
+        self.do_GET()
+
+    def do_PUT(self):
+        # No route takes a body other than by POST: skip it unbuffered so a
+        # kept-alive connection is left at the next request, then answer 405
+        # on known paths instead of http.server's 501
+        parsed_path = urlparse(self.path)
+        path = parsed_path.path
+        handlers, params = self._match_route(path)
+        content_length = self._content_length()
+        if content_length is None:
             return
-            
-        # Handle info page
-        elif path == '/info':
-            self._send_response(INFO_PAGE)
+        self._body_left = content_length
+        self._discard_body()
+        if path not in PUBLIC_PATHS and self._session_user() is None:
+            self._send_login_required(path)
             return
-            
-        # Handle logout (redirect to login)
-        elif path == '/logout':
-            self.send_response(302)
-            self.send_header('Location', '/login')
+        handler = self._route_handler(handlers, path)
+        if handler is not None:
+            handler(self, parse_qs(parsed_path.query), **params)
+
+    do_DELETE = do_PUT
+
+    def _match_route(self, path):
+        """Handlers by method and path parameters for a path, labelling the request with its route"""
+        handlers, params, route = ROUTES.match(path)
+        if route is not None:
+            self.route = route
+        return handlers, params
+
+    def _route_handler(self, handlers, path):
+        """The matched route's handler for this method, or None after a 404 or 405"""
+        method = 'GET' if self.command == 'HEAD' else self.command
+        handler = None if handlers is None else handlers.get(method)
+        if handler is not None:
+            return handler
+        if handlers is not None:
+            allowed = list(handlers)
+            if 'GET' in handlers:
+                allowed.append('HEAD')
+            self.send_response(405)
+            self.send_header('Allow', ', '.join(allowed))
+            self.send_header('Content-Length', '0')
             self.end_headers()
+        elif path.startswith('/api/'):
+            self._send_json({"error": "Not found"}, 404)
+        else:
+            self._send_page(NOT_FOUND_PAGE.render(), 404)
+        return None
+
+    @ROUTES.route('/')
+    @ROUTES.route('/dashboard')
+    def _dashboard(self, query):
+        self._send_page(render_dashboard())
+
+    @ROUTES.route('/login')
+    def _login_page(self, query):
+        self._send_static(STATIC_PAGES['/login'])
+
+    @ROUTES.route('/customers')
+    def _customers(self, query):
+        """Customers list, one keyset page at a time"""
+        page_size = query.get('page_size', [DEFAULT_PAGE_SIZE])[0]
+        if page_size == 'all':
+            # Every customer, streamed as it is read from the store
+            self._send_stream(render_customers_page(CUSTOMERS.iter_newest(), None))
             return
-            
-        # Default response for unknown paths
+        try:
+            page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+        except ValueError:
+            page_size = DEFAULT_PAGE_SIZE
+        rows, next_cursor, prev_cursor = list_customers(
+            page_size, query.get('after', [None])[0], query.get('before', [None])[0])
+        self._send_stream(render_customers_page(rows, page_size, next_cursor, prev_cursor))
+
+    @ROUTES.route('/customers.csv')
+    @ROUTES.route('/search.csv')
+    def _customers_csv(self, query):
+        """Spreadsheet of every customer, or of a search's matches"""
+        search_term = query.get('search_term', [''])[0].strip()
+        rows = iter_customers(search_term, query.get('search_field', ['all'])[0],
+                              columns=CUSTOMER_CSV_COLUMNS)
+        filename = export_filename('search' if search_term else 'customers')
+        self._send_stream(render_csv(rows), 'text/csv; charset=utf-8',
+                          [('Content-Disposition', f'attachment; filename="{filename}"')])
+
+    @ROUTES.route('/search')
+    def _search(self, query):
+        search_term = query.get('search_term', [''])[0].strip()
+        search_field = query.get('search_field', ['all'])[0]
+        if not search_term:
+            self._send_static(STATIC_PAGES['/search'])
+            return
+        total, rows = search_customers(search_term, search_field, SEARCH_RESULT_LIMIT)
+        self._send_page(render_search_page(search_term, search_field,
+                                           render_search_results(search_term, search_field, total, rows)))
+
+    @ROUTES.route('/api/suggest')
+    def _suggest(self, query):
+        """Typeahead suggestions for the search box"""
+        term = query.get('q', [''])[0]
+        field = query.get('field', ['all'])[0]
+        try:
+            limit = min(int(query.get('limit', [SUGGEST_LIMIT])[0]), 50)
+        except ValueError:
+            limit = SUGGEST_LIMIT
+        self._send_json({"query": term, "suggestions": suggest_customers(term, field, max(limit, 1))})
+
+    @ROUTES.route('/api/customers')
+    def _api_customers(self, query):
+        """Search or page through customers as JSON"""
+        search_term = query.get('q', [''])[0].strip()
+        try:
+            limit = max(1, min(int(query.get('limit', [DEFAULT_PAGE_SIZE])[0]), MAX_PAGE_SIZE))
+        except ValueError:
+            limit = DEFAULT_PAGE_SIZE
+        if search_term:
+            total, rows = search_customers(search_term, query.get('field', ['all'])[0], limit)
+            self._send_json({"total": total, "customers": [customer_record(row) for row in rows]})
         else:
-            self._send_response(INFO_PAGE)
+            rows, next_cursor, prev_cursor = list_customers(
+                limit, query.get('after', [None])[0], query.get('before', [None])[0])
+            self._send_json({"customers": [customer_record(row) for row in rows],
+                             "next": next_cursor, "prev": prev_cursor})
+
+    @ROUTES.route('/api/customers/export')
+    def _api_export(self, query):
+        """Stream every customer, or a search's matches, as one JSON object per line"""
+        rows = iter_customers(query.get('q', [''])[0].strip(), query.get('field', ['all'])[0],
+                              columns=CUSTOMER_JSON_COLUMNS)
+        self._send_stream(render_ndjson(rows), 'application/x-ndjson')
+
+    @ROUTES.route('/api/customers/<int:customer_id>')
+    def _api_customer(self, query, customer_id):
+        try:
+            row = CUSTOMERS.get_by_id(customer_id)
+        except OverflowError:
+            row = None
+        if row is None:
+            self._send_json({"error": "Customer not found"}, 404)
+        else:
+            self._send_json(customer_record(row))
+
+    @ROUTES.route('/add-customer')
+    def _add_customer_page(self, query):
+        self._send_static(STATIC_PAGES['/add-customer'])
+
+    @ROUTES.route('/calendar')
+    def _calendar(self, query):
+        today = datetime.date.today()
+        try:
+            year = int(query.get('year', [today.year])[0])
+            month = int(query.get('month', [today.month])[0])
+            day = query.get('day', [None])[0]
+            if day is not None:
+                selected = datetime.date(year, month, int(day))
+            elif (year, month) == (today.year, today.month):
+                selected = today
+            else:
+                selected = None
+            self._send_page(render_calendar(year, month, selected, today))
+        except (ValueError, OverflowError):
+            self._send_page(render_calendar(today.year, today.month, today, today))
+
+    @ROUTES.route('/users')
+    def _users_page(self, query):
+        self._send_static(STATIC_PAGES['/users'])
+
+    @ROUTES.route('/info')
+    def _info_page(self, query):
+        self._send_static(STATIC_PAGES['/info'])
+
+    @ROUTES.route('/logout')
+    def _logout(self, query):
+        """End the session and go back to the login page"""
+        cookie = self._session_cookie()
+        if cookie is not None:
+            SESSIONS.revoke(cookie)
+        self._send_redirect('/login', [('Set-Cookie', session_cookie('', 0))])
+
+    @ROUTES.route('/metrics')
+    def _metrics(self, query):
+        """Request metrics in the Prometheus text format"""
+        queue_depth = getattr(self.server, 'queue_depth', None)
+        self._send_page([METRICS.render(queue_depth).encode('utf-8')], content_type=METRICS_CONTENT_TYPE)
+
+    @ROUTES.route('/login', 'POST')
+    def _login(self, form, query):
+        username = form.get('username', [''])[0]
+        password = form.get('password', [''])[0]
+
+        # Look the user up by username, then verify the password securely.
+        # Only known users are throttled by name: unknown ones cost no bcrypt
+        user = USERS.find_by_username(username)
+        retry_after = LOGIN_IP_BUCKETS.take(self.client_address[0])
+        if not retry_after and user is not None:
+            retry_after = LOGIN_USER_BUCKETS.take(user["id"])
+        if retry_after:
+            self._send_throttled(retry_after)
             return
-            
-    def do_POST(self):
-        # Handle login form submission
-        if self.path == '/login':
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length).decode('utf-8')
-            params = parse_qs(post_data)
-            
-            username = params.get('username', [''])[0]
-            password = params.get('password', [''])[0]
-            
-            # Check credentials against USERS list with secure password verification
-            user_authenticated = False
-            for user in USERS:
-                if user["username"] == username and verify_password(password, user["password"]):
-                    user_authenticated = True
-                    break
-                    
-            if user_authenticated:
-                self.send_response(302)
-                self.send_header('Location', '/')
-                self.end_headers()
+        user_authenticated = user is not None and offload_verify_password(password, user["password"])
+
+        if user_authenticated:
+            if bcrypt_cost(user["password"]) != BCRYPT_COST:
+                rehash_in_background(user, password)
+            self._send_redirect('/', [('Set-Cookie', session_cookie(SESSIONS.create(user["id"])))])
+        else:
+            self._send_page(LOGIN_PAGE.render(alert=[]))
+
+    @ROUTES.route('/register', 'POST')
+    def _register(self, form, query):
+        new_username = form.get('new-username', [''])[0]
+        display_name = form.get('display-name', [''])[0]
+        email = form.get('email', [''])[0]
+        new_password = form.get('new-password', [''])[0]
+        confirm_password = form.get('confirm-password', [''])[0]
+
+        # Validate form data
+        if not new_username or not display_name or not email or not new_password:
+            # Missing required fields
+            self._send_page(LOGIN_PAGE.render(
+                alert=render_alert('Please fill in all required fields', register_tab=True)))
+        elif new_password != confirm_password:
+            # Passwords don't match
+            self._send_page(LOGIN_PAGE.render(
+                alert=render_alert('Passwords do not match', register_tab=True)))
+        else:
+            # Hashing the new password is bcrypt work too
+            retry_after = LOGIN_IP_BUCKETS.take(self.client_address[0])
+            if retry_after:
+                self._send_throttled(retry_after, register_tab=True)
+                return
+
+            # Register the new user
+            success, message = register_user(new_username, new_password, display_name, email)
+
+            if success:
+                # Registration successful, redirect to login
+                self._send_page(LOGIN_PAGE.render(
+                    alert=render_alert('Registration successful! Please log in with your new credentials.')))
             else:
-                self._send_response(LOGIN_PAGE)
-                
-        # Handle user registration
-        elif self.path == '/register':
+                # Registration failed
+                self._send_page(LOGIN_PAGE.render(alert=render_alert(message, register_tab=True)))
+
+    @ROUTES.route('/add-customer', 'POST')
+    def _add_customer(self, form, query):
+        data = {field: form.get(field, [''])[0].strip() for field in CUSTOMER_FIELDS}
+
+        # Required fields as in customer.cgi, and the values the schema allows
+        error = customer_error(data)
+        if error is not None:
+            self._send_page(ADD_CUSTOMER_PAGE.render(alert=render_alert(error)))
+        else:
+            CUSTOMERS.add(data)
+            self._send_redirect('/customers')
+
+    @ROUTES.route('/api/customers/import', 'POST', streams_body=True)
+    def _import(self, query):
+        # Imports are read as they arrive rather than as one form body
+        self._import_customers(query)
+
+    def _read_form(self):
+        """Parse the urlencoded request body, or answer an error and return None"""
+        content_length = self._content_length()
+        if content_length is None:
+            return None
+        return parse_qs(self.rfile.read(content_length).decode('utf-8', 'replace'))
+
+    def _content_length(self):
+        """Length of the request body (0 if there is none), or None after answering an error"""
+        if 'Content-Length' not in self.headers:
+            if 'Transfer-Encoding' in self.headers:
+                self.send_error(411, 'Length Required')
+                return None
+            return 0
+        try:
             content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length).decode('utf-8')
-            params = parse_qs(post_data)
-            
-            new_username = params.get('new-username', [''])[0]
-            display_name = params.get('display-name', [''])[0]
-            email = params.get('email', [''])[0]
-            new_password = params.get('new-password', [''])[0]
-            confirm_password = params.get('confirm-password', [''])[0]
-            
-            # Validate form data
-            if not new_username or not display_name or not email or not new_password:
-                # Missing required fields
-                self._send_response(LOGIN_PAGE + """
-                <script>
-                    document.addEventListener('DOMContentLoaded', function() {
-                        document.getElementById('register-tab').click();
-                        alert('Please fill in all required fields');
-                    });
-                </script>
-                """)
-            elif new_password != confirm_password:
-                # Passwords don't match
-                self._send_response(LOGIN_PAGE + """
-                <script>
-                    document.addEventListener('DOMContentLoaded', function() {
-                        document.getElementById('register-tab').click();
-                        alert('Passwords do not match');
-                    });
-                </script>
-                """)
+        except ValueError:
+            content_length = -1
+        if content_length < 0:
+            self.send_error(400, 'Bad Content-Length')
+            return None
+        return content_length
+
+    def _body_lines(self, length):
+        """Yield the request body as lines of text, reading one line at a time"""
+        self._body_left = length
+        while self._body_left > 0:
+            line = self.rfile.readline(min(self._body_left, IMPORT_LINE_LIMIT))
+            if not line:
+                break
+            self._body_left -= len(line)
+            if not line.endswith(b'\n') and self._body_left > 0:
+                raise ValueError(f'Line longer than {IMPORT_LINE_LIMIT} bytes')
+            yield line.decode('utf-8-sig')
+
+    def _discard_body(self):
+        """Skip whatever _body_lines didn't read, so the connection stays usable"""
+        while self._body_left > 0:
+            data = self.rfile.read(min(self._body_left, STREAM_CHUNK_SIZE))
+            if not data:
+                break
+            self._body_left -= len(data)
+
+    def _import_customers(self, query):
+        """Bulk import customers from a CSV or NDJSON request body"""
+        content_length = self._content_length()
+        if content_length is None:
+            return
+        import_format = query.get('format', [IMPORT_CONTENT_TYPES.get(self.headers.get_content_type())])[0]
+        if import_format not in IMPORT_FORMATS:
+            # Nothing of the body has been read, so this answer closes the connection
+            self.send_error(415, 'Send text/csv or application/x-ndjson')
+            return
+        report = import_customers(CUSTOMERS, IMPORT_FORMATS[import_format](self._body_lines(content_length)))
+        self._discard_body()
+        self._send_json(report, 400 if 'error' in report else 200)
+
+    def _send_asset(self, asset, immutable=False, head=False):
+        """Send a static file with sendfile, honouring If-None-Match, Range and If-Range"""
+        path, etag, coding = asset.path, asset.etag, None
+        if asset.gzip_path is not None:
+            accepted = parse_accept_encoding(self.headers.get('Accept-Encoding', ''))
+            if accepted.get('gzip', accepted.get('*', 0)) > 0:
+                path, etag, coding = asset.gzip_path, asset.gzip_etag, 'gzip'
+        try:
+            file = open(path, 'rb')
+        except OSError:
+            self.send_error(404, 'File not found')
+            return
+        with file:
+            size = os.fstat(file.fileno()).st_size
+            if etag_matches(self.headers.get('If-None-Match', ''), etag):
+                self.send_response(304)
+                self._send_asset_headers(asset, etag, immutable)
+                self.end_headers()
+                return
+            first, last = 0, size - 1
+            byte_range = None
+            if 'Range' in self.headers and self.headers.get('If-Range', etag) == etag:
+                byte_range = parse_byte_range(self.headers['Range'], size)
+            if byte_range is False:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if byte_range is None:
+                self.send_response(200)
             else:
-                # Register the new user
-                success, message = register_user(new_username, new_password, display_name, email)
-                
-                if success:
-                    # Registration successful, redirect to login
-                    self._send_response(LOGIN_PAGE + """
-                    <script>
-                        document.addEventListener('DOMContentLoaded', function() {
-                            alert('Registration successful! Please log in with your new credentials.');
-                        });
-                    </script>
-                    """)
-                else:
-                    # Registration failed
-                    self._send_response(LOGIN_PAGE + f"""
-                    <script>
-                        document.addEventListener('DOMContentLoaded', function() {{
-                            document.getElementById('register-tab').click();
-                            alert('{message}');
-                        }});
-                    </script>
-                    """)
+                first, last = byte_range
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {first}-{last}/{size}')
+            self.send_header('Content-type', asset.content_type)
+            if coding is not None:
+                self.send_header('Content-Encoding', coding)
+            self.send_header('Content-Length', str(last - first + 1))
+            self._send_asset_headers(asset, etag, immutable)
+            self.end_headers()
+            if not head and last >= first:
+                self._send_file_range(file, first, last - first + 1)
+
+    def _send_file_range(self, file, offset, count):
+        # The kernel copies the file to the socket; nothing passes through Python
+        self.connection.sendfile(file, offset, count)
+        self.wfile.written += count
+
+    def _send_asset_headers(self, asset, etag, immutable):
+        self.send_header('ETag', etag)
+        if asset.gzip_path is not None:
+            self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Cache-Control', IMMUTABLE_CACHE_CONTROL if immutable else 'no-cache')
+
+    def _session_cookie(self):
+        """Value of the session cookie sent with this request, or None"""
+        header = self.headers.get('Cookie')
+        if header is None:
+            return None
+        for part in header.split(';'):
+            name, _, value = part.partition('=')
+            if name.strip() == SESSION_COOKIE:
+                return value.strip()
+        return None
+
+    def _session_user(self):
+        """The active user signed in with this request's session cookie, or None"""
+        cookie = self._session_cookie()
+        if cookie is None:
+            return None
+        user = USERS.get(SESSIONS.user_id(cookie))
+        return user if user is not None and user["is_active"] else None
+
+    def _send_throttled(self, retry_after, register_tab=False):
+        """Send the login page back with a 429 and when to try again"""
+        self._send_page(LOGIN_PAGE.render(alert=render_alert('Too many attempts, please try again shortly',
+                                                             register_tab=register_tab)),
+                        429, headers=[('Retry-After', str(math.ceil(retry_after)))])
+
+    def _send_login_required(self, path):
+        """Send API clients a 401 and browsers to the login page"""
+        if path.startswith('/api/'):
+            self._send_json({"error": "Login required"}, 401)
         else:
-            # For other POST requests, just redirect back to the dashboard
-            self.send_response(302)
-            self.send_header('Location', '/')
+            self._send_redirect('/login')
+
+    def _send_redirect(self, location, headers=()):
+        self.send_response(302)
+        self.send_header('Location', location)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _send_page(self, parts, status=200, content_type='text/html', headers=()):
+        """Send a rendered template; the headers go out in the same write as the body"""
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(sum(map(len, parts))))
+        self.wfile.hold()
+        self.end_headers()
+        self.wfile.release([] if self.command == 'HEAD' else parts)
+
+    def _send_static(self, page):
+        """Send a cached page in the best encoding the client accepts, or 304 if it has it"""
+        coding = page.choose_coding(self.headers.get('Accept-Encoding'))
+        etag = page.etags[coding]
+        if etag_matches(self.headers.get('If-None-Match', ''), etag):
+            self.send_response(304)
+            self._send_cache_headers(etag)
             self.end_headers()
-            
-    def _send_response(self, content):
+            return
+        body = page.bodies[coding]
+        self.send_response(200)
+        self.send_header('Content-type', page.content_type)
+        if coding != 'identity':
+            self.send_header('Content-Encoding', coding)
+        self.send_header('Content-Length', str(len(body)))
+        self._send_cache_headers(etag)
+        self.wfile.hold()
+        self.end_headers()
+        self.wfile.release([] if self.command == 'HEAD' else [body])
+
+    def _send_cache_headers(self, etag):
+        self.send_header('ETag', etag)
+        self.send_header('Vary', 'Accept-Encoding')
+        # Browsers keep the page but check the tag before using it again
+        self.send_header('Cache-Control', 'no-cache')
+
+    def _send_stream(self, chunks, content_type='text/html', headers=()):
+        """Send a body produced piece by piece, without building it in memory.
+
+        HTTP/1.1 clients get chunked transfer encoding, and keep their
+        connection when keep-alive is on; HTTP/1.0 clients get the raw body,
+        ended by closing the connection. headers are extra (name, value) pairs.
+        """
+        chunked = self.request_version == 'HTTP/1.1'
+        keep_alive = chunked and type(self).protocol_version == 'HTTP/1.1'
+        if chunked:
+            # Chunked encoding needs an HTTP/1.1 status line
+            self.protocol_version = 'HTTP/1.1'
         self.send_response(200)
-        self.send_header('Content-type', 'text/html')
+        self.send_header('Content-type', content_type)
+        for name, value in headers:
+            self.send_header(name, value)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        if not keep_alive:
+            self.send_header('Connection', 'close')
         self.end_headers()
-        self.wfile.write(content.encode('utf-8'))
+        if self.command == 'HEAD':
+            return
+
+        # Gather small pieces into chunks of about STREAM_CHUNK_SIZE bytes
+        pending = []
+        pending_size = 0
+        for piece in chunks:
+            data = piece.encode('utf-8') if isinstance(piece, str) else piece
+            pending.append(data)
+            pending_size += len(data)
+            if pending_size >= STREAM_CHUNK_SIZE:
+                self._write_chunk(b''.join(pending), chunked)
+                pending = []
+                pending_size = 0
+        if pending_size:
+            self._write_chunk(b''.join(pending), chunked)
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, data, chunked):
+        if chunked:
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        else:
+            self.wfile.write(data)
+
+    def _send_json(self, data, status=200):
+        self._send_page([json.dumps(data).encode('utf-8')], status, 'application/json')
+
+# Thread pool server: accepted connections are queued for a fixed set of
+# worker threads, so one slow client or bcrypt check no longer blocks everyone.
+# A connection with no request waiting goes back to a watcher thread, which
+# queues it again once a request arrives, so idle keep-alive connections
+# never hold a worker
+class ThreadPoolHTTPServer(http.server.HTTPServer):
+    """HTTP server that serves connections from a bounded worker pool"""
+
+    BUSY_RESPONSE = (b'HTTP/1.0 503 Service Unavailable\r\n'
+                     b'Content-Type: text/plain\r\n'
+                     b'Content-Length: 20\r\n'
+                     b'Retry-After: 1\r\n'
+                     b'Connection: close\r\n\r\n'
+                     b'Server is too busy.\n')
 
-def run(server_class=http.server.HTTPServer, handler_class=CustomerLoggingHandler, port=5000):
+    def __init__(self, server_address, handler_class, workers=8, queue_size=64):
+        self.workers = workers
+        self.queue_size = queue_size
+        # Let the kernel hold as many pending connections as the queue does
+        self.request_queue_size = max(queue_size, 5)
+        self._pending = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        # Requests served so far on each idle connection, for the keep-alive cap
+        self.requests_served = {}
+        # Idle connections -> (client address, when to close them), oldest first;
+        # only the watcher thread touches these, others send through _to_watch
+        self._idle = {}
+        self._selector = selectors.DefaultSelector()
+        self._to_watch = queue.SimpleQueue()
+        self._wakeup, self._wakeup_sender = socket.socketpair()
+        self._selector.register(self._wakeup, selectors.EVENT_READ)
+        super().__init__(server_address, handler_class)
+        for number in range(workers):
+            thread = threading.Thread(target=self._work, name=f'http-worker-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._watcher = threading.Thread(target=self._watch_idle, name='http-idle-watcher', daemon=True)
+        self._watcher.start()
+
+    def process_request(self, request, client_address):
+        """Queue the connection for a worker, or turn it away if the queue is full"""
+        try:
+            self._pending.put_nowait((request, client_address))
+        except queue.Full:
+            self.requests_served.pop(request, None)
+            try:
+                request.sendall(self.BUSY_RESPONSE)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+
+    def finish_request(self, request, client_address):
+        """Handle the connection; returns the requests served on it if it was left idle, else None"""
+        handler = self.RequestHandlerClass(request, client_address, self)
+        return handler.requests_handled if handler.idle else None
+
+    def _keep_idle(self, request, client_address, requests_served):
+        self.requests_served[request] = requests_served
+        self._to_watch.put((request, client_address))
+        self._wakeup_sender.send(b'\0')
+
+    def _watch_idle(self):
+        """Queue idle connections again when a request arrives; close those idle too long"""
+        while True:
+            timeout = None
+            if self._idle:
+                timeout = max(0, next(iter(self._idle.values()))[1] - time.monotonic())
+            for key, _ in self._selector.select(timeout):
+                if key.fileobj is not self._wakeup:
+                    request = key.fileobj
+                    self._selector.unregister(request)
+                    self.process_request(request, self._idle.pop(request)[0])
+                    continue
+                self._wakeup.recv(4096)
+                while not self._to_watch.empty():
+                    item = self._to_watch.get()
+                    if item is None:
+                        for request in list(self._idle):
+                            self._close_idle(request)
+                        return
+                    request, client_address = item
+                    idle_timeout = getattr(self.RequestHandlerClass, 'keep_alive_timeout', KEEP_ALIVE_TIMEOUT)
+                    self._idle[request] = (client_address, time.monotonic() + idle_timeout)
+                    self._selector.register(request, selectors.EVENT_READ)
+            now = time.monotonic()
+            while self._idle:
+                request, (_, deadline) = next(iter(self._idle.items()))
+                if deadline > now:
+                    break
+                self._close_idle(request)
+
+    def _close_idle(self, request):
+        del self._idle[request]
+        self._selector.unregister(request)
+        self.requests_served.pop(request, None)
+        self.shutdown_request(request)
+
+    def queue_depth(self):
+        """Number of accepted connections waiting for a worker"""
+        return self._pending.qsize()
+
+    def _work(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            request, client_address = item
+            requests_served = None
+            try:
+                requests_served = self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                if requests_served is not None:
+                    self._keep_idle(request, client_address, requests_served)
+                else:
+                    self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        for _ in self._threads:
+            self._pending.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._to_watch.put(None)
+        self._wakeup_sender.send(b'\0')
+        self._watcher.join(timeout=5)
+        self._selector.close()
+        self._wakeup.close()
+        self._wakeup_sender.close()
+
+# Serving modes selectable from the command line
+SERVER_MODES = {
+    'single': http.server.HTTPServer,
+    'pool': ThreadPoolHTTPServer,
+}
+
+def run(server_class=http.server.HTTPServer, handler_class=CustomerLoggingHandler, port=5000,
+        db_path=DEFAULT_CUSTOMER_DB, **server_options):
+    open_customer_store(db_path)
     server_address = ('', port)
-    httpd = server_class(server_address, handler_class)
+    httpd = server_class(server_address, handler_class, **server_options)
     print(f'Starting Customer Logging System demo server on port {port}...')
     httpd.serve_forever()
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Customer Logging System demo server')
+    parser.add_argument('--port', type=int, default=5000, help='port to listen on (default: 5000)')
+    parser.add_argument('--mode', choices=sorted(SERVER_MODES), default='pool',
+                        help='single: one request at a time; pool: bounded worker threads (default: pool)')
+    parser.add_argument('--workers', type=int, default=8, help='worker threads in pool mode (default: 8)')
+    parser.add_argument('--queue-size', type=int, default=64,
+                        help='connections allowed to wait for a worker before answering 503 (default: 64)')
+    parser.add_argument('--bcrypt-workers', type=int, default=os.cpu_count() or 1,
+                        help='processes for password hashing, 0 to hash on the request threads '
+                             '(default: one per core)')
+    parser.add_argument('--bcrypt-cost', type=int, choices=range(4, 32), metavar='COST',
+                        help='bcrypt work factor for new password hashes (default: calibrated at startup)')
+    parser.add_argument('--bcrypt-target-ms', type=float, default=BCRYPT_TARGET_SECONDS * 1000,
+                        help='password check time the calibration aims for '
+                             f'(default: {BCRYPT_TARGET_SECONDS * 1000:.0f}; never below cost {BCRYPT_MIN_COST})')
+    parser.add_argument('--keep-alive', action=argparse.BooleanOptionalAction, default=True,
+                        help='reuse connections for several requests with HTTP/1.1 (default: on)')
+    parser.add_argument('--keep-alive-timeout', type=float, default=KEEP_ALIVE_TIMEOUT,
+                        help=f'seconds an idle connection is kept open (default: {KEEP_ALIVE_TIMEOUT})')
+    parser.add_argument('--max-keep-alive-requests', type=int, default=MAX_KEEP_ALIVE_REQUESTS,
+                        help=f'requests served on one connection (default: {MAX_KEEP_ALIVE_REQUESTS})')
+    parser.add_argument('--db', default=DEFAULT_CUSTOMER_DB,
+                        help=f'SQLite customer database, created if missing (default: {DEFAULT_CUSTOMER_DB})')
+    parser.add_argument('--import', dest='import_path', metavar='FILE',
+                        help='import customers from a CSV or NDJSON file ("-" for stdin) into --db and exit; '
+                             'stop any server using --db first, or POST the file to its /api/customers/import')
+    parser.add_argument('--import-format', choices=sorted(IMPORT_FORMATS),
+                        help='format of the --import file (default: from its extension, else csv)')
+    return parser.parse_args(argv)
+
+def run_import(db_path, path, import_format=None):
+    """Command line import; returns the exit status"""
+    # Only this store is written to: a server running on db_path keeps its
+    # in-memory indexes (suggest, phone, dashboard, calendar) as they were
+    # until restarted, so it should be stopped first or sent the file through
+    # POST /api/customers/import instead
+    store = CustomerStore(db_path)
+    # A larger page cache keeps more of the growing indexes in memory
+    store.connection().execute(f"PRAGMA cache_size=-{IMPORT_CACHE_KIB}")
+    started = time.perf_counter()
+    try:
+        report = import_customer_file(store, path, import_format)
+    finally:
+        store.close()
+    elapsed = time.perf_counter() - started
+    rate = report["imported"] / elapsed if elapsed else 0
+    print(f'Imported {report["imported"]} customers in {elapsed:.2f}s ({rate:,.0f}/s), '
+          f'rejected {report["rejected"]}')
+    for error in report["errors"]:
+        print(f'  line {error["line"]}: {error["error"]}', file=sys.stderr)
+    if 'error' in report:
+        print(f'Import stopped: {report["error"]}', file=sys.stderr)
+        return 1
+    return 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.import_path:
+        sys.exit(run_import(args.db, args.import_path, args.import_format))
+    cost = configure_bcrypt_cost(args.bcrypt_cost, args.bcrypt_target_ms / 1000)
+    print(f'bcrypt cost {cost}' + (' (calibrated)' if args.bcrypt_cost is None else ''))
+    if args.bcrypt_workers > 0:
+        start_password_pool(args.bcrypt_workers)
+    CustomerLoggingHandler.protocol_version = 'HTTP/1.1' if args.keep_alive else 'HTTP/1.0'
+    CustomerLoggingHandler.keep_alive_timeout = args.keep_alive_timeout
+    CustomerLoggingHandler.max_keep_alive_requests = args.max_keep_alive_requests
+    server_options = {}
+    if args.mode == 'pool':
+        server_options = {'workers': args.workers, 'queue_size': args.queue_size}
+    run(SERVER_MODES[args.mode], port=args.port, db_path=args.db, **server_options)
+
 if __name__ == '__main__':
-    run()
\ No newline at end of file
+    main()
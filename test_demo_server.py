@@ -0,0 +1,300 @@
+"""
+Regression tests for the Customer Logging System demo server
+Run with: python -m pytest -q  (or python -m unittest)
+"""
+
+import http.client
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+import demo_server
+
+
+class QuietHandler(demo_server.CustomerLoggingHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class SharedStream:
+    """A stream several responses read in turn, which none of them closes"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def close(self):
+        pass
+
+
+class FailingHandler(QuietHandler):
+    """Raises while handling GET /fail, before sending any response"""
+
+    # Short, so a stalled request times out within the test
+    timeout = 0.5
+
+    def do_GET(self):
+        if self.path == '/fail':
+            self.route = '/fail'
+            raise RuntimeError('handler failed')
+        super().do_GET()
+
+
+class StoreTestCase(unittest.TestCase):
+    """Points the server at a customer database of its own for the tests of the class"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp(prefix='customer-test-')
+        demo_server.open_customer_store(os.path.join(cls.directory, 'customers.db'))
+
+    @classmethod
+    def tearDownClass(cls):
+        demo_server.CUSTOMERS.close()
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+
+class ServerTestCase(StoreTestCase):
+    """Runs a demo server on a free local port for the tests of the class"""
+
+    handler_class = QuietHandler
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.httpd = demo_server.ThreadPoolHTTPServer(('127.0.0.1', 0), cls.handler_class, workers=2)
+        threading.Thread(target=cls.httpd.serve_forever, daemon=True).start()
+        cls.port = cls.httpd.server_address[1]
+        user = demo_server.USERS.find_by_username('admin')
+        cls.cookie = f'{demo_server.SESSION_COOKIE}={demo_server.SESSIONS.create(user["id"])}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        super().tearDownClass()
+
+    def exchange(self, raw, responses, methods=()):
+        """Send raw bytes on one connection and read that many responses back.
+
+        methods gives the request method of each response where it is not GET
+        or POST, so HEAD responses are read without a body.
+        """
+        methods = list(methods) + [None] * responses
+        with socket.create_connection(('127.0.0.1', self.port), timeout=5) as sock:
+            sock.sendall(raw)
+            stream = SharedStream(sock.makefile('rb'))
+            statuses = []
+            for method in methods[:responses]:
+                # Responses share one buffered stream, as pipelined responses do
+                response = http.client.HTTPResponse(sock, method=method)
+                response.fp = stream
+                response.begin()
+                response.read()
+                statuses.append(response.status)
+            return statuses
+
+
+class RequestBodyTests(ServerTestCase):
+
+    def test_body_is_not_read_as_the_next_request(self):
+        smuggled = b'GET /info HTTP/1.1\r\nHost: localhost\r\n\r\n'
+        raw = (b'POST /login HTTP/1.1\r\nHost: localhost\r\nContent-Type: text/plain\r\n'
+               b'Content-Length: %d\r\n\r\n%s' % (len(smuggled), smuggled)
+               + b'GET /login HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        # The login form again, then the login page; a smuggled /info would be a 302
+        self.assertEqual(self.exchange(raw, 2), [200, 200])
+
+    def test_import_with_form_content_type_is_answered(self):
+        body = b'name,phone\n'
+        raw = (b'POST /api/customers/import?format=csv HTTP/1.1\r\nHost: localhost\r\n'
+               b'Cookie: %s\r\nContent-Type: application/x-www-form-urlencoded\r\n'
+               b'Content-Length: %d\r\n\r\n%s' % (self.cookie.encode(), len(body), body)
+               + b'GET /login HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        # curl -d sends this type; the import still reads the body as CSV
+        self.assertEqual(self.exchange(raw, 2), [200, 200])
+
+    def test_add_customer_with_invalid_choice_is_answered(self):
+        body = b'name=Ann&phone=555-0100&newused=foo'
+        raw = (b'POST /add-customer HTTP/1.1\r\nHost: localhost\r\nCookie: %s\r\n'
+               b'Content-Type: application/x-www-form-urlencoded\r\n'
+               b'Content-Length: %d\r\n\r\n%s' % (self.cookie.encode(), len(body), body))
+        # The form comes back with an alert instead of a CHECK constraint failure
+        self.assertEqual(self.exchange(raw, 1), [200])
+
+
+class KeepAliveTests(ServerTestCase):
+
+    def get(self, sock):
+        """Send GET /login on an open connection and return the response status"""
+        sock.sendall(b'GET /login HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        response = http.client.HTTPResponse(sock)
+        response.begin()
+        response.read()
+        return response.status
+
+    def test_idle_connections_do_not_hold_the_workers(self):
+        # More idle keep-alive connections than the server has workers
+        idle = [socket.create_connection(('127.0.0.1', self.port), timeout=5) for _ in range(3)]
+        try:
+            for sock in idle:
+                self.assertEqual(self.get(sock), 200)
+            started = time.monotonic()
+            with socket.create_connection(('127.0.0.1', self.port), timeout=5) as sock:
+                self.assertEqual(self.get(sock), 200)
+            self.assertLess(time.monotonic() - started, 1)
+            # The idle connections are still served when they send again
+            for sock in idle:
+                self.assertEqual(self.get(sock), 200)
+        finally:
+            for sock in idle:
+                sock.close()
+
+
+class SearchTests(ServerTestCase):
+
+    def test_a_nul_in_the_term_matches_nothing(self):
+        for path in ('/search?search_term=x%00yz', '/api/customers?q=x%00yz', '/search.csv?search_term=x%00yz'):
+            with self.subTest(path=path):
+                raw = b'GET %s HTTP/1.1\r\nHost: localhost\r\nCookie: %s\r\n\r\n' % (
+                    path.encode(), self.cookie.encode())
+                self.assertEqual(self.exchange(raw, 1), [200])
+        self.assertEqual(demo_server.search_customer_ids('x\0yz'), [])
+
+
+class HttpVersionTests(ServerTestCase):
+
+    def test_http_0_9_request_gets_the_page(self):
+        with socket.create_connection(('127.0.0.1', self.port), timeout=5) as sock:
+            sock.sendall(b'GET /login\r\n\r\n')
+            body = b''.join(iter(lambda: sock.recv(65536), b''))
+        # HTTP/0.9 responses are the bare body, without a status line or headers
+        self.assertTrue(body.startswith(b'<!DOCTYPE html>'), body[:40])
+
+
+class StaticAssetTests(ServerTestCase):
+
+    def setUp(self):
+        self.path = os.path.join(self.directory, 'asset.txt')
+        self.write(b'first version\n')
+        self.asset = demo_server.StaticAsset(self.path, '/static/asset.txt')
+        self.urls = {self.asset.url, self.asset.fingerprinted_url}
+        for url in self.urls:
+            demo_server.ASSETS[url] = self.asset
+
+    def tearDown(self):
+        for url in self.urls | {self.asset.fingerprinted_url}:
+            demo_server.ASSETS.pop(url, None)
+
+    def write(self, data):
+        with open(self.path, 'wb') as file:
+            file.write(data)
+
+    def get(self, url):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+        try:
+            conn.request('GET', url)
+            response = conn.getresponse()
+            return response, response.read()
+        finally:
+            conn.close()
+
+    def test_a_file_changed_on_disk_is_fingerprinted_again(self):
+        old_url = self.asset.fingerprinted_url
+        old_etag = self.get(old_url)[0].getheader('ETag')
+        self.write(b'second, longer version\n')
+        response, body = self.get(old_url)
+        self.assertEqual(body, b'second, longer version\n')
+        self.assertNotEqual(response.getheader('ETag'), old_etag)
+        # The old URL no longer names this content, so it may not be kept for good
+        self.assertEqual(response.getheader('Cache-Control'), 'no-cache')
+        self.assertNotEqual(self.asset.fingerprinted_url, old_url)
+        response, body = self.get(self.asset.fingerprinted_url)
+        self.assertEqual(body, b'second, longer version\n')
+        self.assertEqual(response.getheader('Cache-Control'), demo_server.IMMUTABLE_CACHE_CONTROL)
+
+
+class HeadTests(ServerTestCase):
+
+    def test_head_answers_like_get_without_a_body(self):
+        for path in ('/login', '/customers', '/customers.csv', '/api/customers', '/no-such-page'):
+            with self.subTest(path=path):
+                raw = (b'HEAD %s HTTP/1.1\r\nHost: localhost\r\nCookie: %s\r\n\r\n'
+                       % (path.encode(), self.cookie.encode())
+                       + b'GET /login HTTP/1.1\r\nHost: localhost\r\n\r\n')
+                # A body after the HEAD response would be read as the next status line
+                statuses = self.exchange(raw, 2, methods=['HEAD'])
+                self.assertEqual(statuses, [404 if path == '/no-such-page' else 200, 200])
+
+    def test_head_of_a_post_route_is_not_allowed(self):
+        raw = b'HEAD /register HTTP/1.1\r\nHost: localhost\r\n\r\n'
+        self.assertEqual(self.exchange(raw, 1, methods=['HEAD']), [405])
+
+    def test_put_and_delete_on_a_known_route_are_not_allowed(self):
+        body = b'GET /info HTTP/1.1\r\nHost: localhost\r\n\r\n'
+        for method in (b'PUT', b'DELETE'):
+            for path in (b'/customers', b'/api/customers'):
+                with self.subTest(method=method, path=path):
+                    raw = (b'%s %s HTTP/1.1\r\nHost: localhost\r\nCookie: %s\r\n'
+                           b'Content-Length: %d\r\n\r\n%s'
+                           % (method, path, self.cookie.encode(), len(body), body)
+                           + b'GET /login HTTP/1.1\r\nHost: localhost\r\n\r\n')
+                    # The body is skipped, not read as a request of its own
+                    self.assertEqual(self.exchange(raw, 2), [405, 200])
+
+
+class MetricsTests(ServerTestCase):
+
+    handler_class = FailingHandler
+
+    def test_a_handler_that_raised_is_counted_as_500(self):
+        with socket.create_connection(('127.0.0.1', self.port), timeout=5) as sock:
+            sock.sendall(b'GET /fail HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            # The server closes the connection once the handler has raised
+            self.assertEqual(sock.recv(1), b'')
+        self.assertEqual(demo_server.METRICS.requests['GET', '/fail', 500], 1)
+        self.assertNotIn(('GET', '/fail', None), demo_server.METRICS.requests)
+
+    def test_a_stalled_request_is_counted_as_aborted(self):
+        aborted = demo_server.METRICS.aborted
+        with socket.create_connection(('127.0.0.1', self.port), timeout=5) as sock:
+            sock.sendall(b'GET /login HTTP/1.1\r\nHost: localhost\r\n')
+            # The headers never end, so the server times out and closes
+            self.assertEqual(sock.recv(1), b'')
+        self.assertEqual(demo_server.METRICS.aborted, aborted + 1)
+        self.assertNotIn(('GET', 'unmatched', 500), demo_server.METRICS.requests)
+
+    def test_reading_in_flight_leaves_it_unchanged(self):
+        metrics = demo_server.RequestMetrics()
+        metrics.request_started()
+        metrics.request_started()
+        metrics.request_finished('GET', '/info', 200, 0.001, 100)
+        for _ in range(3):
+            self.assertIn('http_requests_in_flight 1\n', metrics.render())
+
+
+class CsvExportTests(StoreTestCase):
+
+    def export(self, name):
+        row = dict.fromkeys(demo_server.API_CUSTOMER_FIELDS, '')
+        row['name'] = name
+        lines = ''.join(demo_server.render_csv([row])).splitlines()
+        return lines[1].split(',')[2]
+
+    def test_formulas_get_an_apostrophe(self):
+        for name in ('=SUM(A1)', '@cmd', "-2+3+cmd|' /C calc'!A0", '+A1', '-(1)+cmd'):
+            self.assertEqual(self.export(name), "'" + name)
+
+    def test_numbers_and_phones_are_left_alone(self):
+        for name in ('-12.5', '+1 (555) 010-2000', '555-0100'):
+            self.assertEqual(self.export(name), name)
+
+
+if __name__ == '__main__':
+    unittest.main()